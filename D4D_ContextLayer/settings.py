@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -56,6 +58,10 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
     'referer',
     'organization',
+    'x-graphql-cache-bypass',
+    'x-graphql-trace',
+    'x-profile',
+    'x-profile-output',
 ]
 
 # Application definition
@@ -78,6 +84,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "layer.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -162,6 +169,146 @@ STRAWBERRY_DJANGO = {
     "TYPE_DESCRIPTION_FROM_MODEL_DOCSTRING": True,
 }
 
+# Cache backends. The "graphql" alias holds serialized GraphQL responses and can
+# be pointed at any Django backend (locmem, file based, database) via env vars.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "graphql": {
+        "BACKEND": os.environ.get(
+            "GRAPHQL_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("GRAPHQL_CACHE_LOCATION", "graphql-responses"),
+        "TIMEOUT": 600,
+    },
+}
+
+# GraphQL response cache. Only operations whose top-level fields all appear in
+# FIELD_TTLS are cached; the entry lives for the smallest TTL (seconds) among them.
+GRAPHQL_CACHE = {
+    "ENABLED": os.environ.get("GRAPHQL_CACHE_ENABLED", "1") == "1",
+    "ALIAS": "graphql",
+    # Seconds a data version read from the database is reused before re-checking.
+    "VERSION_TIMEOUT": 30,
+    "BYPASS_HEADER": "X-GraphQL-Cache-Bypass",
+    # Seconds the region rankings of a data version are kept (see layer/ranking.py).
+    "RANKING_TTL": 3600,
+    "FIELD_TTLS": {
+        "indicators": 3600,
+        "indicatorsByCategory": 3600,
+        "getDataTimePeriods": 3600,
+        "getDistrictRevCircle": 3600,
+        "getStates": 3600,
+        "districtMapData": 900,
+        "revCircleMapData": 900,
+        "districtViewData": 600,
+        "revCircleViewData": 600,
+        "tableData": 600,
+        "getTimeTrends": 600,
+    },
+}
+
+# Identical GraphQL queries executing at the same time in one process share a
+# single execution. Waiting requests give up after TIMEOUT seconds and run on
+# their own.
+GRAPHQL_SINGLE_FLIGHT = {
+    "ENABLED": os.environ.get("GRAPHQL_SINGLE_FLIGHT_ENABLED", "1") == "1",
+    "TIMEOUT": 30,
+}
+
+# Automatic persisted queries: clients register a query under its sha256 hash
+# once and then send just the hash, e.g. via cacheable GET requests.
+GRAPHQL_PERSISTED_QUERIES = {
+    "ENABLED": True,
+    # Seconds a registered query is kept; None keeps it until evicted.
+    "TIMEOUT": None,
+}
+
+# Serve /graphql with async resolvers (layer.async_schema). Only useful when
+# running under an ASGI server, e.g. uvicorn.
+GRAPHQL_ASYNC = os.environ.get("GRAPHQL_ASYNC", "0") == "1"
+
+# Per-resolver timings and query counts. Requests sending HEADER get them in
+# the response's `extensions.tracing` (and skip the response cache); all other
+# requests log them to the "layer.tracing" logger.
+GRAPHQL_TRACING = {
+    "HEADER": "X-GraphQL-Trace",
+}
+
+# Prometheus metrics served at /metrics. import_data runs in its own process,
+# so it saves its metrics to IMPORT_TEXTFILE and /metrics appends that file.
+METRICS = {
+    "ENABLED": os.environ.get("METRICS_ENABLED", "1") == "1",
+    "IMPORT_TEXTFILE": os.environ.get(
+        "METRICS_IMPORT_TEXTFILE",
+        os.path.join(tempfile.gettempdir(), "d4d_import_metrics.prom"),
+    ),
+}
+
+# On-demand request profiling (see layer.middleware.ProfilingMiddleware).
+# Send the HEADER or QUERY_PARAM with TOKEN as its value, or any value as a
+# logged-in superuser. Profiles are saved to DIR.
+PROFILING = {
+    "HEADER": "X-Profile",
+    "QUERY_PARAM": "profile",
+    "TOKEN": os.environ.get("PROFILING_TOKEN", ""),
+    "DIR": os.environ.get(
+        "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "d4d_profiles")
+    ),
+    # Send "summary" in OUTPUT_HEADER to get the summary as the response.
+    "OUTPUT_HEADER": "X-Profile-Output",
+    "ID_HEADER": "X-Profile-Id",
+    # Number of SQL statements and functions in the summary.
+    "TOP_N": 20,
+}
+
+# Where the data resolvers read values from: "orm" queries the database,
+# "cube" slices the memory-mapped array built by import_data/build_cube
+# (see layer.cube), falling back to the database until one exists, and
+# "region" reads the per-region rows of layer.region_data for tableData,
+# districtViewData and revCircleViewData, and "sql" has Postgres build the
+# JSON of the map and region table responses (see layer.sql).
+DATA_ENGINE = os.environ.get("DATA_ENGINE", "orm")
+
+CUBE = {
+    "DIR": os.environ.get("CUBE_DIR", os.path.join(BASE_DIR, "cube")),
+    # Seconds between checks for a newer cube.
+    "CHECK_INTERVAL": 5,
+    # Cube versions kept on disk.
+    "KEEP": 2,
+}
+
+# Vector tiles served at /tiles/<layer>/<z>/<x>/<y>.mvt (see layer.tiles).
+TILES = {
+    "DIR": os.environ.get("TILES_DIR", os.path.join(BASE_DIR, "tiles")),
+    "MAX_ZOOM": 16,
+    # Tile coordinate space and the buffer around it, in tile units.
+    "EXTENT": 4096,
+    "BUFFER": 64,
+    # Seconds clients may cache a tile.
+    "MAX_AGE": 3600,
+}
+
+# geographiesAt point lookups.
+GEO_LOOKUP = {
+    "MAX_POINTS": 5000,
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "layer": {
+            "handlers": ["console"],
+            "level": os.environ.get("LAYER_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 # Default period for table data
 DEFAULT_TIME_PERIOD = "2024_08"
 
@@ -17,12 +17,22 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, re_path
 
+from D4D_ContextLayer.settings import GRAPHQL_ASYNC
 from layer import views
+from layer.graphql_view import AsyncCachedGraphQLView, CachedGraphQLView
 from layer.schema import schema
-from strawberry.django.views import GraphQLView
+
+if GRAPHQL_ASYNC:
+    from layer.async_schema import async_schema
+
+    graphql_view = AsyncCachedGraphQLView.as_view(schema=async_schema)
+else:
+    graphql_view = CachedGraphQLView.as_view(schema=schema)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("graphql", GraphQLView.as_view(schema=schema)),
-    path("report", views.generate_report)
+    path("graphql", graphql_view),
+    path("report", views.generate_report),
+    path("metrics", views.metrics),
+    path("tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt", views.tile),
 ]
@@ -1,13 +1,31 @@
 from django.contrib import admin
+from django.db import transaction
 
+from .cache import bump_data_version
 from .models import *
 
-class CustomUnitAdmin(admin.ModelAdmin):
+
+class BumpDataVersionMixin:
+    """Move the API to a new data version after changes made in the admin."""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(bump_data_version)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(bump_data_version)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(bump_data_version)
+
+class CustomUnitAdmin(BumpDataVersionMixin, admin.ModelAdmin):
     list_display = ["name", "symbol"]
     class Meta:
         model = Unit
 
-class CustomGeoAdmin(admin.ModelAdmin):
+class CustomGeoAdmin(BumpDataVersionMixin, admin.ModelAdmin):
     list_display = ["name", "code", "type", "parentId"]
     class Meta:
         model = Geography
@@ -27,16 +45,21 @@ class CustomSchemeAdmin(admin.ModelAdmin):
     class Meta:
         model = Scheme
 
-class CustomIndicatorAdmin(admin.ModelAdmin):
-    list_display = ["name", "type", "display_order", "category"]
+class CustomIndicatorAdmin(BumpDataVersionMixin, admin.ModelAdmin):
+    list_display = ["name", "type", "display_order", "category", "aggregation"]
     class Meta:
         model = Indicators
 
-class CustomDataAdmin(admin.ModelAdmin):
+class CustomDataAdmin(BumpDataVersionMixin, admin.ModelAdmin):
     list_display = ["value", "indicator", "geography"]
     class Meta:
         model = Data
 
+class CustomImportRunAdmin(admin.ModelAdmin):
+    list_display = ["started", "finished", "status"]
+    class Meta:
+        model = ImportRun
+
 
 admin.site.register(Unit, CustomUnitAdmin)
 admin.site.register(Geography, CustomGeoAdmin)
@@ -44,4 +67,5 @@ admin.site.register(Geography, CustomGeoAdmin)
 admin.site.register(Department, CustomDepartmentAdmin)
 admin.site.register(Scheme, CustomSchemeAdmin)
 admin.site.register(Indicators, CustomIndicatorAdmin)
-admin.site.register(Data, CustomDataAdmin)
\ No newline at end of file
+admin.site.register(Data, CustomDataAdmin)
+admin.site.register(ImportRun, CustomImportRunAdmin)
\ No newline at end of file
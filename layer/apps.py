@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class LayerConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "layer"
+
+    def ready(self):
+        from layer.metrics import count_connection
+        from layer.tracing import install_query_recorder
+
+        connection_created.connect(install_query_recorder)
+        connection_created.connect(count_connection)
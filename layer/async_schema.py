@@ -0,0 +1,247 @@
+import typing
+from typing import Optional
+
+import strawberry
+from asgiref.sync import sync_to_async
+from django.contrib.gis.db.models.aggregates import Union
+from strawberry.scalars import JSON
+
+from D4D_ContextLayer.settings import DATA_ENGINE
+from . import types
+from layer import ranking, region_data, sql
+from layer import schema as sync_schema
+from layer.cache import cache_stats
+from layer.cube import get_cube
+from layer.geolookup import lookup_points
+
+"""
+
+Async counterparts of the resolvers in schema.py, for serving the API from
+an ASGI server. They build the same querysets and shape the rows with the
+same `build_*` functions, but fetch through Django's async ORM so the event
+loop is free to serve other requests while queries are running.
+
+"""
+
+
+async def fetch(queryset) -> list:
+    return [row async for row in queryset]
+
+
+async def get_district_data(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: types.GeoFilter,
+        rank_filter: Optional[types.RankFilter] = None,
+) -> list[dict]:
+    ranks = None
+    if rank_filter:
+        ranks = await sync_to_async(ranking.rank_regions)(
+            sync_schema.district_view_geographies(geo_filter), indc_filter, data_filter, rank_filter
+        )
+    elif DATA_ENGINE == "sql":
+        return await sync_to_async(sql.district_data_json)(
+            sync_schema.district_data_queryset(indc_filter, data_filter, geo_filter),
+            indc_filter,
+        )
+    cube = get_cube()
+    if cube:
+        rows = cube.district_data_rows(indc_filter, data_filter, geo_filter)
+    elif DATA_ENGINE == "region":
+        rows = region_data.expand_region_rows(
+            await fetch(
+                sync_schema.only_ranked(region_data.district_region_queryset(data_filter, geo_filter), ranks)
+            ),
+            region_data.slug_or_child(indc_filter.slug),
+        )
+    else:
+        rows = await fetch(
+            sync_schema.only_ranked(
+                sync_schema.district_data_queryset(indc_filter, data_filter, geo_filter), ranks
+            )
+        )
+    return sync_schema.build_district_data(rows, indc_filter, ranks)
+
+
+async def get_table_data(
+        indc_filter: Optional[types.IndicatorFilter] = None,
+        data_filter: Optional[types.DataFilter] = None,
+        geo_filter: Optional[types.GeoFilter] = None,
+) -> list[dict]:
+    if DATA_ENGINE == "sql":
+        return await sync_to_async(sql.table_data_json)(
+            sync_schema.table_data_queryset(indc_filter, data_filter, geo_filter),
+            indc_filter,
+        )
+    cube = get_cube()
+    if cube:
+        rows = cube.table_data_rows(indc_filter, data_filter, geo_filter)
+    elif DATA_ENGINE == "region":
+        rows = region_data.expand_region_rows(
+            await fetch(region_data.table_region_queryset(data_filter, geo_filter)),
+            sync_schema.table_region_filter(indc_filter),
+        )
+    else:
+        rows = await fetch(
+            sync_schema.table_data_queryset(indc_filter, data_filter, geo_filter)
+        )
+    return sync_schema.build_table_data(rows, indc_filter)
+
+
+async def get_time_trends(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: types.GeoFilter,
+) -> dict:
+    cube = get_cube()
+    if cube:
+        time_list = list(sync_schema.time_trends_periods(data_filter, cube.periods))
+        rows = cube.time_trends_rows(indc_filter, geo_filter, time_list)
+    else:
+        time_list = sync_schema.time_trends_periods(data_filter)
+        if not isinstance(time_list, list):
+            time_list = await fetch(time_list)
+        rows = await fetch(
+            sync_schema.time_trends_queryset(indc_filter, geo_filter, time_list)
+        )
+    return sync_schema.build_time_trends(rows, indc_filter, time_list)
+
+
+async def get_revenue_data(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+        rank_filter: Optional[types.RankFilter] = None,
+) -> list[dict]:
+    ranks = None
+    if rank_filter:
+        ranks = await sync_to_async(ranking.rank_regions)(
+            sync_schema.revenue_view_geographies(geo_filter), indc_filter, data_filter, rank_filter
+        )
+    elif DATA_ENGINE == "sql":
+        return await sync_to_async(sql.revenue_data_json)(
+            sync_schema.revenue_data_queryset(indc_filter, data_filter, geo_filter),
+            indc_filter,
+        )
+    cube = get_cube()
+    if cube:
+        rows = cube.revenue_data_rows(indc_filter, data_filter, geo_filter)
+    elif DATA_ENGINE == "region":
+        rows = region_data.expand_region_rows(
+            await fetch(
+                sync_schema.only_ranked(region_data.revenue_region_queryset(data_filter, geo_filter), ranks)
+            ),
+            region_data.slug_or_child(indc_filter.slug),
+        )
+    else:
+        rows = await fetch(
+            sync_schema.only_ranked(
+                sync_schema.revenue_data_queryset(indc_filter, data_filter, geo_filter), ranks
+            )
+        )
+    return sync_schema.build_revenue_data(rows, indc_filter, ranks)
+
+
+async def get_revenue_map_data(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+) -> dict:
+    geo_rows, rc_data = sync_schema.revenue_map_querysets(
+        indc_filter, data_filter, geo_filter
+    )
+    if DATA_ENGINE == "sql":
+        return await sync_to_async(sql.revenue_map_json)(geo_rows, rc_data)
+    cube = get_cube()
+    if cube:
+        rc_data = cube.revenue_map_rows(indc_filter, data_filter, geo_filter)
+    else:
+        rc_data = await fetch(rc_data)
+    return sync_schema.build_revenue_map_data(await fetch(geo_rows), rc_data)
+
+
+async def get_district_map_data(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+) -> dict:
+    geo_rows, district_data = sync_schema.district_map_querysets(
+        indc_filter, data_filter, geo_filter
+    )
+    if DATA_ENGINE == "sql":
+        return await sync_to_async(sql.district_map_json)(geo_rows, district_data)
+    cube = get_cube()
+    if cube:
+        district_data = cube.district_map_rows(indc_filter, data_filter, geo_filter)
+    else:
+        district_data = await fetch(district_data)
+    return sync_schema.build_district_map_data(await fetch(geo_rows), district_data)
+
+
+async def get_indicators(indc_filter: Optional[types.IndicatorFilter] = None, state_code: Optional[int] = None) -> list:
+    return await fetch(sync_schema.indicators_queryset(indc_filter, state_code))
+
+
+async def get_timeperiod() -> list[types.CustomDataPeriodList]:
+    return [
+        types.CustomDataPeriodList(value=time)
+        for time in await fetch(sync_schema.timeperiod_queryset())
+    ]
+
+
+async def get_district_rev_circle(geo_filter: types.GeoFilter):
+    geo_rows = await fetch(sync_schema.district_rev_circle_queryset(geo_filter))
+    return sync_schema.build_district_rev_circle(geo_rows, geo_filter)
+
+
+async def get_child_indicators(parent_id: Optional[int] = None, state_code: Optional[str] = None) -> typing.List:
+    indicator_rows = await fetch(sync_schema.child_indicators_queryset())
+    return sync_schema.build_child_indicators(indicator_rows, parent_id, state_code)
+
+
+async def get_states():
+    states = []
+    async for state in sync_schema.states_queryset():
+        child = await sync_schema.state_child_type_queryset(state).afirst()
+        state_geometry = (
+            await sync_schema.state_geometry_queryset(state).aaggregate(
+                union_geometry=Union("valid_geom")
+            )
+        )["union_geometry"]
+        states.append(
+            sync_schema.build_state_details(state, child.type, state_geometry)
+        )
+    return states
+
+
+async def get_geographies_at(
+        points: list[types.PointInput],
+        data_filter: Optional[types.DataFilter] = None,
+        indc_filter: Optional[types.IndicatorFilter] = None,
+) -> dict:
+    return await sync_to_async(lookup_points)(points, data_filter, indc_filter)
+
+
+@strawberry.type
+class AsyncQuery:  # camelCase, same fields as schema.Query
+    indicators: JSON = strawberry.field(resolver=get_indicators)
+    districtViewData: JSON = strawberry.field(resolver=get_district_data)
+    tableData: JSON = strawberry.field(resolver=get_table_data)
+    indicatorsByCategory: JSON = strawberry.field(resolver=get_child_indicators)
+    districtMapData: JSON = strawberry.field(resolver=get_district_map_data)
+    getTimeTrends: JSON = strawberry.field(resolver=get_time_trends)
+    revCircleViewData: JSON = strawberry.field(resolver=get_revenue_data)
+    revCircleMapData: JSON = strawberry.field(resolver=get_revenue_map_data)
+    getDataTimePeriods: list[types.CustomDataPeriodList] = strawberry.field(
+        resolver=get_timeperiod
+    )
+    getDistrictRevCircle: JSON = strawberry.field(resolver=get_district_rev_circle)
+    getStates: JSON = strawberry.field(resolver=get_states)
+    cacheStats: JSON = strawberry.field(resolver=cache_stats)
+    geographiesAt: JSON = strawberry.field(resolver=get_geographies_at)
+
+
+async_schema = strawberry.Schema(
+    query=AsyncQuery,
+    extensions=sync_schema.schema_extensions,
+)
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from django.core.cache import caches
+from django.db.models import F, Max
+from graphql import FieldNode, OperationDefinitionNode, OperationType, parse, print_ast
+from graphql.error import GraphQLSyntaxError
+
+from D4D_ContextLayer.settings import GRAPHQL_CACHE
+from layer.cube import get_cube_version
+from layer.models import Data, DataVersion
+
+DATA_VERSION_KEY = "data-version"
+RESPONSE_KEY_PREFIX = "graphql-response"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypasses": 0, "stores": 0}
+
+
+@dataclass(frozen=True)
+class Operation:
+    """A parsed query operation: its hash and the top-level fields it selects."""
+
+    key: str
+    field_names: tuple
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """Where a cacheable GraphQL operation is stored and for how long."""
+
+    key: str
+    ttl: int
+
+
+def get_cache():
+    return caches[GRAPHQL_CACHE["ALIAS"]]
+
+
+def get_data_version() -> str:
+    """Return a token that changes whenever the served data changes.
+
+    The token combines the `DataVersion` counter, which `bump_data_version`
+    increments after imports, management commands and admin changes, with
+    the newest `Data` row, which also catches rows written any other way.
+    It is kept in the cache for `VERSION_TIMEOUT` seconds so that requests
+    don't hit the database for it: with a per-process cache, other workers
+    see a bump within that time. With the cube engine the version of the
+    cube this process serves is added, so responses built from a cube that
+    hasn't been swapped yet aren't stored under the new data.
+    """
+    cache = get_cache()
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        counter = DataVersion.objects.filter(pk=1).values_list("number", flat=True).first()
+        latest = Data.objects.aggregate(last_id=Max("id"), modified=Max("modified"))
+        modified = latest["modified"].timestamp() if latest["modified"] else 0
+        version = f"{counter or 0}-{latest['last_id'] or 0}-{int(modified * 1_000_000)}"
+        cache.set(DATA_VERSION_KEY, version, GRAPHQL_CACHE["VERSION_TIMEOUT"])
+    cube_version = get_cube_version()
+    if cube_version:
+        version = f"{version}-{cube_version}"
+    return version
+
+
+def bump_data_version():
+    """Move to a new data version so cached responses stop being served.
+
+    Call it after changing data or indicators, once the change is committed.
+    """
+    if not DataVersion.objects.filter(pk=1).update(number=F("number") + 1):
+        DataVersion.objects.get_or_create(pk=1, defaults={"number": 1})
+    get_cache().delete(DATA_VERSION_KEY)
+
+
+@lru_cache(maxsize=512)
+def parse_operation(query: str, operation_name: Optional[str] = None):
+    """Normalize a query document and list the top-level fields it selects.
+
+    Returns:
+        tuple | None: `(normalized_query, field_names)` for a single query
+        operation, or None when the document can't be cached (syntax errors,
+        mutations, ambiguous operations, top-level fragments).
+    """
+    try:
+        document = parse(query)
+    except GraphQLSyntaxError:
+        return None
+
+    operations = [
+        definition
+        for definition in document.definitions
+        if isinstance(definition, OperationDefinitionNode)
+    ]
+    if operation_name:
+        operations = [
+            op for op in operations if op.name and op.name.value == operation_name
+        ]
+    if len(operations) != 1 or operations[0].operation != OperationType.QUERY:
+        return None
+
+    field_names = []
+    for selection in operations[0].selection_set.selections:
+        if not isinstance(selection, FieldNode):
+            return None
+        field_names.append(selection.name.value)
+
+    return print_ast(document), tuple(field_names)
+
+
+def get_field_ttl(field_names) -> Optional[int]:
+    """Return the TTL shared by all fields, or None if any field isn't opted in."""
+    ttls = GRAPHQL_CACHE["FIELD_TTLS"]
+    selected = [name for name in field_names if name != "__typename"]
+    if not selected or any(name not in ttls for name in selected):
+        return None
+    return min(ttls[name] for name in selected)
+
+
+def get_request_payload(request) -> Optional[dict]:
+    """Read query, variables and operation name from a GraphQL HTTP request."""
+    if request.method == "GET":
+        payload = request.GET.dict()
+        for name in ("variables", "extensions"):
+            if payload.get(name):
+                try:
+                    payload[name] = json.loads(payload[name])
+                except ValueError:
+                    return None
+        return payload
+    if request.method == "POST" and "application/json" in (request.content_type or ""):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return None
+        return payload if isinstance(payload, dict) else None
+    return None
+
+
+def operation_key(normalized_query, variables, operation_name) -> str:
+    """Hash an operation and its variables into a stable key."""
+    raw = json.dumps(
+        [normalized_query, variables or {}, operation_name],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get_operation(payload: dict) -> Optional[Operation]:
+    """Identify the query operation in a decoded GraphQL request.
+
+    Returns None for anything that isn't a single, parseable query operation.
+    """
+    if not isinstance(payload.get("query"), str):
+        return None
+
+    operation_name = payload.get("operationName")
+    parsed = parse_operation(payload["query"], operation_name)
+    if parsed is None:
+        return None
+    normalized_query, field_names = parsed
+    return Operation(
+        key=operation_key(normalized_query, payload.get("variables"), operation_name),
+        field_names=field_names,
+    )
+
+
+def get_etag(operation: Operation) -> str:
+    """Return an HTTP entity tag for the operation at the current data version."""
+    return f'"{get_data_version()}-{operation.key[:32]}"'
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Whether an If-None-Match header lists `etag` (weak or strong) or is `*`."""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in tags)
+
+
+def get_cache_entry(operation: Operation) -> Optional[CacheEntry]:
+    """Build the cache entry for an operation, or None if it must not be cached."""
+    if not GRAPHQL_CACHE["ENABLED"]:
+        return None
+    ttl = get_field_ttl(operation.field_names)
+    if ttl is None:
+        return None
+    return CacheEntry(
+        key=f"{RESPONSE_KEY_PREFIX}:{get_data_version()}:{operation.key}", ttl=ttl
+    )
+
+
+def record(outcome: str):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def cache_stats() -> dict:
+    """Return hit/miss counters of the GraphQL response cache for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    return stats
@@ -0,0 +1,322 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from D4D_ContextLayer.settings import CUBE, DATA_ENGINE, DEFAULT_TIME_PERIOD
+from layer.models import Data, Geography, Indicators
+
+"""
+
+In-memory data cube: every `Data` value in a geography x indicator x period
+array, memory-mapped from files written by `write_cube` so all workers on a
+host share one copy through the page cache. Each cell takes 9 bytes (a
+float64 value and a bool "present" flag), so e.g. 650 geographies x 200
+indicators x 45 periods is about 50 MB, most of it NaN for the geographies
+and periods an indicator isn't reported for.
+
+The read functions return rows with the attributes of `Data` objects that
+the resolvers use (`geography`, `indicator`, `value`, ...), in the order of
+the corresponding ORM querysets, so they feed the same `build_*` functions
+in schema.py.
+
+Each build is written to its own directory and the CURRENT file is then
+replaced atomically to point at it. Workers notice the change within
+CUBE["CHECK_INTERVAL"] seconds and swap in the new cube.
+
+"""
+
+CURRENT_FILE = "CURRENT"
+
+
+class CubeGeography:
+    __slots__ = ("id", "name", "code", "type", "slug", "parentId", "parentId_id")
+
+
+class CubeIndicator:
+    __slots__ = ("id", "name", "slug", "unit", "parent_id", "is_visible", "display_order")
+
+
+class CubeUnit:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class CubeRow:
+    """A cell of the cube, read like a `Data` object."""
+
+    __slots__ = ("value", "geography", "indicator", "data_period")
+
+    def __init__(self, value, geography, indicator, data_period):
+        self.value = value
+        self.geography = geography
+        self.indicator = indicator
+        self.data_period = data_period
+
+    @property
+    def geography_id(self):
+        return self.geography.id
+
+
+def write_cube(directory=None) -> str:
+    """Build the cube from the database and make it the current one.
+
+    Args:
+        directory (str, optional): Where cubes are stored. Defaults to
+        CUBE["DIR"].
+
+    Returns:
+        str: The version (directory name) of the new cube.
+    """
+    directory = directory or CUBE["DIR"]
+    os.makedirs(directory, exist_ok=True)
+
+    geographies = list(
+        Geography.objects.order_by("id").values("id", "name", "code", "type", "slug", "parentId_id")
+    )
+    indicators = list(
+        Indicators.objects.order_by("display_order", "id").values(
+            "id", "name", "slug", "unit__name", "parent_id", "is_visible", "display_order"
+        )
+    )
+    rows = list(
+        Data.objects.exclude(data_period=None).values_list(
+            "geography_id", "indicator_id", "data_period", "value"
+        )
+    )
+
+    geography_index = {geo["id"]: i for i, geo in enumerate(geographies)}
+    indicator_index = {indicator["id"]: i for i, indicator in enumerate(indicators)}
+    periods = sorted({row[2] for row in rows})
+    period_index = {period: i for i, period in enumerate(periods)}
+
+    shape = (len(geographies), len(indicators), len(periods))
+    values = np.full(shape, np.nan)
+    present = np.zeros(shape, dtype=bool)
+    if rows:
+        g = np.fromiter((geography_index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        i = np.fromiter((indicator_index[row[1]] for row in rows), dtype=np.int64, count=len(rows))
+        p = np.fromiter((period_index[row[2]] for row in rows), dtype=np.int64, count=len(rows))
+        values[g, i, p] = np.array([row[3] for row in rows], dtype=float)
+        present[g, i, p] = True
+
+    version = f"cube-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+    np.save(os.path.join(path, "values.npy"), values)
+    np.save(os.path.join(path, "present.npy"), present)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(
+            {"geographies": geographies, "indicators": indicators, "periods": periods}, f
+        )
+
+    current_tmp = os.path.join(directory, f"{CURRENT_FILE}.{uuid.uuid4().hex}")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+
+    remove_old_cubes(directory, keep=[version])
+    return version
+
+
+def remove_old_cubes(directory, keep):
+    """Delete all but the newest CUBE["KEEP"] cubes.
+
+    Workers that still have an older cube mapped keep reading it; the files
+    are only freed once they swap.
+    """
+    versions = sorted(
+        name for name in os.listdir(directory) if name.startswith("cube-")
+    )
+    for version in versions[: -CUBE["KEEP"]]:
+        if version not in keep:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+class Cube:
+    def __init__(self, path):
+        self.values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        self.present = np.load(os.path.join(path, "present.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+
+        self.periods = meta["periods"]
+        self.period_index = {period: i for i, period in enumerate(self.periods)}
+
+        self.geographies = []
+        for row in meta["geographies"]:
+            geography = CubeGeography()
+            for field in ("id", "name", "code", "type", "slug", "parentId_id"):
+                setattr(geography, field, row[field])
+            self.geographies.append(geography)
+        by_id = {geography.id: geography for geography in self.geographies}
+        for geography in self.geographies:
+            geography.parentId = by_id.get(geography.parentId_id)
+
+        self.indicators = []
+        units = {}
+        for row in meta["indicators"]:
+            indicator = CubeIndicator()
+            for field in ("id", "name", "slug", "parent_id", "is_visible", "display_order"):
+                setattr(indicator, field, row[field])
+            unit_name = row["unit__name"]
+            indicator.unit = units.setdefault(unit_name, CubeUnit(unit_name)) if unit_name else None
+            self.indicators.append(indicator)
+        indicators_by_id = {indicator.id: indicator for indicator in self.indicators}
+
+        # Attribute arrays along the axes, for building masks.
+        self.geo_code = np.array([g.code for g in self.geographies], dtype=object)
+        self.geo_type = np.array([g.type for g in self.geographies], dtype=object)
+        self.geo_parent_code = np.array(
+            [g.parentId.code if g.parentId else None for g in self.geographies], dtype=object
+        )
+        self.geo_grandparent_code = np.array(
+            [
+                g.parentId.parentId.code if g.parentId and g.parentId.parentId else None
+                for g in self.geographies
+            ],
+            dtype=object,
+        )
+        parents = [indicators_by_id.get(i.parent_id) for i in self.indicators]
+        self.ind_slug = np.array([i.slug for i in self.indicators], dtype=object)
+        self.ind_parent_slug = np.array([p.slug if p else None for p in parents], dtype=object)
+        self.ind_visible = np.array([i.is_visible for i in self.indicators], dtype=bool)
+        self.ind_is_top_two_levels = np.array(
+            [p is None or p.parent_id is None for p in parents], dtype=bool
+        )
+
+    def period_mask(self, periods):
+        mask = np.zeros(len(self.periods), dtype=bool)
+        for period in periods:
+            if period in self.period_index:
+                mask[self.period_index[period]] = True
+        return mask
+
+    def rows(self, geo_mask, ind_mask, period_mask):
+        """Present cells of the selection, ordered by geography, indicator, period."""
+        g_idx = np.flatnonzero(geo_mask)
+        i_idx = np.flatnonzero(ind_mask)
+        p_idx = np.flatnonzero(period_mask)
+        if not (len(g_idx) and len(i_idx) and len(p_idx)):
+            return []
+        selection = np.ix_(g_idx, i_idx, p_idx)
+        present = self.present[selection]
+        values = self.values[selection]
+        rows = []
+        for g, i, p in zip(*np.nonzero(present)):
+            value = values[g, i, p]
+            rows.append(
+                CubeRow(
+                    None if np.isnan(value) else float(value),
+                    self.geographies[g_idx[g]],
+                    self.indicators[i_idx[i]],
+                    self.periods[p_idx[p]],
+                )
+            )
+        return rows
+
+    def slug_or_parent_mask(self, slug):
+        return (self.ind_slug == slug) | (self.ind_parent_slug == slug)
+
+    def region_mask(self, codes):
+        """Geographies matched by a GeoFilter code list, as in the ORM resolvers."""
+        if len(codes) <= 1:
+            return (
+                np.isin(self.geo_parent_code, codes) | np.isin(self.geo_code, codes)
+            ) & (self.geo_type != "STATE")
+        return np.isin(self.geo_code, codes)
+
+    def district_data_rows(self, indc_filter, data_filter, geo_filter):
+        return self.rows(
+            self.region_mask(geo_filter.code),
+            self.slug_or_parent_mask(indc_filter.slug) & self.ind_visible,
+            self.period_mask([data_filter.data_period]),
+        )
+
+    def table_data_rows(self, indc_filter=None, data_filter=None, geo_filter=None):
+        period = data_filter.data_period if data_filter else DEFAULT_TIME_PERIOD
+        if indc_filter:
+            ind_mask = self.slug_or_parent_mask(indc_filter.slug)
+        else:
+            ind_mask = self.ind_is_top_two_levels
+        if geo_filter:
+            geo_mask = self.region_mask(geo_filter.code)
+        else:
+            geo_mask = self.geo_type == "DISTRICT"
+        return self.rows(geo_mask, ind_mask & self.ind_visible, self.period_mask([period]))
+
+    def time_trends_rows(self, indc_filter, geo_filter, time_list):
+        codes = geo_filter.code
+        geo_mask = (
+            np.isin(self.geo_parent_code, codes)
+            | np.isin(self.geo_grandparent_code, codes)
+            | np.isin(self.geo_code, codes)
+        )
+        return self.rows(geo_mask, self.ind_slug == indc_filter.slug, self.period_mask(time_list))
+
+    def revenue_data_rows(self, indc_filter, data_filter, geo_filter):
+        return self.rows(
+            np.isin(self.geo_code, geo_filter.code),
+            self.slug_or_parent_mask(indc_filter.slug) & self.ind_visible,
+            self.period_mask([data_filter.data_period]),
+        )
+
+    def district_map_rows(self, indc_filter, data_filter, geo_filter):
+        return self.rows(
+            (self.geo_type == "DISTRICT") & np.isin(self.geo_parent_code, geo_filter.code),
+            self.ind_slug == indc_filter.slug,
+            self.period_mask([data_filter.data_period]),
+        )
+
+    def revenue_map_rows(self, indc_filter, data_filter, geo_filter):
+        return self.rows(
+            np.isin(self.geo_grandparent_code, geo_filter.code),
+            self.ind_slug == indc_filter.slug,
+            self.period_mask([data_filter.data_period]),
+        )
+
+
+_lock = threading.Lock()
+_current = {"cube": None, "version": None, "checked": 0.0}
+
+
+def read_current_version(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def get_cube():
+    """Return the current cube, or None when the cube engine isn't in use.
+
+    Checks for a newer cube at most every CUBE["CHECK_INTERVAL"] seconds and
+    swaps it in. Resolvers fall back to the database while no cube exists.
+    """
+    if DATA_ENGINE != "cube":
+        return None
+    now = time.monotonic()
+    if now - _current["checked"] < CUBE["CHECK_INTERVAL"]:
+        return _current["cube"]
+
+    with _lock:
+        if now - _current["checked"] < CUBE["CHECK_INTERVAL"]:
+            return _current["cube"]
+        version = read_current_version(CUBE["DIR"])
+        if version and version != _current["version"]:
+            _current["cube"] = Cube(os.path.join(CUBE["DIR"], version))
+            _current["version"] = version
+        _current["checked"] = time.monotonic()
+    return _current["cube"]
+
+
+def get_cube_version():
+    """Version of the cube `get_cube` currently serves, or None."""
+    return _current["version"] if get_cube() is not None else None
@@ -0,0 +1,90 @@
+import pandas as pd
+
+from layer.models import Data, Geography
+
+"""
+
+Derived indicators: values computed from other indicators of the same
+geography when data is imported, and stored as ordinary `Data` rows so the
+API and reports read them like any other indicator.
+
+Each entry of DERIVED_INDICATORS names its input indicators and a
+`compute` function. The function gets one row per (geography_id,
+data_period) with a column per input and returns a Series of the derived
+values with the same index. NaN means no value.
+
+"""
+
+
+def financial_year(data_periods: pd.Index) -> pd.Series:
+    """Starting year of the April to March financial year of YYYY_MM periods."""
+    periods = pd.Series(data_periods, index=data_periods)
+    year = pd.to_numeric(periods.str[:4], errors="coerce")
+    month = pd.to_numeric(periods.str[5:7], errors="coerce")
+    return year - (month <= 3)
+
+
+def total(*slugs):
+    """The sum of the inputs, with no value when any of them is missing."""
+    return lambda values: values[list(slugs)].sum(axis=1, min_count=len(slugs))
+
+
+def financial_year_total(slug):
+    """The sum of an input over all months of the period's financial year."""
+
+    def compute(values):
+        fy = financial_year(values.index.get_level_values("data_period")).to_numpy()
+        geography = values.index.get_level_values("geography_id")
+        return values[slug].groupby([geography, fy]).transform("sum", min_count=1)
+
+    return compute
+
+
+DERIVED_INDICATORS = {
+    "infrastructure-damaged": {
+        "name": "Infrastructure Damaged",
+        "description": "Roads, bridges and embankments affected",
+        "inputs": ["roads", "bridge", "embankments-affected"],
+        "compute": total("roads", "bridge", "embankments-affected"),
+    },
+    "total-tender-awarded-value-fy-total": {
+        "name": "Tenders Awarded in the Financial Year",
+        "description": "Total value of flood related tenders awarded in the financial year",
+        "inputs": ["total-tender-awarded-value"],
+        "compute": financial_year_total("total-tender-awarded-value"),
+        "unit": "inr",
+    },
+}
+
+
+def load_inputs(state: Geography, slugs) -> pd.DataFrame:
+    """Load the values of a state's indicators as one column per slug.
+
+    Returns:
+        pd.DataFrame: Indexed by (geography_id, data_period).
+    """
+    rows = Data.objects.filter(
+        indicator__geography=state, indicator__slug__in=slugs
+    ).values_list("geography_id", "data_period", "indicator__slug", "value")
+    df = pd.DataFrame.from_records(
+        list(rows), columns=["geography_id", "data_period", "slug", "value"]
+    )
+    df["value"] = df["value"].astype(float)
+    return df.set_index(["geography_id", "data_period", "slug"])["value"].unstack("slug")
+
+
+def derive_values(state: Geography) -> dict:
+    """Compute the derived indicators of a state.
+
+    Indicators with inputs the state has no data for are skipped.
+
+    Returns:
+        dict: Slug to a Series of values by (geography_id, data_period).
+    """
+    slugs = sorted({slug for definition in DERIVED_INDICATORS.values() for slug in definition["inputs"]})
+    values = load_inputs(state, slugs)
+    return {
+        slug: definition["compute"](values)
+        for slug, definition in DERIVED_INDICATORS.items()
+        if set(definition["inputs"]) <= set(values.columns)
+    }
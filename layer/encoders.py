@@ -0,0 +1,33 @@
+from decimal import Decimal
+
+import orjson
+
+# Pre-serialized JSON that `dumps` copies into the output without parsing it.
+Fragment = orjson.Fragment
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(data) -> bytes:
+    """Serialize data to JSON bytes with orjson.
+
+    Decimals are written as floats and NaN/Infinity as null, so the output is
+    always valid JSON. `Fragment` values (e.g. geometries already serialized
+    by PostGIS) are spliced in as-is.
+    """
+    return orjson.dumps(
+        data,
+        default=_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+def geometry_fragment(geojson_text):
+    """Wrap GeoJSON text produced by the database for splicing into a response."""
+    return Fragment(geojson_text) if geojson_text else None
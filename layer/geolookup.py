@@ -0,0 +1,150 @@
+from typing import Optional
+
+from django.db import connection
+from django.db.models import Q
+from graphql import GraphQLError
+
+from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD, GEO_LOOKUP
+from . import types
+from layer.models import Data, Geography
+
+"""
+
+Point-in-polygon lookup: the chain of geographies (e.g. revenue circle >
+district > state) containing each of a batch of coordinates, with their
+indicator values for a period.
+
+All points are matched in one statement. The `&&` bounding box test uses
+the GiST index on Geography.geom, and only the candidates it returns are
+tested exactly with ST_Intersects.
+
+"""
+
+# How specific each geography type is; the most specific match of a point
+# starts its chain.
+TYPE_DEPTH = {
+    "COUNTRY": 0,
+    "STATE": 1,
+    "UT": 1,
+    "DISTRICT": 2,
+    "BLOCK": 3,
+    "REVENUE CIRCLE": 3,
+    "SUB DISTRICT": 3,
+    "TEHSIL": 3,
+    "VILLAGE": 4,
+}
+
+CONTAINING_SQL = """
+SELECT p.ord, g.id, g.type
+FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS p(lon, lat, ord)
+CROSS JOIN LATERAL (SELECT ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326) AS geom) pt
+JOIN {geography} g ON g.geom && pt.geom AND ST_Intersects(g.geom, pt.geom)
+""".format(geography=Geography._meta.db_table)
+
+
+def containing_geographies(points) -> dict:
+    """Return the id of the most specific geography containing each point.
+
+    Args:
+        points (list[types.PointInput]): The coordinates.
+
+    Returns:
+        dict: Point index to geography id, for points inside a geography.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CONTAINING_SQL,
+            [[point.lon for point in points], [point.lat for point in points]],
+        )
+        matches = cursor.fetchall()
+
+    leaves = {}
+    for position, geography_id, geo_type in matches:
+        key = (TYPE_DEPTH.get(geo_type, 0), -geography_id)
+        index = position - 1
+        if index not in leaves or key > leaves[index][0]:
+            leaves[index] = (key, geography_id)
+    return {index: geography_id for index, (_, geography_id) in leaves.items()}
+
+
+def load_ancestors(geography_ids) -> dict:
+    """Load the geographies and all their ancestors, one query per level."""
+    geographies = {}
+    requested = set()
+    missing = set(geography_ids)
+    while missing:
+        requested |= missing
+        rows = Geography.objects.filter(id__in=missing).values(
+            "id", "name", "code", "type", "parentId_id"
+        )
+        for row in rows:
+            geographies[row["id"]] = row
+        missing = {
+            row["parentId_id"]
+            for row in geographies.values()
+            if row["parentId_id"] and row["parentId_id"] not in requested
+        }
+    return geographies
+
+
+def lookup_points(
+        points: list[types.PointInput],
+        data_filter: Optional[types.DataFilter] = None,
+        indc_filter: Optional[types.IndicatorFilter] = None,
+) -> dict:
+    """Resolve coordinates to the chain of geographies containing them.
+
+    Args:
+        points (list[types.PointInput]): Coordinates (WGS 84) to look up.
+        data_filter (types.DataFilter, optional): Period of the indicator
+        values. Defaults to DEFAULT_TIME_PERIOD.
+        indc_filter (types.IndicatorFilter, optional): Only return values of
+        this indicator and its children. Defaults to all visible indicators.
+
+    Returns:
+        dict: `points`, one entry per input with the ids of its geography
+        chain from the most specific geography up, and `geographies`, the
+        details and indicator values of every geography in a chain by id.
+    """
+    if len(points) > GEO_LOOKUP["MAX_POINTS"]:
+        raise GraphQLError(f"At most {GEO_LOOKUP['MAX_POINTS']} points per request.")
+    leaves = containing_geographies(points) if points else {}
+    geographies = load_ancestors(leaves.values())
+
+    period = data_filter.data_period if data_filter and data_filter.data_period else DEFAULT_TIME_PERIOD
+    values = Data.objects.filter(
+        geography_id__in=list(geographies), data_period=period, indicator__is_visible=True
+    )
+    if indc_filter and indc_filter.slug:
+        values = values.filter(
+            Q(indicator__slug=indc_filter.slug)
+            | Q(indicator__parent__slug=indc_filter.slug)
+        )
+    geography_values = {geography_id: {} for geography_id in geographies}
+    for geography_id, slug, value in values.order_by(
+        "indicator__display_order", "indicator_id"
+    ).values_list("geography_id", "indicator__slug", "value"):
+        geography_values[geography_id][slug] = value
+
+    result_points = []
+    for index, point in enumerate(points):
+        chain = []
+        geography_id = leaves.get(index)
+        while geography_id in geographies and geography_id not in chain:
+            chain.append(geography_id)
+            geography_id = geographies[geography_id]["parentId_id"]
+        result_points.append({"lat": point.lat, "lon": point.lon, "chain": chain})
+
+    return {
+        "points": result_points,
+        "geographies": {
+            geography_id: {
+                "name": row["name"],
+                "code": row["code"],
+                "type": row["type"],
+                "parentId": row["parentId_id"],
+                "values": geography_values[geography_id],
+            }
+            for geography_id, row in geographies.items()
+        },
+    }
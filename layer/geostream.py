@@ -0,0 +1,137 @@
+import json
+
+"""
+
+Streaming reader for GeoJSON FeatureCollections. The file is read in
+chunks and the features are decoded one at a time, so memory use depends
+on the largest feature and not on the file size:
+
+    reader = FeatureCollectionReader(f)
+    name = reader.read_header().get("name")
+    for feature in reader.features():
+        ...
+
+The header holds the top-level members that come before "features" (e.g.
+"type", "name", "crs").
+
+"""
+
+CHUNK_SIZE = 1 << 16
+
+WHITESPACE = " \t\n\r"
+DELIMITERS = WHITESPACE + ",:]}"
+
+
+class FeatureCollectionReader:
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.header = {}
+        self.started = False
+        # Whether the parser stands at the start of the "features" array.
+        self.at_features = False
+
+    def fill(self, size) -> bool:
+        """Read up to `size` more characters, dropping the parsed part of the buffer."""
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next character that isn't whitespace without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill(self.chunk_size):
+                raise ValueError("Unexpected end of GeoJSON.")
+
+    def expect(self, chars) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Invalid GeoJSON: expected {' or '.join(chars)} but found {char!r}.")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value, reading as much of the file as it needs."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                end = None
+            # A value is complete once a delimiter follows it; a number at
+            # the end of the buffer may go on in the file.
+            if end is not None and (
+                    self.eof or (end < len(self.buffer) and self.buffer[end] in DELIMITERS)
+            ):
+                self.pos = end
+                return value
+            # Read at least as much again as is buffered, so a large feature
+            # is decoded a bounded number of times.
+            size = max(size, len(self.buffer) - self.pos)
+            if not self.fill(size):
+                if end is not None:
+                    self.pos = end
+                    return value
+                raise ValueError("Invalid GeoJSON: can't decode a value.")
+
+    def read_members(self) -> bool:
+        """Read top-level members into `header` up to "features" or the end of the object.
+
+        Returns:
+            bool: Whether the parser stopped at the "features" array.
+        """
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == "features":
+                return True
+            self.header[key] = self.value()
+            if self.expect(",}") == "}":
+                return False
+
+    def read_header(self) -> dict:
+        """Read and return the top-level members before "features"."""
+        if not self.started:
+            self.started = True
+            self.expect("{")
+            if self.peek() == "}":
+                self.pos += 1
+            else:
+                self.at_features = self.read_members()
+        return self.header
+
+    def features(self):
+        """Yield the features one at a time.
+
+        Members after "features" are added to `header` once all features
+        have been read.
+        """
+        self.read_header()
+        if not self.at_features:
+            return
+        self.at_features = False
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+        else:
+            while True:
+                yield self.value()
+                if self.expect(",]") == "]":
+                    break
+        if self.expect(",}") == ",":
+            self.read_members()
@@ -0,0 +1,240 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from strawberry.django.views import AsyncGraphQLView, GraphQLView
+from strawberry.http import parse_request_data
+
+from D4D_ContextLayer.settings import (
+    GRAPHQL_CACHE,
+    GRAPHQL_PERSISTED_QUERIES,
+    GRAPHQL_SINGLE_FLIGHT,
+)
+from layer import cache, encoders, tracing
+from layer.persisted_queries import PersistedQueryError, resolve_persisted_query
+from layer.singleflight import SingleFlight
+
+CACHE_STATUS_HEADER = "X-GraphQL-Cache"
+
+in_flight = SingleFlight(timeout=GRAPHQL_SINGLE_FLIGHT["TIMEOUT"])
+
+
+@dataclass
+class CachePlan:
+    """How a cacheable query should be executed and its response stored."""
+
+    operation: cache.Operation
+    entry: Optional[cache.CacheEntry]
+    etag: Optional[str]
+    bypass: bool = False
+
+
+def copy_response(response):
+    """Build a fresh response from a shared one so middleware can't leak changes."""
+    copy = HttpResponse(
+        response.content,
+        status=response.status_code,
+        content_type=response["Content-Type"],
+    )
+    if CACHE_STATUS_HEADER in response:
+        copy[CACHE_STATUS_HEADER] = response[CACHE_STATUS_HEADER]
+    return copy
+
+
+class CachedViewMixin:
+    """
+    Response caching shared by the sync and async GraphQL views.
+
+    Responses are cached as serialized JSON, keyed by the normalized query,
+    its variables and the current data version (see `layer.cache`). Sending the
+    bypass header skips the cache entirely, which is handy while debugging.
+
+    Identical queries that arrive while one is already executing wait for that
+    execution instead of running the resolvers again (see `layer.singleflight`).
+
+    Responses are encoded with orjson (see `layer.encoders`).
+
+    Queries can also be sent as automatic persisted queries, i.e. by sha256
+    hash (see `layer.persisted_queries`). Successful GET requests for cacheable
+    fields carry Cache-Control and ETag headers so browsers and proxies can
+    reuse them until the data changes.
+    """
+
+    def prepare_request(self, request):
+        """Decide how to serve a request before executing it.
+
+        Returns:
+            tuple: `(response, plan)`. A response is returned as-is when the
+            request can be answered without executing it (cache hit, 304,
+            persisted query error). Otherwise `plan` is the CachePlan to
+            execute the query with, or None if it isn't cacheable at all.
+        """
+        payload = cache.get_request_payload(request)
+        if payload is None:
+            return None, None
+
+        if GRAPHQL_PERSISTED_QUERIES["ENABLED"]:
+            try:
+                payload = resolve_persisted_query(payload)
+            except PersistedQueryError as e:
+                response = HttpResponse(
+                    encoders.dumps(e.as_response_data()),
+                    content_type="application/json",
+                )
+                return response, None
+        request._graphql_payload = payload
+
+        operation = cache.get_operation(payload)
+        if operation is None:
+            return None, None
+
+        # Traced and profiled requests must execute to measure the resolvers.
+        if (
+            request.headers.get(GRAPHQL_CACHE["BYPASS_HEADER"])
+            or tracing.is_requested(request)
+            or getattr(request, "_profiled", False)
+        ):
+            cache.record("bypasses")
+            return None, CachePlan(operation, None, None, bypass=True)
+
+        entry = cache.get_cache_entry(operation)
+        etag = cache.get_etag(operation) if entry and request.method == "GET" else None
+        if etag and cache.etag_matches(etag, request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+            self.add_http_cache_headers(response, entry, etag)
+            return response, None
+
+        if entry is not None:
+            content = cache.get_cache().get(entry.key)
+            if content is not None:
+                cache.record("hits")
+                response = HttpResponse(content, content_type="application/json")
+                response[CACHE_STATUS_HEADER] = "HIT"
+                if etag:
+                    self.add_http_cache_headers(response, entry, etag)
+                return response, None
+            cache.record("misses")
+
+        return None, CachePlan(operation, entry, etag)
+
+    def store_response(self, request, plan, response):
+        if plan.entry is None:
+            return
+        if response.status_code == 200 and getattr(request, "_graphql_cacheable", False):
+            cache.get_cache().set(plan.entry.key, response.content, plan.entry.ttl)
+            cache.record("stores")
+            response[CACHE_STATUS_HEADER] = "MISS"
+
+    def finish_response(self, plan, response):
+        if plan.etag and response.get(CACHE_STATUS_HEADER) == "MISS":
+            self.add_http_cache_headers(response, plan.entry, plan.etag)
+        return response
+
+    def add_http_cache_headers(self, response, entry, etag):
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=entry.ttl)
+
+    def encode_json(self, response_data):
+        return encoders.dumps(response_data)
+
+    def should_render_graphiql(self, request):
+        # A GET carrying only a persisted query hash has no `query` parameter
+        # but must still be executed.
+        if "extensions" in request.query_params:
+            return False
+        return super().should_render_graphiql(request)
+
+
+class CachedGraphQLView(CachedViewMixin, GraphQLView):
+    """GraphQLView serving repeated queries from the response cache."""
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super().dispatch
+        response, plan = self.prepare_request(request)
+        if response is not None:
+            return response
+        if plan is None:
+            return dispatch(request, *args, **kwargs)
+
+        if plan.bypass:
+            response = dispatch(request, *args, **kwargs)
+            response[CACHE_STATUS_HEADER] = "BYPASS"
+            return response
+
+        def execute():
+            response = dispatch(request, *args, **kwargs)
+            self.store_response(request, plan, response)
+            return response
+
+        if not GRAPHQL_SINGLE_FLIGHT["ENABLED"]:
+            response = execute()
+        else:
+            response, shared = in_flight.do(plan.operation.key, execute)
+            if shared:
+                response = copy_response(response)
+
+        return self.finish_response(plan, response)
+
+    def parse_http_body(self, request):
+        payload = getattr(request.request, "_graphql_payload", None)
+        if payload is None:
+            return super().parse_http_body(request)
+        return parse_request_data(payload)
+
+    def process_result(self, request, result):
+        # Only error free results are worth keeping around.
+        request._graphql_cacheable = not result.errors
+        return super().process_result(request, result)
+
+
+class AsyncCachedGraphQLView(CachedViewMixin, AsyncGraphQLView):
+    """
+    AsyncGraphQLView serving repeated queries from the response cache.
+
+    Used with `layer.async_schema` when running under an ASGI server. Cache
+    lookups may query the data version, so they run through `sync_to_async`.
+    """
+
+    @method_decorator(csrf_exempt)
+    async def dispatch(self, request, *args, **kwargs):
+        dispatch = super().dispatch
+        response, plan = await sync_to_async(self.prepare_request)(request)
+        if response is not None:
+            return response
+        if plan is None:
+            return await dispatch(request, *args, **kwargs)
+
+        if plan.bypass:
+            response = await dispatch(request, *args, **kwargs)
+            response[CACHE_STATUS_HEADER] = "BYPASS"
+            return response
+
+        async def execute():
+            response = await dispatch(request, *args, **kwargs)
+            await sync_to_async(self.store_response)(request, plan, response)
+            return response
+
+        if not GRAPHQL_SINGLE_FLIGHT["ENABLED"]:
+            response = await execute()
+        else:
+            response, shared = await in_flight.ado(plan.operation.key, execute)
+            if shared:
+                response = copy_response(response)
+
+        return self.finish_response(plan, response)
+
+    async def parse_http_body(self, request):
+        payload = getattr(request.request, "_graphql_payload", None)
+        if payload is None:
+            return await super().parse_http_body(request)
+        return parse_request_data(payload)
+
+    async def process_result(self, request, result):
+        # Only error free results are worth keeping around.
+        request._graphql_cacheable = not result.errors
+        return await super().process_result(request, result)
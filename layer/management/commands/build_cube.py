@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from D4D_ContextLayer.settings import CUBE
+from layer.cube import write_cube
+
+
+class Command(BaseCommand):
+    """
+    Build the in-memory data cube (see layer.cube) from the database.
+
+    import_data rebuilds the cube itself when DATA_ENGINE is "cube"; run this
+    after changing data any other way, e.g. generate_synthetic_data or the
+    admin. Running servers pick the new cube up within CUBE["CHECK_INTERVAL"]
+    seconds.
+    """
+
+    help = "Write a new data cube for the cube read engine."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=CUBE["DIR"], help="Cube directory")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        version = write_cube(options["dir"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote cube {version} to {options['dir']} in {time.perf_counter() - start:.2f}s."
+            )
+        )
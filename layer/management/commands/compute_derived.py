@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from layer.cache import bump_data_version
+from layer.management.commands.import_data import import_derived_indicators
+from layer.models import Geography
+
+
+class Command(BaseCommand):
+    """
+    Compute the derived indicators (see layer.derived) from the stored data.
+
+    import_data computes them for the states it imports; run this to fill
+    them the first time, or after adding an entry to DERIVED_INDICATORS.
+    """
+
+    help = "Compute and store the derived indicators of all or one state."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--state", help="Name of the state, defaults to all states")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        states = Geography.objects.filter(type="STATE")
+        if options["state"]:
+            states = states.filter(name__iexact=options["state"])
+        written = 0
+        with transaction.atomic():
+            for state in states:
+                written += import_derived_indicators(state)
+        bump_data_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} derived values in {time.perf_counter() - start:.2f}s."
+            )
+        )
@@ -0,0 +1,94 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from D4D_ContextLayer.settings import DATA_ENGINE
+from layer.cache import bump_data_version
+from layer.cube import write_cube
+from layer.derived import load_inputs
+from layer.management.commands.import_data import store_indicator_values
+from layer.models import Geography, Indicators
+from layer.region_data import refresh_region_data
+from layer.scoring import RISK_FACTORS, RISK_SCORE, TOPSIS_SCORE, compute_scores
+from layer.tiles import clear_tile_cache
+
+
+def score_state(state, data_periods=None) -> int:
+    """Recompute and store the risk scores of a state (see layer.scoring).
+
+    Scores are binned across all periods of the state's data, but only
+    those of `data_periods` are written when given.
+
+    Returns:
+        int: Number of values written.
+    """
+    slugs = sorted({slug for inputs in RISK_FACTORS.values() for slug in inputs})
+    # The state's own values are rollups (see layer.rollup), not a region to rank.
+    values = load_inputs(state, slugs).drop(state.id, level="geography_id", errors="ignore")
+    if values.empty:
+        return 0
+    geography_types = pd.Series(
+        dict(
+            Geography.objects.filter(
+                id__in=values.index.unique("geography_id").tolist()
+            ).values_list("id", "type")
+        )
+    )
+    scores = compute_scores(values, geography_types)
+    if data_periods:
+        scores = scores[scores.index.get_level_values("data_period").isin(data_periods)]
+
+    indicators = {
+        indicator.slug: indicator
+        for indicator in Indicators.objects.filter(geography=state, slug__in=list(scores.columns))
+    }
+    written = 0
+    for slug in scores.columns:
+        if slug in indicators:
+            written += store_indicator_values(indicators[slug], scores[slug], refresh=False)
+    if any(indicator.is_visible for indicator in indicators.values()):
+        refresh_region_data(
+            scores.index.unique("geography_id").tolist(), scores.index.unique("data_period").tolist()
+        )
+    return written
+
+
+class Command(BaseCommand):
+    """
+    Recompute the factor scores, topsis-score and risk-score from the raw
+    indicators with TOPSIS (see layer.scoring) and store them as `Data`.
+    """
+
+    help = "Recompute the TOPSIS risk scores of all or one state."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--state", help="Name of the state, defaults to all states")
+        parser.add_argument(
+            "--period",
+            nargs="+",
+            help="Only write the scores of these data periods (YYYY_MM)",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        states = Geography.objects.filter(type="STATE")
+        if options["state"]:
+            states = states.filter(name__iexact=options["state"])
+            if not states:
+                raise CommandError(f"State {options['state']} not found.")
+        written = 0
+        with transaction.atomic():
+            for state in states:
+                written += score_state(state, options["period"])
+        if DATA_ENGINE == "cube":
+            write_cube()
+        bump_data_version()
+        clear_tile_cache()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} scores ({', '.join([*RISK_FACTORS, TOPSIS_SCORE, RISK_SCORE])}) "
+                f"in {time.perf_counter() - start:.2f}s."
+            )
+        )
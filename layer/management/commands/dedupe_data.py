@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from layer.models import Data
+
+"""
+
+Older imports gave every `Data` row an explicit id and could store the same
+value more than once. Imports now match rows on (indicator, geography,
+data_period) and leave ids to the database, so databases filled by them need
+their duplicates removed and the id sequence moved past the existing ids.
+
+"""
+
+# The newest row of each duplicate group is kept.
+DELETE_DUPLICATES_SQL = """
+DELETE FROM {table} WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY indicator_id, geography_id, data_period
+            ORDER BY modified DESC, id DESC
+        ) AS position
+        FROM {table}
+        WHERE data_period IS NOT NULL
+    ) ranked
+    WHERE position > 1
+)
+"""
+
+RESET_SEQUENCE_SQL = """
+SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+FROM {table}
+"""
+
+
+class Command(BaseCommand):
+    """
+    Remove duplicate `Data` values, keeping the newest of each, and reset the
+    `Data` id sequence. Run it before the migration that adds the unique
+    constraint on (indicator, geography, data_period).
+    """
+
+    help = "Remove duplicate data values and reset the data id sequence."
+
+    def handle(self, *args, **options):
+        table = Data._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(DELETE_DUPLICATES_SQL.format(table=table))
+            deleted = cursor.rowcount
+            cursor.execute(RESET_SEQUENCE_SQL.format(table=table))
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} duplicate values and reset the id sequence.")
+        )
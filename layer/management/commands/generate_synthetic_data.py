@@ -0,0 +1,284 @@
+import math
+from datetime import datetime
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils.text import slugify
+from faker import Faker
+
+from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD
+from layer.cache import bump_data_version
+from layer.models import Data, Geography, Indicators, Unit
+from layer.region_data import refresh_region_data
+
+# Codes of synthetic geographies start with this prefix, so they never clash
+# with real ones and can be removed again with --clear.
+SYNTHETIC_CODE_PREFIX = "SYN"
+
+# Top level indicator and the factors it is computed from, as in the real data.
+RISK_SCORE = "risk-score"
+RISK_FACTORS = ["flood-hazard", "exposure", "vulnerability", "government-response"]
+
+STATE_SIZE = 4  # degrees
+STATES_PER_ROW = 8
+
+
+def grid_boxes(bbox, count):
+    """Split a (xmin, ymin, xmax, ymax) box into `count` boxes on a grid."""
+    xmin, ymin, xmax, ymax = bbox
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    width = (xmax - xmin) / columns
+    height = (ymax - ymin) / rows
+    return [
+        (
+            xmin + (i % columns) * width,
+            ymin + (i // columns) * height,
+            xmin + (i % columns + 1) * width,
+            ymin + (i // columns + 1) * height,
+        )
+        for i in range(count)
+    ]
+
+
+def box_geometry(bbox, vertices_per_edge):
+    """A rectangular MultiPolygon with `vertices_per_edge` points on each side.
+
+    The extra vertices make payload sizes closer to real boundaries.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    steps = np.linspace(0, 1, vertices_per_edge, endpoint=False)
+    ring = (
+        [(xmin + (xmax - xmin) * t, ymin) for t in steps]
+        + [(xmax, ymin + (ymax - ymin) * t) for t in steps]
+        + [(xmax - (xmax - xmin) * t, ymax) for t in steps]
+        + [(xmin, ymax - (ymax - ymin) * t) for t in steps]
+    )
+    ring.append(ring[0])
+    return MultiPolygon(Polygon(ring), srid=4326)
+
+
+def get_periods(count, end=DEFAULT_TIME_PERIOD):
+    """The `count` monthly periods ending with `end`, oldest first."""
+    end_date = datetime.strptime(end, "%Y_%m")
+    return [
+        (end_date - relativedelta(months=i)).strftime("%Y_%m")
+        for i in reversed(range(count))
+    ]
+
+
+def get_indicator_slugs(count):
+    extra = [f"synthetic-indicator-{i + 1}" for i in range(max(count - 5, 0))]
+    return ([RISK_SCORE] + RISK_FACTORS + extra)[:count]
+
+
+def clear_synthetic_data():
+    geographies = Geography.objects.filter(code__startswith=SYNTHETIC_CODE_PREFIX)
+    deleted, _ = Data.objects.filter(geography__in=geographies).delete()
+    indicators = Indicators.objects.filter(geography__in=geographies)
+    # Parents are protected, detach them before deleting.
+    indicators.update(parent=None)
+    indicators.delete()
+    geographies.filter(type="STATE").delete()
+    return deleted
+
+
+def unique_name(fake, used):
+    """A fake city name not in `used`, numbered once Faker runs out of names."""
+    name = fake.city()
+    if name in used:
+        name = f"{name} {len(used) + 1}"
+    used.add(name)
+    return name
+
+
+def create_geographies(state_count, district_count, subdistrict_count, sub_type, vertices, fake):
+    """Create the state/district/sub-district hierarchy.
+
+    Returns:
+        list[tuple]: `(state, districts, subdistricts)` per state.
+    """
+    used_names = set()
+
+    def build(code, geo_type, box, parent):
+        name = unique_name(fake, used_names)
+        return Geography(
+            name=name,
+            code=code,
+            type=geo_type,
+            geom=box_geometry(box, vertices),
+            parentId=parent,
+            slug=slugify(name),
+        )
+
+    hierarchy = []
+    for s in range(state_count):
+        xmin = 68 + (s % STATES_PER_ROW) * STATE_SIZE
+        ymin = 8 + (s // STATES_PER_ROW) * STATE_SIZE
+        state_box = (xmin, ymin, xmin + STATE_SIZE, ymin + STATE_SIZE)
+        state_code = f"{SYNTHETIC_CODE_PREFIX}{s + 1:02d}"
+        state = build(state_code, "STATE", state_box, None)
+        state.name = f"Synthetic {state.name}"
+        state.save()
+
+        district_boxes = grid_boxes(state_box, district_count)
+        districts = Geography.objects.bulk_create(
+            [
+                build(f"{state_code}-{d + 1:02d}", "DISTRICT", box, state)
+                for d, box in enumerate(district_boxes)
+            ]
+        )
+        subdistricts = Geography.objects.bulk_create(
+            [
+                build(f"{district.code}-{k + 1:02d}", sub_type, box, district)
+                for district, district_box in zip(districts, district_boxes)
+                for k, box in enumerate(grid_boxes(district_box, subdistrict_count))
+            ]
+        )
+        hierarchy.append((state, districts, subdistricts))
+    return hierarchy
+
+
+def create_indicators(state, slugs, unit):
+    """Create the indicator tree of a state: risk score > factors > the rest."""
+    display_order = (Indicators.objects.aggregate(order=Max("display_order"))["order"] or 0) + 1
+
+    def build(slug, parent, order):
+        return Indicators(
+            name=slug.replace("-", " ").title(),
+            slug=slugify(slug),
+            long_description=f"Synthetic {slug.replace('-', ' ')}",
+            category="Synthetic",
+            unit=unit if slug in [RISK_SCORE, *RISK_FACTORS] else None,
+            data_source="Synthetic",
+            geography=state,
+            parent=parent,
+            display_order=order,
+            is_visible=True,
+        )
+
+    root = Indicators.objects.bulk_create([build(slugs[0], None, display_order)])[0]
+    factors = Indicators.objects.bulk_create(
+        [build(slug, root, display_order + i + 1) for i, slug in enumerate(slugs[1:5])]
+    )
+    others = Indicators.objects.bulk_create(
+        [
+            build(slug, factors[i % len(factors)], display_order + i + 5)
+            for i, slug in enumerate(slugs[5:])
+        ]
+    ) if factors else []
+    return [root, *factors, *others]
+
+
+def create_data(geographies, indicators, periods, rng, batch_size):
+    """Create a value for every geography, indicator and period.
+
+    Scores (risk score and factors) are whole numbers from 1 to 5 as in the
+    real data, other indicators are spread between 0 and 1000.
+    """
+    score_slugs = {RISK_SCORE, *RISK_FACTORS}
+    batch = []
+    created = 0
+    for geography in geographies:
+        scores = rng.integers(1, 6, size=(len(periods), len(indicators))).astype(float)
+        values = np.round(rng.uniform(0, 1000, size=(len(periods), len(indicators))), 2)
+        for p, period in enumerate(periods):
+            for i, indicator in enumerate(indicators):
+                value = scores[p, i] if indicator.slug in score_slugs else values[p, i]
+                batch.append(
+                    Data(
+                        value=float(value),
+                        indicator=indicator,
+                        geography=geography,
+                        data_period=period,
+                    )
+                )
+        if len(batch) >= batch_size:
+            Data.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+            batch = []
+    Data.objects.bulk_create(batch, batch_size=batch_size)
+    return created + len(batch)
+
+
+class Command(BaseCommand):
+    """
+    Generate a synthetic dataset to benchmark the API, reports and imports at scale.
+
+    Creates N states with M districts each, K sub-districts per district, I
+    indicators per state and a value for every geography, indicator and one
+    of P monthly periods ending with DEFAULT_TIME_PERIOD. Geometries are valid
+    non-overlapping rectangles. Synthetic geographies have codes starting with
+    "SYN".
+    """
+
+    help = "Generate synthetic states, geographies, indicators and data for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--states", type=int, default=2, help="Number of states")
+        parser.add_argument("--districts", type=int, default=10, help="Districts per state")
+        parser.add_argument("--subdistricts", type=int, default=5, help="Sub-districts per district")
+        parser.add_argument("--periods", type=int, default=12, help="Monthly data periods")
+        parser.add_argument("--indicators", type=int, default=15, help="Indicators per state")
+        parser.add_argument(
+            "--subdistrict-type",
+            default="BLOCK",
+            choices=["BLOCK", "REVENUE CIRCLE", "TEHSIL", "SUB DISTRICT"],
+            help="Geography type of the sub-districts",
+        )
+        parser.add_argument("--vertices", type=int, default=25, help="Vertices per polygon edge")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Rows per insert")
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove previously generated synthetic data first",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted = clear_synthetic_data()
+            self.stdout.write(f"Removed {deleted} synthetic records.")
+        if Geography.objects.filter(code__startswith=SYNTHETIC_CODE_PREFIX).exists():
+            self.stdout.write("Synthetic data already exists, use --clear to regenerate.")
+            return
+
+        Faker.seed(options["seed"])
+        fake = Faker()
+        rng = np.random.default_rng(options["seed"])
+        periods = get_periods(options["periods"])
+        slugs = get_indicator_slugs(options["indicators"])
+
+        with transaction.atomic():
+            unit, _ = Unit.objects.get_or_create(name="score")
+            hierarchy = create_geographies(
+                options["states"],
+                options["districts"],
+                options["subdistricts"],
+                options["subdistrict_type"],
+                options["vertices"],
+                fake,
+            )
+            total = 0
+            for state, districts, subdistricts in hierarchy:
+                indicators = create_indicators(state, slugs, unit)
+                rows = create_data(
+                    [*districts, *subdistricts], indicators, periods, rng, options["batch_size"]
+                )
+                refresh_region_data([g.id for g in [*districts, *subdistricts]], periods)
+                total += rows
+                self.stdout.write(
+                    f"{state.name} ({state.code}): {len(districts)} districts, "
+                    f"{len(subdistricts)} sub-districts, {rows} data rows"
+                )
+        bump_data_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {len(hierarchy)} states, {len(periods)} periods "
+                f"({periods[0]} to {periods[-1]}), {total} data rows."
+            )
+        )
@@ -1,112 +1,182 @@
 import glob
 import json
+import logging
 import os
 import time
+from collections import Counter
+from contextlib import contextmanager
 
 import pandas as pd
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import Q
-from layer.models import Data, Geography, Indicators, Unit
-
-
-def migrate_indicators(filename="layer/assets/indicators/data_dict.csv"):
-    df = pd.read_csv(filename)
-
-    for row in df.itertuples(index=False):
-        print("Processing Indicator -", row.indicatorSlug)
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.text import slugify
+from D4D_ContextLayer.settings import DATA_ENGINE
+from layer.cache import bump_data_version
+from layer.cube import write_cube
+from layer.derived import DERIVED_INDICATORS, derive_values
+from layer.geostream import FeatureCollectionReader
+from layer.metrics import IMPORT_PHASE_SECONDS, IMPORT_ROWS, write_import_metrics
+from layer.models import Data, Geography, ImportRun, Indicators, Unit
+from layer.region_data import indicator_layout, rebuild_state_region_data, refresh_region_data
+from layer.rollup import rollup_state
+from layer.tiles import clear_tile_cache
+
+logger = logging.getLogger(__name__)
+
+# Rows of a state data file read at a time.
+DATA_CHUNK_SIZE = 50000
+
+# Features of a boundary file written at a time.
+GEOJSON_BATCH_SIZE = 200
+
+# How the features of each boundary file, by the file's "name", become
+# geographies. "code" and "name" are filled in with the feature's
+# properties, as are those of "parent", which is found by name if it has
+# one and by code otherwise. Missing parents are created if "create" is set.
+GEOJSON_FILES = {
+    "assam_district": {
+        "type": "DISTRICT",
+        "code": "{object_id}",
+        "name": "{dtname}",
+        "parent": {"type": "STATE", "name": "Assam", "code": "18", "create": True},
+    },
+    "assam_revenue_circles_nov2022": {
+        "type": "REVENUE CIRCLE",
+        "code": "{object_id}",
+        "name": "{revenue_ci}",
+        "parent": {"type": "DISTRICT", "name": "{dtname}"},
+    },
+    "BharatMaps_HP_district": {
+        "type": "DISTRICT",
+        "code": "{object_id}",
+        "name": "{District}",
+        # TODO: add statecode to HP geojson
+        "parent": {"type": "STATE", "name": "{STATE}", "code": "02", "create": True},
+    },
+    "bharatmaps_HP_subdistricts": {
+        "type": "SUB DISTRICT",
+        "code": "{sdtcode11}",
+        "name": "{sdtname}",
+        "parent": {"type": "DISTRICT", "code": "{dtcode11}"},
+    },
+    "hp_tehsil_temp": {
+        "type": "TEHSIL",
+        "code": "{object_id}",
+        "name": "{TEHSIL}",
+        "parent": {"type": "DISTRICT", "code": "02-{dtcode11}"},
+    },
+    "odisha_district": {
+        "type": "DISTRICT",
+        "code": "{object_id}",
+        "name": "{dtname}",
+        "parent": {"type": "STATE", "name": "ODISHA", "code": "21", "create": True},
+    },
+    "odisha_block": {
+        "type": "BLOCK",
+        "code": "{object_id}",
+        "name": "{block_name}",
+        "parent": {"type": "DISTRICT", "code": "21-{dtcode11}"},
+    },
+}
+
+
+def feature_geometry(feature) -> MultiPolygon:
+    geom = GEOSGeometry(json.dumps(feature["geometry"]))
+    if isinstance(geom, Polygon):
+        geom = MultiPolygon([geom])
+    return geom
+
+
+def get_parent_geography(spec, properties, parents):
+    """Find the parent geography of a feature as described by its file's GEOJSON_FILES entry.
+
+    Args:
+        spec (dict): The "parent" entry of the file.
+        properties (dict): The feature's properties.
+        parents (dict): Parents found so far, reused across features.
+
+    Returns:
+        Geography | None: The parent, None if it's missing and can't be created.
+    """
+    name = spec["name"].format_map(properties) if "name" in spec else None
+    code = spec["code"].format_map(properties) if "code" in spec else None
+    key = (spec["type"], name.lower() if name else None, code)
+    if key not in parents:
         try:
-            indicator = Indicators.objects.get(slug=row.indicatorSlug.lower())
-            print("Already Exists! Updating")
-            indicator.name = row.indicatorTitle.strip()
-            indicator.long_description = row.indicatorDescription.strip()
-            indicator.category = row.indicatorCategory.strip()
-            indicator.unit = _get_indicator_unit_form_row(row)
-            indicator.data_source = row.dataSource.strip() if row.dataSource else None
-            indicator.parent = _get_indicator_parent_from_row(row)
-            indicator.is_visible = True if row.visible == "y" else False
-            indicator.save()
-            print("updated Indicator -", row.indicatorSlug)
-        except Indicators.DoesNotExist:
-            print("Processing Unit -", row.unit)
-            unit_obj = _get_indicator_unit_form_row(row)
-            parent_obj = _get_indicator_parent_from_row(row)
-
-            indicator_obj = Indicators(
-                name=str(row.indicatorTitle).strip(),
-                slug=(
-                    str(row.indicatorSlug).lower().strip() if row.indicatorSlug else None
-                ),
-                long_description=(
-                    str(row.indicatorDescription).strip()
-                    if row.indicatorDescription
-                    else None
-                ),
-                # short_description = row.indicatorDescription if row.indicatorDescription else None,
-                category=(
-                    str(row.indicatorCategory).strip() if row.indicatorCategory else None
-                ),
-                # type = row.indicatorType if row.indicatorType else None
-                unit=unit_obj,
-                data_source=str(row.datasource).strip() if row.datasource else None,
-                parent=parent_obj,
-                is_visible=True if str(row.visible_on_platform) == "y" else False,
-            )
-            indicator_obj.save()
-            print("Added indicator to the database.")
-        print("---------------------------")
-
-
-def _get_indicator_parent_from_row(row, state):
-    parent_obj = None
-    try:
-        if row.parent and not isinstance(row.parent, float):
-            parent_obj = Indicators.objects.get(name=row.parent.strip(), geography=state)
+            if name:
+                parents[key] = Geography.objects.get(name__iexact=name, type=spec["type"])
+            else:
+                parents[key] = Geography.objects.get(code=code, type=spec["type"])
+        except Geography.DoesNotExist:
+            if spec.get("create"):
+                parent_geo_obj = Geography(name=name.capitalize(), code=code, type=spec["type"])
+                parent_geo_obj.save()
+                parents[key] = parent_geo_obj
+            else:
+                logger.warning("Parent %s %s is missing", spec["type"].lower(), name or code)
+                parents[key] = None
+    return parents[key]
+
+
+def import_features(features, config, parents) -> int:
+    """Create or update the geographies of a batch of features.
+
+    Geographies are matched on code and parent, and written with one
+    bulk_create and one bulk_update.
+
+    Args:
+        features (list[dict]): GeoJSON features.
+        config (dict): The file's GEOJSON_FILES entry.
+        parents (dict): Parents found so far, see `get_parent_geography`.
+
+    Returns:
+        int: Number of geographies written.
+    """
+    geographies = {}
+    for ft in features:
+        properties = ft["properties"]
+        parent_geo_obj = get_parent_geography(config["parent"], properties, parents)
+        if parent_geo_obj is None:
+            continue
+        code = config["code"].format_map(properties)
+        name = config["name"].format_map(properties).capitalize()
+        geographies[(code, parent_geo_obj.id)] = (name, feature_geometry(ft), parent_geo_obj)
+
+    existing = {
+        (geo_object.code, geo_object.parentId_id): geo_object
+        for geo_object in Geography.objects.filter(
+            code__in={code for code, _ in geographies},
+            parentId__in={parent_id for _, parent_id in geographies},
+        ).defer("geom")
+    }
+    new_objects = []
+    updated_objects = []
+    for key, (name, geom, parent_geo_obj) in geographies.items():
+        geo_object = existing.get(key)
+        if geo_object is None:
+            new_objects.append(Geography(
+                name=name,
+                code=key[0],
+                type=config["type"],
+                geom=geom,
+                parentId=parent_geo_obj,
+                slug=slugify(name),
+            ))
         else:
-            pass
-    except Indicators.DoesNotExist:
-        print(
-            f"Failed to get the parent indicator for {row.indicatorSlug.lower()}"
-        )
-    return parent_obj
+            geo_object.name = name
+            geo_object.geom = geom
+            geo_object.type = config["type"]
+            geo_object.slug = geo_object.slug or slugify(name)
+            updated_objects.append(geo_object)
+    Geography.objects.bulk_create(new_objects)
+    Geography.objects.bulk_update(updated_objects, ["name", "geom", "type", "slug"])
+    return len(geographies)
 
 
-def _get_indicator_unit_form_row(row):
-    if row.unit and not isinstance(row.unit, float):
-        try:
-            unit_obj = Unit.objects.get(name=row.unit.lower())
-            # print(f"Hey! Unit {unit_obj.name} already exists!")
-        except Unit.DoesNotExist:
-            unit_obj = Unit(name=row.unit.lower())
-            unit_obj.save()
-            print(f"Saved {unit_obj.name} to DB!")
-    else:
-        unit_obj = None
-    return unit_obj
-
-
-# def update_indicators(filename="layer/data_dict.csv"):
-#     df = pd.read_csv(filename)
-#     for row in df.itertuples(index=False):
-#         slug = row.indicatorSlug
-#         print("Processing Indicator -", slug)
-#         try:
-#             indicator = Indicators.objects.get(slug=slug.lower())
-#             indicator.name = row.indicatorTitle.strip()
-#             indicator.long_description = row.indicatorDescription.strip()
-#             indicator.category = row.indicatorCategory.strip()
-#             indicator.unit = _get_indicator_unit_form_row(row)
-#             indicator.data_source = row.dataSource.strip() if row.dataSource else None
-#             indicator.parent = _get_indicator_parent_from_row(row)
-#             indicator.is_visible = True if row.visible == "y" else False
-#             indicator.save()
-#             print(f"updated Indicator - {slug}")
-#
-#         except Indicators.DoesNotExist:
-#             print(f"Indicator with slug {slug} does not exist. ")
-
-
-def migrate_geojson():
+def migrate_geojson(batch_size=GEOJSON_BATCH_SIZE):
     files = sorted(glob.glob(os.getcwd() + "/layer/assets/geojson/*.geojson"))
     sorted_files = sorted(
         files,
@@ -115,246 +185,500 @@ def migrate_geojson():
     )
 
     for filename in sorted_files:
-        with open(filename) as f:
-            print(
-                f"Adding data from {os.path.basename(filename)} to database....")
-            data = json.load(f)
-
-            file_name = data["name"]
-            for ft in data["features"]:
-                # print(type(ft))
-                geom_str = json.dumps(ft["geometry"])
-                # print(type(geom_str))
-                geom = GEOSGeometry(geom_str)
-                # print(type(geom))
-
-                # try:
-                if isinstance(geom, MultiPolygon):
-                    pass
-                elif isinstance(geom, Polygon):
-                    geom = MultiPolygon([geom])
-
-                if file_name == "assam_district":
-                    geo_type = "DISTRICT"
-                    code = ft["properties"]["object_id"]
-                    name = ft["properties"]["dtname"]
-                    state = "Assam"
-                    try:
-                        parent_geo_obj = Geography.objects.get(
-                            name__iexact=state, type="STATE"
-                        )
-                    except Geography.DoesNotExist:
-                        parent_geo_obj = Geography(
-                            name=state.capitalize(), code="18", type="STATE"
-                        )
-                        parent_geo_obj.save()
-
-                elif file_name == "assam_revenue_circles_nov2022":
-                    geo_type = "REVENUE CIRCLE"
-                    code = ft["properties"]["object_id"]
-                    name = ft["properties"]["revenue_ci"]
-                    district = ft["properties"]["dtname"]
-                    parent_geo_obj = Geography.objects.get(
-                        name__iexact=district, type="DISTRICT"
-                    )
-                elif file_name == "BharatMaps_HP_district":
-                    geo_type = "DISTRICT"
-                    code = ft["properties"]["object_id"]
-                    name = ft["properties"]["District"]
-                    state = ft["properties"]["STATE"]
-                    state_code = "02"  # TODO: add statecode to HP geojson
-                    try:
-                        parent_geo_obj = Geography.objects.get(
-                            name__iexact=state, type="STATE"
-                        )
-                    except Geography.DoesNotExist:
-                        parent_geo_obj = Geography(
-                            name=state.capitalize(), code=state_code, type="STATE"
-                        )
-                        parent_geo_obj.save()
-
-                elif file_name == "bharatmaps_HP_subdistricts":
-                    geo_type = "SUB DISTRICT"
-                    code = ft["properties"]["sdtcode11"]
-                    name = ft["properties"]["sdtname"]
-                    dtcode = ft["properties"]["dtcode11"]
-                    parent_geo_obj = Geography.objects.get(
-                        code=dtcode, type="DISTRICT")
-                elif file_name == "hp_tehsil_temp":
-                    geo_type = "TEHSIL"
-                    code = ft["properties"]["object_id"]
-                    name = ft["properties"]["TEHSIL"]
-                    dtcode = f'02-{ft["properties"]["dtcode11"]}'
-                    parent_geo_obj = Geography.objects.get(
-                        code=dtcode, type="DISTRICT")
-                elif file_name == "odisha_district":
-                    geo_type = "DISTRICT"
-                    code = ft["properties"]["object_id"]
-                    name = ft["properties"]["dtname"]
-                    state = "ODISHA"
-                    state_code = "21"
-                    try:
-                        parent_geo_obj = Geography.objects.get(
-                            name__iexact=state, type="STATE"
-                        )
-                    except Geography.DoesNotExist:
-                        parent_geo_obj = Geography(
-                            name=state.capitalize(), code=state_code, type="STATE"
-                        )
-                        parent_geo_obj.save()
-                elif file_name == "odisha_block":
-                    geo_type = "BLOCK"
-                    code = ft["properties"]["object_id"]
-                    name = ft["properties"]["block_name"]
-                    dtcode = f'21-{ft["properties"]["dtcode11"]}'
-                    parent_geo_obj = Geography.objects.get(
-                        code=dtcode, type="DISTRICT")
-                try:
-                    geo_object = Geography.objects.get(code=code,
-                                                       parentId=parent_geo_obj)
-                    geo_object.name = name.capitalize()
-                    geo_object.geom = geom
-                    geo_object.type = geo_type
-                except Geography.DoesNotExist:
-                    geo_object = Geography(
-                        name=name.capitalize(),
-                        code=code,
-                        type=geo_type,
-                        geom=geom,
-                        parentId=parent_geo_obj,
-                    )
-                geo_object.save()
-
-
-if Data.objects.last() is not None:
-    counter = Data.objects.last().pk
-else:
-    counter = 0
-
-
-def generate_pk():
-    global counter
-    counter += 1
-    return counter
-
-
-def addDataRow(row, geography_obj, indicator):
-    data_obj = Data(
-        pk=generate_pk(),
-        value=row[f"{indicator.slug}"],
-        indicator=indicator,
-        geography=geography_obj,
-        data_period=row.timeperiod,
+        with open(filename) as f, transaction.atomic():
+            logger.info("Adding data from %s to database", os.path.basename(filename))
+            reader = FeatureCollectionReader(f)
+            file_name = reader.read_header().get("name")
+            config = GEOJSON_FILES.get(file_name)
+            if config is None:
+                logger.warning("No GEOJSON_FILES entry for %s, skipping", file_name)
+                continue
+            parents = {}
+            batch = []
+            for ft in reader.features():
+                batch.append(ft)
+                if len(batch) >= batch_size:
+                    import_features(batch, config, parents)
+                    batch = []
+            if batch:
+                import_features(batch, config, parents)
+
+
+def upsert_data(data_objects, batch_size=5000):
+    """Insert Data rows, updating the value of those that already exist.
+
+    Rows are matched on (indicator, geography, data_period) with INSERT ...
+    ON CONFLICT DO UPDATE, so re-imports don't duplicate data and ids are
+    assigned by the database. A written value replaces a rolled-up one.
+    """
+    Data.objects.bulk_create(
+        data_objects,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["indicator", "geography", "data_period"],
+        update_fields=["value", "modified", "is_rollup"],
     )
-    return data_obj
 
 
-def import_geography_data(df, indicators, g_code):
-    rows = df[df.index == g_code]
+def values_differ(stored, incoming) -> bool:
+    """Compare a stored value with an imported one, treating None and NaN as equal."""
+    if pd.isna(stored) or pd.isna(incoming):
+        return not (pd.isna(stored) and pd.isna(incoming))
+    return stored != incoming
+
+
+def changed_periods(geography_obj, periods, indicators, data_objects) -> set:
+    """Return the data periods of a geography whose imported values differ from the stored ones.
+
+    A period also counts as changed when it has stored values of indicators
+    that are not imported, since those get removed. Rolled-up values (see
+    layer.rollup) count as no value.
+
+    Args:
+        geography_obj (Geography): The geography being imported.
+        periods (list): Data periods in the file for the geography.
+        indicators (list[Indicators]): The imported indicators.
+        data_objects (dict): Imported `Data` objects by (indicator id, data period).
+
+    Returns:
+        set: The changed data periods.
+    """
+    indicator_ids = {indicator.id for indicator in indicators}
+    stored = {
+        (indicator_id, data_period): value
+        for indicator_id, data_period, value in Data.objects.filter(
+            geography=geography_obj, data_period__in=periods, is_rollup=False
+        ).values_list("indicator_id", "data_period", "value")
+    }
+    changed = {data_period for indicator_id, data_period in stored if indicator_id not in indicator_ids}
+    for key, data_obj in data_objects.items():
+        if values_differ(stored.get(key), data_obj.value):
+            changed.add(key[1])
+    return changed
+
+
+def import_geography_data(rows, indicators, g_code, changes=None):
+    """Import the rows of one geography.
+
+    Args:
+        rows (pd.DataFrame): The geography's rows of the state data.
+        indicators (list[Indicators]): The indicators to import.
+        g_code (str): Code of the geography.
+        changes (list, optional): When given, only the (geography code,
+        data period) slices whose values differ from the stored ones are
+        written, and they are appended to this list. Defaults to None.
+
+    Returns:
+        Counter: `Data` rows inserted, updated and deleted.
+    """
     if rows.empty:
-        print(f"No entries in the state for geography code: {g_code}")
-        return
+        logger.warning("No entries in the state for geography code: %s", g_code)
+        return Counter()
     try:
         geography_obj = Geography.objects.get(Q(code=g_code), ~Q(type="STATE"))
     except Exception as e:
-        print(f"Geography location for: {g_code} is missing")
+        logger.warning("Geography location for: %s is missing", g_code)
+        return Counter()
     else:
-        print(f"Updating datapoints for: {geography_obj.name}")
-        for row in rows.itertuples():
-            if Data.objects.filter(geography__code=geography_obj.code, data_period=row.timeperiod).count():
-                Data.objects.filter(geography__code=geography_obj.code, data_period=row.timeperiod).all().delete()
-        for index, row in rows.iterrows():
-            data_objects = []
-            for indicator in indicators:
-                if indicator.slug in df.columns:
-                    data_objects.append(addDataRow(row, geography_obj, indicator))
-                else:
-                    print(f"Indicator {indicator.slug} missing for {geography_obj.name}")
-            Data.objects.bulk_create(data_objects)
-        updated_data_count = Data.objects.filter(
-            geography__code=geography_obj.code).count()
-
-
-def import_state_data(df, indicators, g_code=None):
+        logger.debug("Updating datapoints for: %s", geography_obj.name)
+        imported = [indicator for indicator in indicators if indicator.slug in rows.columns]
+        for indicator in indicators:
+            if indicator.slug not in rows.columns:
+                logger.debug("Indicator %s missing for %s", indicator.slug, geography_obj.name)
+        # Keyed by the unique key, so a period repeated in the file is
+        # written once (its last row wins).
+        data_objects = {}
+        row_periods = rows["timeperiod"].tolist()
+        for indicator in imported:
+            for period, value in zip(row_periods, rows[indicator.slug].tolist()):
+                data_objects[(indicator.id, period)] = Data(
+                    value=value,
+                    indicator=indicator,
+                    geography=geography_obj,
+                    data_period=period,
+                )
+        periods = list(dict.fromkeys(row_periods))
+        if changes is not None:
+            changed = changed_periods(geography_obj, periods, imported, data_objects)
+            periods = [period for period in periods if period in changed]
+            if not periods:
+                return Counter()
+            data_objects = {key: data_obj for key, data_obj in data_objects.items() if key[1] in changed}
+            changes.extend((geography_obj.code, period) for period in periods)
+        # Every imported indicator has a value for every period, so the
+        # stored rows of these are the ones the upsert updates.
+        updated = Data.objects.filter(
+            geography=geography_obj, data_period__in=periods, indicator__in=imported
+        ).count()
+        upsert_data(list(data_objects.values()))
+        # Values of indicators no longer in the file are removed, as before
+        # when a geography's periods were replaced as a whole. Rolled-up
+        # values are left to the rollup phase.
+        deleted, _ = Data.objects.filter(
+            geography=geography_obj, data_period__in=periods, is_rollup=False
+        ).exclude(indicator__in=imported).delete()
+        refresh_region_data([geography_obj.id], periods)
+        return Counter(inserted=len(data_objects) - updated, updated=updated, deleted=deleted)
+
+
+def import_state_data(df, indicators, g_code=None, changes=None):
+    """Import the rows of a state's data file.
+
+    Returns:
+        Counter: `Data` rows inserted, updated and deleted.
+    """
     if g_code:
-        import_geography_data(df, indicators, g_code)
+        return import_geography_data(df[df.index == g_code], indicators, g_code, changes)
     else:
-        [import_geography_data(df, indicators, g_code)
-         for g_code in df.index.unique()]
+        return sum([import_geography_data(rows, indicators, g_code, changes)
+                    for g_code, rows in df.groupby(level=0, sort=False)], Counter())
 
 
 def filter_indicators(df, indicators):
     cleaned_indicator = [ind for ind in indicators if ind.slug in df.columns]
     if missing := [ind.slug for ind in indicators if ind.slug not in df.columns]:
-        print(f"Indicators: {', '.join(missing)} missing")
+        logger.warning("Indicators: %s missing", ", ".join(missing))
     return cleaned_indicator
 
 
-def update_data(state, district):
+def read_arrow_chunks(filename, dtype, chunksize):
+    """Stream a CSV file with pyarrow, as DataFrames of about `chunksize` rows."""
+    try:
+        import pyarrow as pa
+        from pyarrow import csv
+    except ImportError:
+        raise CommandError("The pyarrow engine needs the pyarrow package installed.")
+    column_types = {
+        column: pa.string() if column_type is str else pa.float64()
+        for column, column_type in dtype.items()
+    }
+    reader = csv.open_csv(
+        filename,
+        convert_options=csv.ConvertOptions(include_columns=list(dtype), column_types=column_types),
+    )
+    batches = []
+    rows = 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunksize:
+            yield pa.Table.from_batches(batches).to_pandas().set_index("object-id")
+            batches = []
+            rows = 0
+    if batches:
+        yield pa.Table.from_batches(batches).to_pandas().set_index("object-id")
+
+
+def read_state_data(filename, indicators, chunksize=DATA_CHUNK_SIZE, engine="c"):
+    """Read a state data file in chunks of `chunksize` rows.
+
+    Only the geography code, period and indicator columns are loaded, with
+    indicator values as float64, so memory use depends on the chunk size
+    and not on the file size.
+
+    Args:
+        filename (str): Path of the `*_data.csv` file.
+        indicators (list[Indicators]): Indicators with a column in the file.
+        chunksize (int): Rows per chunk.
+        engine (str): "c" for the pandas parser, "pyarrow" for pyarrow's
+        multithreaded reader.
+
+    Yields:
+        pd.DataFrame: The chunks, indexed by geography code.
+    """
+    dtype = {"object-id": str, "timeperiod": str}
+    dtype.update({indicator.slug: "float64" for indicator in indicators})
+    if engine == "pyarrow":
+        yield from read_arrow_chunks(filename, dtype, chunksize)
+        return
+    try:
+        yield from pd.read_csv(
+            filename, index_col="object-id", usecols=list(dtype), dtype=dtype, chunksize=chunksize
+        )
+    except ValueError as e:
+        raise CommandError(f"Failed to read {filename}: {e}")
+
+
+def import_state_file(filename, state, district=None, changes=None, chunksize=DATA_CHUNK_SIZE, engine="c"):
+    """Import a state data file chunk by chunk.
+
+    Returns:
+        dict: `Data` rows inserted, updated and deleted.
+    """
+    logger.info("Importing data for %s from %s", state, os.path.basename(filename))
+    indicators = [
+        indicator for indicator in Indicators.objects.filter(is_visible=True, geography__name__iexact=state)]
+    indicators = filter_indicators(pd.read_csv(filename, nrows=0), indicators)
+    counts = Counter()
+    for df in read_state_data(filename, indicators, chunksize, engine):
+        if district:
+            if district in df.index:
+                counts += import_state_data(df, indicators, district, changes)
+        else:
+            counts += import_state_data(df, indicators, changes=changes)
+    IMPORT_ROWS.inc(counts["inserted"] + counts["updated"], state=state.lower())
+    logger.info(
+        "Imported %s: %d inserted, %d updated, %d deleted",
+        state, counts["inserted"], counts["updated"], counts["deleted"],
+    )
+    return {operation: counts[operation] for operation in ["inserted", "updated", "deleted"]}
+
+
+def update_data(state, district, changes=None, chunksize=DATA_CHUNK_SIZE, engine="c") -> dict:
+    """Import the data files of one or all states.
+
+    Returns:
+        dict: `Data` rows inserted, updated and deleted by state name, as
+        in the state's Geography (e.g. "himachal pradesh").
+    """
     files = glob.glob(os.getcwd() + "/layer/assets/data/*_data.csv")
     if state:
-        indicators = [
-            indicator for indicator in Indicators.objects.filter(is_visible=True, geography__name__iexact=state)]
-        files = glob.glob(os.getcwd() + "/layer/assets/data/*_data.csv")
         state_files = [
             filename for filename in files if state.lower() in filename.lower()]
         if not state_files:
             raise CommandError(
                 f"Data file for state {state} missing.")
-        filename = state_files[0]
-        df = pd.read_csv(filename, index_col="object-id",
-                         dtype={"object-id": str, "sdtcode11": str, "objectid": str})
-        if district:
-            import_state_data(df, filter_indicators(df, indicators), district)
-        else:
-            import_state_data(df, filter_indicators(df, indicators))
+        # The file name has underscores, the state's Geography name spaces.
+        state = state.replace("_", " ")
+        return {state: import_state_file(state_files[0], state, district, changes, chunksize, engine)}
     else:
+        row_counts = {}
         for filename in files:
-            df = pd.read_csv(filename, index_col="object-id",
-                             dtype={"object-id": str, "sdtcode11": str, "objectid": str})
             state = filename.split('/')[-1].replace("_data.csv", "")
             state = state.replace("_", " ")
-            print(state)
-            indicators = [
-                indicator for indicator in Indicators.objects.filter(is_visible=True, geography__name__iexact=state)]
-            import_state_data(df, filter_indicators(df, indicators))
+            row_counts[state] = import_state_file(
+                filename, state, changes=changes, chunksize=chunksize, engine=engine
+            )
+        return row_counts
+
 
+def derived_indicator(state, slug, definition) -> Indicators:
+    """Return a state's indicator for a DERIVED_INDICATORS entry, creating it if missing.
 
+    New derived indicators are hidden; make them visible in the admin.
+    """
+    try:
+        return Indicators.objects.get(slug=slug, geography=state)
+    except Indicators.DoesNotExist:
+        unit = definition.get("unit")
+        indicator = Indicators(
+            name=definition["name"],
+            slug=slug,
+            long_description=definition.get("description"),
+            type="Derived",
+            unit=Unit.objects.get_or_create(name=unit)[0] if unit else None,
+            geography=state,
+            is_visible=False,
+        )
+        indicator.save()
+        logger.info("Added derived indicator %s for %s", slug, state.name)
+        return indicator
+
+
+def store_indicator_values(indicator, values, refresh=True) -> int:
+    """Store computed values of an indicator as `Data`.
+
+    Args:
+        indicator (Indicators): The indicator.
+        values (pd.Series): Values by (geography_id, data_period). Stored
+        values of NaN entries are removed.
+        refresh (bool): Refresh the region read model of the values if the
+        indicator is visible.
+
+    Returns:
+        int: Number of values written.
+    """
+    present = values.dropna()
+    upsert_data([
+        Data(indicator=indicator, geography_id=int(geography_id), data_period=data_period, value=value)
+        for (geography_id, data_period), value in present.items()
+    ])
+    for data_period, missing in values[values.isna()].groupby(level="data_period"):
+        Data.objects.filter(
+            indicator=indicator,
+            data_period=data_period,
+            geography_id__in=missing.index.get_level_values("geography_id").tolist(),
+        ).delete()
+    if refresh and indicator.is_visible:
+        refresh_region_data(
+            values.index.unique("geography_id").tolist(), values.index.unique("data_period").tolist()
+        )
+    return len(present)
+
+
+def import_derived_indicators(state) -> int:
+    """Compute a state's derived indicators (see layer.derived) and store them as `Data`.
+
+    Values that can't be derived, e.g. because an input is missing, are
+    removed.
+
+    Returns:
+        int: Number of values written.
+    """
+    written = 0
+    for slug, values in derive_values(state).items():
+        indicator = derived_indicator(state, slug, DERIVED_INDICATORS[slug])
+        count = store_indicator_values(indicator, values)
+        logger.info("Derived %d values of %s for %s", count, slug, state.name)
+        written += count
+    return written
+
+
+# Indicator fields written from the indicator files.
+INDICATOR_FIELDS = [
+    "name",
+    "long_description",
+    "category",
+    "unit",
+    "data_source",
+    "parent",
+    "is_visible",
+    "display_order",
+    "aggregation",
+]
+
+
+def get_units(rows) -> dict:
+    """Return the units named in indicator rows by name, creating the missing ones."""
+    names = {
+        unit.lower() for unit in (getattr(row, 'unit', None) for row in rows)
+        if unit and not isinstance(unit, float)
+    }
+    if names:
+        Unit.objects.bulk_create([Unit(name=name) for name in names], ignore_conflicts=True)
+    return {unit.name: unit for unit in Unit.objects.filter(name__in=names)}
+
+
+def get_aggregation(row, slug):
+    """Return the rollup rule of an indicator row (see layer.rollup), if it has a known one."""
+    aggregation = getattr(row, 'aggregation', None)
+    if not aggregation or isinstance(aggregation, float):
+        return None
+    aggregation = aggregation.strip().lower()
+    if aggregation not in Indicators.Aggregation.values:
+        logger.warning("Unknown aggregation %s of indicator %s", aggregation, slug)
+        return None
+    return aggregation
+
+
+@transaction.atomic
 def import_state_indicators(df: pd.DataFrame, state: Geography):
-    for row in df.itertuples(index=False):
+    """Create or update a state's indicators from its indicator file.
+
+    Units and parents are resolved from in-memory maps and the indicators
+    are written with one bulk_create and one bulk_update. As with
+    `Indicators.save()`, the display order follows the file's rows, after
+    all existing indicators.
+
+    Args:
+        df (pd.DataFrame): Rows of the state's `*_indicators.csv` file.
+        state (Geography): The state the indicators belong to.
+
+    Returns:
+        bool: Whether the fields the region rows copy changed (see
+        layer.region_data.indicator_layout).
+    """
+    layout = indicator_layout(state)
+    rows = list(df.rename(columns={"District Level Aggregation": "aggregation"}).itertuples(index=False))
+    units = get_units(rows)
+    by_slug = {indicator.slug: indicator for indicator in Indicators.objects.filter(geography=state)}
+    display_order = Indicators.objects.aggregate(order=Max("display_order"))["order"] or 0
+    new_indicators = []
+    parent_names = {}
+    for row in rows:
+        name = str(getattr(row, 'indicatorTitle', '')).strip()
         indicator_slug = getattr(row, 'indicatorSlug', '')
-        print("Processing Indicator -", indicator_slug)
-        try:
-            indicator = Indicators.objects.get(slug=indicator_slug.lower(), geography=state)
-            print("Already Exists! Updating")
-            indicator.name = str(getattr(row, 'indicatorTitle', '')).strip()
-            indicator.long_description = str(getattr(row, 'indicatorDescription', '')).strip() or None
-            indicator.category = str(getattr(row, 'indicatorCategory', '')).strip() or None
-            indicator.unit = _get_indicator_unit_form_row(row)
-            indicator.data_source = str(getattr(row, 'datasource', '')).strip() or None
-            indicator.parent = _get_indicator_parent_from_row(row, state)
-            indicator.is_visible = str(getattr(row, 'visible_on_platform', '')) == "y"
-            indicator.save()
-            print("updated Indicator -", row.indicatorSlug)
-        except Indicators.DoesNotExist:
-            unit = getattr(row, 'unit', '')
-            print("Processing Unit -", unit)
-            unit_obj = _get_indicator_unit_form_row(row)
-            parent_obj = _get_indicator_parent_from_row(row, state)
-
-            indicator_obj = Indicators(
-                name=str(getattr(row, 'indicatorTitle', '')).strip(),
-                slug=str(indicator_slug).lower().strip() if indicator_slug else None,
-                long_description=str(getattr(row, 'indicatorDescription', '')).strip() or None,
-                category=str(getattr(row, 'indicatorCategory', '')).strip() or None,
-                unit=unit_obj,
-                data_source=str(getattr(row, 'datasource', '')).strip() or None,
-                parent=parent_obj,
-                is_visible=str(getattr(row, 'visible_on_platform', '')) == "y",
-                geography=state
-            )
-            indicator_obj.save()
-            print("Added indicator to the database.")
+        slug = str(indicator_slug).lower().strip() if indicator_slug else slugify(name)
+        indicator = by_slug.get(slug)
+        if indicator is None:
+            indicator = Indicators(slug=slug, geography=state)
+            by_slug[slug] = indicator
+            new_indicators.append(indicator)
+        display_order += 1
+        unit = getattr(row, 'unit', None)
+        parent = getattr(row, 'parent', None)
+        indicator.name = name
+        indicator.long_description = str(getattr(row, 'indicatorDescription', '')).strip() or None
+        indicator.category = str(getattr(row, 'indicatorCategory', '')).strip() or None
+        indicator.unit = units[unit.lower()] if unit and not isinstance(unit, float) else None
+        indicator.data_source = str(getattr(row, 'datasource', '')).strip() or None
+        indicator.is_visible = str(getattr(row, 'visible_on_platform', '')) == "y"
+        indicator.display_order = display_order
+        indicator.aggregation = get_aggregation(row, slug)
+        parent_names[slug] = parent.strip() if parent and not isinstance(parent, float) else None
+
+    Indicators.objects.bulk_create(new_indicators)
+    # Parents are matched by name among all of the state's indicators, so
+    # they may also come later in the file.
+    by_name = {indicator.name: indicator for indicator in by_slug.values()}
+    for slug, parent_name in parent_names.items():
+        indicator = by_slug[slug]
+        indicator.parent = by_name.get(parent_name) if parent_name else None
+        if parent_name and indicator.parent is None:
+            logger.warning("Failed to get the parent indicator for %s", slug)
+    Indicators.objects.bulk_update(
+        [by_slug[slug] for slug in parent_names], INDICATOR_FIELDS, batch_size=500
+    )
+    logger.info(
+        "Added %d and updated %d indicators for %s",
+        len(new_indicators), len(parent_names) - len(new_indicators), state.name,
+    )
+    return indicator_layout(state) != layout
+
+
+class ImportRunLog(logging.Handler):
+    """Collects the warnings and errors logged during an import for its `ImportRun`."""
+
+    def __init__(self, limit=1000):
+        super().__init__(logging.WARNING)
+        self.limit = limit
+        self.messages = []
+
+    def emit(self, record):
+        if len(self.messages) < self.limit:
+            self.messages.append(self.format(record))
+
+
+@contextmanager
+def import_phase(run, phase):
+    """Time a phase of the import for the metrics and the `ImportRun`."""
+    start = time.perf_counter()
+    try:
+        with IMPORT_PHASE_SECONDS.time(phase=phase):
+            yield
+    finally:
+        run.phases[phase] = round(time.perf_counter() - start, 3)
+        logger.info("Phase %s took %.1fs", phase, run.phases[phase])
+
+
+def report_changes(changes, changes_file=None):
+    """Print the changed (geography code, data period) slices of a diff import.
+
+    Args:
+        changes (list[tuple]): The changed slices.
+        changes_file (str, optional): Also write them to this file as JSON.
+    """
+    # A slice split over several chunks of the file is reported once.
+    changes = list(dict.fromkeys(changes))
+    for code, period in changes:
+        logger.info("Changed: %s %s", code, period)
+    logger.info("%d geography/period slices changed", len(changes))
+    if changes_file:
+        with open(changes_file, "w") as f:
+            json.dump([{"geography": code, "dataPeriod": period} for code, period in changes], f, indent=2)
+
+
+def import_indicator_file(filename, state):
+    """Import a state's indicator file.
+
+    `--diff` imports only refresh the region rows of changed data, so when
+    the indicators the region rows copy change, all the state's rows are
+    rebuilt here.
+    """
+    state_geo = Geography.objects.get(name__iexact=state, type="STATE")
+    if import_state_indicators(pd.read_csv(filename), state_geo):
+        written = rebuild_state_region_data(state_geo)
+        logger.info("Indicators changed, rebuilt %d region rows for %s", written, state_geo.name)
 
 
 def update_indicators(state):
@@ -363,18 +687,11 @@ def update_indicators(state):
         state_files = [filename for filename in files if state.lower() in filename.lower()]
         if not state_files:
             raise CommandError(f"Indicator file for state {state} missing.")
-        filename = state_files[0]
-        df = pd.read_csv(filename)
-        state = state.replace("_", " ")
-        state_geo = Geography.objects.get(name__iexact=state, type="STATE")
-        import_state_indicators(df, state_geo)
+        import_indicator_file(state_files[0], state.replace("_", " "))
     else:
         for filename in files:
-            df = pd.read_csv(filename)
             state = filename.split('/')[-1].replace("_indicators.csv", "")
-            state = state.replace("_", " ")
-            state_geo = Geography.objects.get(name__iexact=state, type="STATE")
-            import_state_indicators(df, state_geo)
+            import_indicator_file(filename, state.replace("_", " "))
 
 
 class Command(BaseCommand):
@@ -400,6 +717,27 @@ class Command(BaseCommand):
             "--district",
             help="District code to import the data",
         )
+        parser.add_argument(
+            "--diff",
+            action="store_true",
+            help="Only write geography/period slices whose values changed, and list them",
+        )
+        parser.add_argument(
+            "--changes-file",
+            help="With --diff, also write the changed slices to this JSON file",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DATA_CHUNK_SIZE,
+            help="Rows of a data file read at a time",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=["c", "pyarrow"],
+            default="c",
+            help="CSV parser for the data files; pyarrow needs the pyarrow package",
+        )
 
     def handle(self, *args, **options):
         """
@@ -409,12 +747,26 @@ class Command(BaseCommand):
         1. Migrates geojson data
         2. Migrates indicators
         3. Imports state and/or district data from CSV files
+        4. Rolls up the imported states' values to their districts and the
+           state (see layer.rollup)
+        5. Computes the derived indicators of the imported states
+        6. Writes a new data cube, if the cube engine is enabled
+
+        Each run is recorded as an `ImportRun` with its phase timings, row
+        counts per state and the warnings and errors it logged.
+
+        With `diff`, unchanged slices are skipped, and the cube and tile
+        cache are left alone when no data changed.
 
         Args:
             *args: Variable length argument list.
             **options: Arbitrary keyword arguments. Expected keys are:
                 - state (str, optional): The name of the state to import data for.
                 - district (str, optional): The district code to import data for.
+                - diff (bool): Only write changed geography/period slices.
+                - changes_file (str, optional): Where to write the changed slices.
+                - chunk_size (int): Rows of a data file read at a time.
+                - engine (str): CSV parser for the data files, "c" or "pyarrow".
 
         Raises:
             CommandError: If the data file for the specified state is missing.
@@ -422,9 +774,58 @@ class Command(BaseCommand):
         Returns:
             None
         """
-        migrate_geojson()
-        # migrate_indicators()
         state = options.get("state", None)
         district = options.get("district", None)
-        update_indicators(state)
-        update_data(state, district)
+        verbosity = options.get("verbosity", 1)
+        if verbosity != 1:
+            logger.setLevel(logging.WARNING if verbosity == 0 else logging.DEBUG)
+        run = ImportRun.objects.create(
+            options={
+                "state": state,
+                "district": district,
+                "diff": bool(options.get("diff")),
+                "engine": options.get("engine"),
+            }
+        )
+        log = ImportRunLog()
+        logger.addHandler(log)
+        try:
+            with import_phase(run, "geojson"):
+                migrate_geojson()
+            with import_phase(run, "indicators"):
+                update_indicators(state)
+            changes = [] if options.get("diff") else None
+            with import_phase(run, "data"):
+                run.rows = update_data(state, district, changes, options["chunk_size"], options["engine"])
+            if changes is not None:
+                report_changes(changes, options.get("changes_file"))
+            if changes is None or changes:
+                with import_phase(run, "rollup"):
+                    rollup_periods = sorted({period for _, period in changes}) if changes else None
+                    for state_name in run.rows:
+                        state_obj = Geography.objects.get(name__iexact=state_name, type="STATE")
+                        written = rollup_state(state_obj, rollup_periods)
+                        logger.info("Rolled up %d values for %s", written, state_obj.name)
+                with import_phase(run, "derived"):
+                    for state_name in run.rows:
+                        import_derived_indicators(
+                            Geography.objects.get(name__iexact=state_name, type="STATE")
+                        )
+                if DATA_ENGINE == "cube":
+                    with import_phase(run, "cube"):
+                        write_cube()
+                clear_tile_cache()
+            bump_data_version()
+        except Exception:
+            run.status = ImportRun.Status.FAILED
+            logger.exception("Import failed")
+            raise
+        else:
+            run.status = ImportRun.Status.SUCCEEDED
+        finally:
+            logger.removeHandler(log)
+            run.errors = log.messages
+            run.finished = timezone.now()
+            run.save()
+            write_import_metrics()
+            logger.info("Import run %s %s", run.id, run.status.lower())
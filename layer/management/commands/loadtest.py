@@ -0,0 +1,192 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_SCENARIO = "layer/assets/loadtest/dashboard_mix.json"
+
+
+def fill_template(value, variables):
+    """Replace "{name}" placeholders in strings nested anywhere in `value`."""
+    if isinstance(value, str):
+        return value.format_map(variables)
+    if isinstance(value, list):
+        return [fill_template(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {key: fill_template(item, variables) for key, item in value.items()}
+    return value
+
+
+def sample_variables(variables, rng):
+    """Pick one value for every variable given as a list of choices."""
+    return {
+        name: rng.choice(value) if isinstance(value, list) else value
+        for name, value in variables.items()
+    }
+
+
+def build_request(operation, variables):
+    """Return the `(method, path, kwargs)` of one request for an operation.
+
+    Operations with a `query` are GraphQL POSTs to /graphql, the others are
+    plain requests to `path` with `params`.
+    """
+    if "query" in operation:
+        payload = {
+            "query": operation["query"],
+            "variables": fill_template(operation.get("variables", {}), variables),
+        }
+        return "POST", operation.get("path", "/graphql"), {"json": payload}
+    params = fill_template(operation.get("params", {}), variables)
+    return operation.get("method", "GET"), operation["path"], {"params": params}
+
+
+def is_error(operation, response):
+    if response.status_code >= 400:
+        return True
+    if "query" in operation:
+        try:
+            return bool(response.json().get("errors"))
+        except ValueError:
+            return True
+    return False
+
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles and error rate per operation and overall."""
+    summary = {}
+    groups = dict(results)
+    groups["total"] = [sample for samples in results.values() for sample in samples]
+    for name, samples in groups.items():
+        if not samples:
+            continue
+        latencies = np.array([latency for latency, _ in samples]) * 1000
+        errors = sum(1 for _, error in samples if error)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[name] = {
+            "requests": len(samples),
+            "errors": errors,
+            "errorRate": round(errors / len(samples), 4),
+            "throughput": round(len(samples) / elapsed, 2),
+            "meanMs": round(float(latencies.mean()), 2),
+            "p50Ms": round(float(p50), 2),
+            "p95Ms": round(float(p95), 2),
+            "p99Ms": round(float(p99), 2),
+            "maxMs": round(float(latencies.max()), 2),
+        }
+    return summary
+
+
+class LoadTest:
+    def __init__(self, scenario, seed=None):
+        self.scenario = scenario
+        self.operations = scenario["operations"]
+        self.weights = [operation.get("weight", 1) for operation in self.operations]
+        self.rng = random.Random(seed)
+        self.results = defaultdict(list)
+
+    async def user(self, client, start_delay, deadline):
+        """One simulated user sending requests until the deadline."""
+        await asyncio.sleep(start_delay)
+        think_min, think_max = self.scenario.get("think_time", [0, 0])
+        while time.monotonic() < deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            variables = sample_variables(self.scenario.get("variables", {}), self.rng)
+            method, path, kwargs = build_request(operation, variables)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                error = is_error(operation, response)
+            except httpx.HTTPError:
+                error = True
+            self.results[operation["name"]].append((time.perf_counter() - start, error))
+            await asyncio.sleep(self.rng.uniform(think_min, think_max))
+
+    async def run(self):
+        users = self.scenario["users"]
+        duration = self.scenario["duration"]
+        ramp_up = self.scenario.get("ramp_up", 0)
+        async with httpx.AsyncClient(
+            base_url=self.scenario["base_url"],
+            headers=self.scenario.get("headers", {}),
+            timeout=self.scenario.get("timeout", 60),
+            limits=httpx.Limits(max_connections=users),
+        ) as client:
+            start = time.monotonic()
+            deadline = start + ramp_up + duration
+            await asyncio.gather(
+                *(
+                    self.user(client, ramp_up * i / users, deadline)
+                    for i in range(users)
+                )
+            )
+            elapsed = time.monotonic() - start
+        return summarize(self.results, elapsed), elapsed
+
+
+class Command(BaseCommand):
+    """
+    Replay a weighted mix of dashboard requests against a running server.
+
+    The scenario file (JSON) sets the server, the number of concurrent users,
+    how long they run, their think time and the operations with their
+    weights. String values may contain "{variable}" placeholders; variables
+    given as lists are sampled per request. Reports requests, throughput
+    (requests/s), latency percentiles and the error rate per operation.
+    """
+
+    help = "Load test a running server with the request mix of a scenario file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="Scenario JSON file")
+        parser.add_argument("--base-url", help="Override the scenario's base_url")
+        parser.add_argument("--users", type=int, help="Override the number of concurrent users")
+        parser.add_argument("--duration", type=float, help="Override the duration in seconds")
+        parser.add_argument("--seed", type=int, help="Random seed for the request mix")
+        parser.add_argument("--output", help="Write the JSON results to this file")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["scenario"]) as f:
+                scenario = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read scenario {options['scenario']}: {e}")
+        for key, option in (("base_url", "base_url"), ("users", "users"), ("duration", "duration")):
+            if options[option] is not None:
+                scenario[key] = options[option]
+
+        self.stderr.write(
+            f"{scenario['users']} users for {scenario['duration']}s "
+            f"(+{scenario.get('ramp_up', 0)}s ramp up) against {scenario['base_url']}"
+        )
+        summary, elapsed = asyncio.run(LoadTest(scenario, options["seed"]).run())
+
+        self.stdout.write(
+            f"{'operation':<22}{'requests':>9}{'req/s':>9}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+        )
+        for name, stats in summary.items():
+            self.stdout.write(
+                f"{name:<22}{stats['requests']:>9}{stats['throughput']:>9.2f}"
+                f"{stats['p50Ms']:>10.1f}{stats['p95Ms']:>10.1f}{stats['p99Ms']:>10.1f}"
+                f"{stats['errorRate']:>9.1%}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(
+                    {
+                        "scenario": options["scenario"],
+                        "users": scenario["users"],
+                        "duration": scenario["duration"],
+                        "elapsed": round(elapsed, 2),
+                        "operations": summary,
+                    },
+                    f,
+                    indent=2,
+                )
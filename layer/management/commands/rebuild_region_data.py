@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from layer.cache import bump_data_version
+from layer.region_data import rebuild_region_data
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the per-region read model (see layer.region_data) from `Data`.
+
+    import_data keeps the read model up to date for the data it imports; run
+    this to fill it the first time, or after changing data or indicators any
+    other way, e.g. generate_synthetic_data or the admin.
+    """
+
+    help = "Rebuild the RegionData read model from the Data table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=200, help="Geographies per refresh"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            written = rebuild_region_data(options["batch_size"])
+        bump_data_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} region rows in {time.perf_counter() - start:.2f}s."
+            )
+        )
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from D4D_ContextLayer.settings import DATA_ENGINE
+from layer.cache import bump_data_version
+from layer.cube import write_cube
+from layer.models import Geography
+from layer.rollup import rollup_state
+from layer.tiles import clear_tile_cache
+
+
+class Command(BaseCommand):
+    """
+    Roll up the values of child geographies to their districts and state
+    (see layer.rollup).
+
+    import_data rolls up the states it imports; run this to fill the
+    rollups the first time, or after changing an indicator's aggregation.
+    """
+
+    help = "Recompute the rolled-up district and state values of all or one state."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--state", help="Name of the state, defaults to all states")
+        parser.add_argument(
+            "--period",
+            nargs="+",
+            help="Only roll up these data periods (YYYY_MM)",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        states = Geography.objects.filter(type="STATE")
+        if options["state"]:
+            states = states.filter(name__iexact=options["state"])
+            if not states:
+                raise CommandError(f"State {options['state']} not found.")
+        written = 0
+        with transaction.atomic():
+            for state in states:
+                written += rollup_state(state, options["period"])
+        if DATA_ENGINE == "cube":
+            write_cube()
+        bump_data_version()
+        clear_tile_cache()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} rolled-up values in {time.perf_counter() - start:.2f}s."
+            )
+        )
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries, transaction
+from django.db.models import Q
+from django.test import RequestFactory
+
+from layer.encoders import dumps
+from layer.management.commands.import_data import import_state_file
+from layer.models import Data, Geography, Indicators
+from layer.tracing import track_queries
+
+"""
+
+Benchmarks of every Query field, /report and the data import, for comparing
+commits: run against the same dataset (see generate_synthetic_data) and
+pass the previous results with --compare.
+
+"""
+
+BENCHMARK_QUERIES = {
+    "getStates": ("query { getStates }", lambda ctx: {}),
+    "indicators": ("query { indicators }", lambda ctx: {}),
+    "indicatorsByCategory": (
+        "query ($state: String) { indicatorsByCategory(stateCode: $state) }",
+        lambda ctx: {"state": ctx["state"]},
+    ),
+    "getDataTimePeriods": ("query { getDataTimePeriods { value } }", lambda ctx: {}),
+    "getDistrictRevCircle": (
+        "query ($geo: GeoFilter!) { getDistrictRevCircle(geoFilter: $geo) }",
+        lambda ctx: {"geo": {"code": [ctx["state"]], "type": "district"}},
+    ),
+    "districtViewData": (
+        "query ($indc: IndicatorFilter!, $data: DataFilter!, $geo: GeoFilter!) "
+        "{ districtViewData(indcFilter: $indc, dataFilter: $data, geoFilter: $geo) }",
+        lambda ctx: {
+            "indc": {"slug": ctx["indicator"]},
+            "data": {"dataPeriod": ctx["period"]},
+            "geo": {"code": [ctx["state"]]},
+        },
+    ),
+    "tableData": (
+        "query ($indc: IndicatorFilter, $data: DataFilter, $geo: GeoFilter) "
+        "{ tableData(indcFilter: $indc, dataFilter: $data, geoFilter: $geo) }",
+        lambda ctx: {
+            "indc": {"slug": ctx["indicator"]},
+            "data": {"dataPeriod": ctx["period"]},
+            "geo": {"code": [ctx["state"]]},
+        },
+    ),
+    "districtMapData": (
+        "query ($indc: IndicatorFilter!, $data: DataFilter!, $geo: GeoFilter) "
+        "{ districtMapData(indcFilter: $indc, dataFilter: $data, geoFilter: $geo) }",
+        lambda ctx: {
+            "indc": {"slug": ctx["indicator"]},
+            "data": {"dataPeriod": ctx["period"]},
+            "geo": {"code": [ctx["state"]]},
+        },
+    ),
+    "getTimeTrends": (
+        "query ($indc: IndicatorFilter!, $data: DataFilter!, $geo: GeoFilter!) "
+        "{ getTimeTrends(indcFilter: $indc, dataFilter: $data, geoFilter: $geo) }",
+        lambda ctx: {
+            "indc": {"slug": ctx["indicator"]},
+            "data": {"dataPeriod": ctx["period"], "period": "1Y"},
+            "geo": {"code": [ctx["state"]]},
+        },
+    ),
+    "revCircleViewData": (
+        "query ($indc: IndicatorFilter!, $data: DataFilter!, $geo: GeoFilter) "
+        "{ revCircleViewData(indcFilter: $indc, dataFilter: $data, geoFilter: $geo) }",
+        lambda ctx: {
+            "indc": {"slug": ctx["indicator"]},
+            "data": {"dataPeriod": ctx["period"]},
+            "geo": {"code": ctx["subdistricts"]},
+        },
+    ),
+    "revCircleMapData": (
+        "query ($indc: IndicatorFilter!, $data: DataFilter!, $geo: GeoFilter) "
+        "{ revCircleMapData(indcFilter: $indc, dataFilter: $data, geoFilter: $geo) }",
+        lambda ctx: {
+            "indc": {"slug": ctx["indicator"]},
+            "data": {"dataPeriod": ctx["period"]},
+            "geo": {"code": [ctx["state"]]},
+        },
+    ),
+}
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    p95_index = min(len(durations) - 1, round(0.95 * (len(durations) - 1)))
+    return {
+        "minMs": round(min(durations) * 1000, 3),
+        "medianMs": round(statistics.median(durations) * 1000, 3),
+        "meanMs": round(statistics.fmean(durations) * 1000, 3),
+        "p95Ms": round(durations[p95_index] * 1000, 3),
+        "maxMs": round(max(durations) * 1000, 3),
+    }
+
+
+def run_benchmark(name, kind, fn, repeat, warmup):
+    """Call `fn` `warmup + repeat` times and time the last `repeat` calls.
+
+    `fn` returns the size of its output in bytes (or None).
+
+    Returns:
+        dict: Timing summary with query count and DB time of the last call,
+        or the error if `fn` failed.
+    """
+    durations = []
+    try:
+        for i in range(warmup + repeat):
+            reset_queries()
+            with track_queries(name) as stats:
+                start = time.perf_counter()
+                size = fn()
+                duration = time.perf_counter() - start
+            if i >= warmup:
+                durations.append(duration)
+    except Exception as e:
+        return {"name": name, "kind": kind, "error": f"{type(e).__name__}: {e}"}
+    return {
+        "name": name,
+        "kind": kind,
+        "runs": len(durations),
+        **summarize(durations),
+        "queries": stats.query_count,
+        "dbMs": round(stats.db_time * 1000, 3),
+        "bytes": size,
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def import_frame(state):
+    """The state's data in the shape of a `*_data.csv` file, for re-importing it."""
+    rows = Data.objects.filter(
+        Q(geography__parentId=state) | Q(geography__parentId__parentId=state)
+    ).values_list("geography__code", "data_period", "indicator__slug", "value")
+    df = pd.DataFrame.from_records(
+        rows, columns=["object-id", "timeperiod", "indicator", "value"]
+    )
+    return df.pivot_table(
+        index=["object-id", "timeperiod"], columns="indicator", values="value"
+    ).reset_index(level="timeperiod")
+
+
+class Command(BaseCommand):
+    """
+    Benchmark every Query field, /report and the data import and emit JSON.
+
+    Each benchmark is run `--warmup` times untimed and `--repeat` times timed
+    against the current database. Results include min/median/mean/p95/max
+    latency, the SQL query count and DB time of a run, and the response size.
+    """
+
+    help = "Run the API, report and import benchmarks and print the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--state", help="State code to benchmark (default: first state)")
+        parser.add_argument("--period", help="Data period (default: latest for the state)")
+        parser.add_argument("--indicator", default="risk-score", help="Indicator slug")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+        parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per benchmark")
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            help="Benchmarks to run, e.g. tableData report import",
+        )
+        parser.add_argument("--async", dest="use_async", action="store_true",
+                            help="Execute queries with the async schema")
+        parser.add_argument("--skip-report", action="store_true",
+                            help="Skip /report, which fetches charts over the network")
+        parser.add_argument("--output", help="Write the JSON results to this file")
+        parser.add_argument("--compare", help="Previous results file to compare medians with")
+
+    def get_context(self, options):
+        states = Geography.objects.filter(type="STATE").order_by("code")
+        state = states.filter(code=options["state"]).first() if options["state"] else states.first()
+        if state is None:
+            raise CommandError("No state to benchmark, run generate_synthetic_data first.")
+        period = options["period"] or (
+            Data.objects.filter(geography__parentId=state)
+            .order_by("-data_period")
+            .values_list("data_period", flat=True)
+            .first()
+        )
+        subdistricts = list(
+            Geography.objects.filter(parentId__parentId=state)
+            .order_by("parentId_id", "code")
+            .values_list("code", flat=True)[:20]
+        )
+        return {
+            "state": state.code,
+            "state_obj": state,
+            "period": period,
+            "indicator": options["indicator"],
+            "subdistricts": subdistricts,
+        }
+
+    def query_benchmark(self, query, variables, use_async):
+        if use_async:
+            from layer.async_schema import async_schema
+
+            def execute():
+                return asyncio.run(async_schema.execute(query, variable_values=variables))
+        else:
+            from layer.schema import schema
+
+            def execute():
+                return schema.execute_sync(query, variable_values=variables)
+
+        def run():
+            result = execute()
+            if result.errors:
+                raise result.errors[0]
+            return len(dumps({"data": result.data}))
+
+        return run
+
+    def report_benchmark(self, ctx):
+        from layer.views import generate_report
+
+        request = RequestFactory().get(
+            "/report", {"geo_code": ctx["state"], "time_period": ctx["period"]}
+        )
+
+        def run():
+            response = async_to_sync(generate_report)(request)
+            if response.status_code != 200:
+                raise RuntimeError(f"/report returned {response.status_code}")
+            return len(response.content)
+
+        return run
+
+    def import_benchmark(self, ctx, data_dir):
+        """Time `import_state_file` on the state's data written out as a `*_data.csv` file.
+
+        The file is read as the importer reads it, so CSV parsing is part of
+        each run.
+        """
+        state = ctx["state_obj"]
+        filename = os.path.join(data_dir, f"{state.code}_data.csv")
+        import_frame(state).to_csv(filename)
+
+        def run():
+            # Re-importing replaces the same rows; roll back to keep the data.
+            with transaction.atomic():
+                import_state_file(filename, state.name)
+                transaction.set_rollback(True)
+            return None
+
+        return run
+
+    def handle(self, *args, **options):
+        ctx = self.get_context(options)
+        benchmarks = [
+            (name, "graphql", self.query_benchmark(query, variables(ctx), options["use_async"]))
+            for name, (query, variables) in BENCHMARK_QUERIES.items()
+        ]
+        if not options["skip_report"]:
+            benchmarks.append(("report", "report", self.report_benchmark(ctx)))
+        data_dir = tempfile.TemporaryDirectory()
+        if not options["only"] or "import" in options["only"]:
+            benchmarks.append(("import", "import", self.import_benchmark(ctx, data_dir.name)))
+        if options["only"]:
+            benchmarks = [b for b in benchmarks if b[0] in options["only"]]
+
+        results = []
+        with data_dir:
+            for name, kind, fn in benchmarks:
+                self.stderr.write(f"Running {name}...")
+                results.append(run_benchmark(name, kind, fn, options["repeat"], options["warmup"]))
+
+        output = {
+            "meta": {
+                "commit": get_git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "engine": "async" if options["use_async"] else "sync",
+                "state": ctx["state"],
+                "period": ctx["period"],
+                "indicator": ctx["indicator"],
+                "repeat": options["repeat"],
+                "dataset": {
+                    "geographies": Geography.objects.count(),
+                    "indicators": Indicators.objects.count(),
+                    "data": Data.objects.count(),
+                },
+            },
+            "results": results,
+        }
+        text = json.dumps(output, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text + "\n")
+        else:
+            self.stdout.write(text)
+
+        if options["compare"]:
+            self.compare(results, options["compare"])
+
+    def compare(self, results, path):
+        """Print the median change of each benchmark relative to a previous run."""
+        with open(path) as f:
+            previous = {r["name"]: r for r in json.load(f)["results"]}
+        for result in results:
+            before = previous.get(result["name"], {}).get("medianMs")
+            after = result.get("medianMs")
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0
+            sys.stderr.write(
+                f"{result['name']:<22} {before:>10.1f} ms -> {after:>10.1f} ms  {change:+6.1f}%\n"
+            )
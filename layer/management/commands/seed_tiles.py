@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD, TILES
+from layer.tiles import TILE_LAYERS, get_tile, layer_extent, tile_range
+
+
+class Command(BaseCommand):
+    """
+    Pre-render a pyramid of vector tiles into the tile cache.
+
+    Renders every tile from --min-zoom to --max-zoom that covers the layer's
+    geographies (or the districts of --state), so the first map views after
+    an import don't wait for PostGIS. Tiles already in the cache are skipped.
+    """
+
+    help = "Seed the vector tile cache for one or more layers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--layer",
+            nargs="+",
+            default=["district"],
+            choices=list(TILE_LAYERS),
+            help="Layers to seed",
+        )
+        parser.add_argument("--min-zoom", type=int, default=4)
+        parser.add_argument("--max-zoom", type=int, default=10)
+        parser.add_argument("--state", help="Only seed tiles covering this state code")
+        parser.add_argument("--indicator", help="Indicator slug to add values of")
+        parser.add_argument("--period", default=DEFAULT_TIME_PERIOD, help="Data period")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["min_zoom"] <= options["max_zoom"] <= TILES["MAX_ZOOM"]:
+            raise CommandError(f"Zoom levels must be between 0 and {TILES['MAX_ZOOM']}.")
+        indicator = options["indicator"]
+        period = options["period"] if indicator else None
+
+        for layer in options["layer"]:
+            bbox = layer_extent(layer, options["state"])
+            if bbox is None:
+                self.stdout.write(f"No geometries in layer {layer}, skipping.")
+                continue
+            start = time.perf_counter()
+            rendered = cached = 0
+            for z in range(options["min_zoom"], options["max_zoom"] + 1):
+                xs, ys = tile_range(bbox, z)
+                for x in xs:
+                    for y in ys:
+                        _, from_cache = get_tile(layer, z, x, y, indicator, period)
+                        if from_cache:
+                            cached += 1
+                        else:
+                            rendered += 1
+                self.stdout.write(f"{layer} z{z}: {len(xs) * len(ys)} tiles")
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{layer}: rendered {rendered} tiles, {cached} already cached, "
+                    f"in {time.perf_counter() - start:.1f}s."
+                )
+            )
@@ -0,0 +1,276 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from D4D_ContextLayer.settings import METRICS
+from layer.cache import cache_stats
+
+"""
+
+A small in-process metrics registry rendered in the Prometheus text
+exposition format at /metrics. Values are per process; scrape every worker
+(or run a single one) to get complete numbers.
+
+"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        samples = self.samples()
+        if not samples:
+            return []
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *samples,
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Gauge whose value is read from `function` whenever metrics are rendered."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if value is None:
+            return []
+        return [f"{self.name} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the `with` block, also in async code."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = format_labels(self.labelnames, key, [("le", format_value(bound))])
+                samples.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.labelnames, key)
+            samples.append(f"{self.name}_sum{labels} {format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {counts[-1]}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, metrics=None) -> str:
+        lines = []
+        for metric in metrics or self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write_textfile(self, path, metrics=None):
+        """Write the metrics to `path`, replacing it atomically."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render(metrics))
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, function):
+    return REGISTRY.register(Gauge(name, documentation, function))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def _cache_hit_ratio():
+    return cache_stats()["hit_ratio"]
+
+
+class CacheEventCounter(Counter):
+    """Exposes the response cache counters kept by `layer.cache`."""
+
+    def samples(self):
+        stats = cache_stats()
+        return [
+            f'{self.name}{{event="{event}"}} {stats[event]}'
+            for event in ("hits", "misses", "bypasses", "stores")
+        ]
+
+
+GRAPHQL_FIELD_SECONDS = histogram(
+    "graphql_field_duration_seconds",
+    "Wall time spent resolving a top level GraphQL field.",
+    ["field"],
+)
+GRAPHQL_FIELD_DB_SECONDS = histogram(
+    "graphql_field_db_duration_seconds",
+    "Database time spent resolving a top level GraphQL field.",
+    ["field"],
+)
+GRAPHQL_FIELD_QUERIES = counter(
+    "graphql_field_queries_total",
+    "SQL queries issued while resolving a top level GraphQL field.",
+    ["field"],
+)
+GRAPHQL_CACHE_EVENTS = REGISTRY.register(
+    CacheEventCounter(
+        "graphql_cache_events_total",
+        "GraphQL response cache lookups and stores.",
+        ["event"],
+    )
+)
+GRAPHQL_CACHE_HIT_RATIO = gauge(
+    "graphql_cache_hit_ratio",
+    "Share of GraphQL response cache lookups served from the cache.",
+    _cache_hit_ratio,
+)
+DB_CONNECTIONS_CREATED = counter(
+    "db_connections_created_total",
+    "Database connections opened. Django has no pool, so a steadily growing "
+    "count means connections aren't being reused (see CONN_MAX_AGE).",
+    ["alias"],
+)
+
+REPORT_SECONDS = histogram(
+    "report_duration_seconds",
+    "Time spent generating a /report PDF.",
+)
+REPORT_SECTION_SECONDS = histogram(
+    "report_section_duration_seconds",
+    "Time spent in a part of /report: database queries and PDF build per "
+    "report, chart_fetch per chart.",
+    ["section"],
+)
+REPORT_CHARTS_FETCHED = counter(
+    "report_charts_fetched_total",
+    "Charts requested from the chart API for /report.",
+    ["status"],
+)
+
+IMPORT_PHASE_SECONDS = histogram(
+    "import_phase_duration_seconds",
+    "Time spent in a phase of the import_data command.",
+    ["phase"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+IMPORT_ROWS = counter(
+    "import_rows_total",
+    "Data rows written by the import_data command.",
+    ["state"],
+)
+
+
+def count_connection(sender, connection, **kwargs):
+    """`connection_created` receiver counting new database connections."""
+    DB_CONNECTIONS_CREATED.inc(alias=connection.alias)
+
+
+def render() -> str:
+    """Render this process' metrics, plus the last import_data run's."""
+    text = REGISTRY.render()
+    textfile = METRICS["IMPORT_TEXTFILE"]
+    if textfile and os.path.exists(textfile):
+        with open(textfile) as f:
+            text += f.read()
+    return text
+
+
+def write_import_metrics():
+    """Save the import_data metrics for the web process to serve (see `render`)."""
+    if METRICS["IMPORT_TEXTFILE"]:
+        REGISTRY.write_textfile(
+            METRICS["IMPORT_TEXTFILE"], [IMPORT_PHASE_SECONDS, IMPORT_ROWS]
+        )
@@ -0,0 +1,189 @@
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpResponse
+
+from D4D_ContextLayer.settings import PROFILING
+from layer.tracing import track_queries
+
+
+def get_profiling_flag(request):
+    """Return the profiling header or query parameter value, if sent."""
+    return request.headers.get(PROFILING["HEADER"]) or request.GET.get(
+        PROFILING["QUERY_PARAM"]
+    )
+
+
+def is_profiling_authorized(request, flag) -> bool:
+    """Whether the request may be profiled.
+
+    The flag must be the PROFILING["TOKEN"], unless the request comes from a
+    logged-in superuser. Checking the user may hit the database.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_superuser:
+        return True
+    token = PROFILING["TOKEN"]
+    # Bytes: compare_digest rejects strings with non-ASCII characters.
+    return bool(token) and hmac.compare_digest(flag.encode(), token.encode())
+
+
+def summarize_statements(statements, limit):
+    """Group captured statements by SQL, slowest total time first.
+
+    Args:
+        statements (list): `(sql, params, duration)` tuples.
+        limit (int): Number of statements to return.
+
+    Returns:
+        list[dict]: The SQL, how often it ran, how many of those runs had
+        the same parameters as an earlier one, and total/max time.
+    """
+    grouped = defaultdict(list)
+    for sql, params, duration in statements:
+        grouped[sql].append((repr(params), duration))
+
+    summary = []
+    for sql, runs in grouped.items():
+        durations = [duration for _, duration in runs]
+        summary.append(
+            {
+                "sql": sql,
+                "count": len(runs),
+                "duplicates": len(runs) - len({params for params, _ in runs}),
+                "totalMs": round(sum(durations) * 1000, 3),
+                "maxMs": round(max(durations) * 1000, 3),
+            }
+        )
+    summary.sort(key=lambda statement: statement["totalMs"], reverse=True)
+    return summary[:limit]
+
+
+def summarize_profile(profile, limit):
+    """Return the functions with the highest cumulative time as text."""
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+class RequestProfile:
+    """Profile of one request: cProfile stats plus the captured SQL."""
+
+    def __init__(self, request):
+        self.request = request
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        # Tells the GraphQL view to execute instead of serving from cache.
+        self.request._profiled = True
+        self.query_tracker = track_queries(self.request.path, capture_statements=True)
+        self.stats = self.query_tracker.__enter__()
+        self.start = time.perf_counter()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another request on this event loop is already being profiled.
+            self.profile = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+        self.duration = time.perf_counter() - self.start
+        self.query_tracker.__exit__(*exc_info)
+
+    def save(self):
+        """Write the pstats dump and a JSON summary to PROFILING["DIR"].
+
+        Returns:
+            dict: The summary.
+        """
+        os.makedirs(PROFILING["DIR"], exist_ok=True)
+        slug = self.request.path.strip("/").replace("/", "-") or "root"
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{slug}-{uuid.uuid4().hex[:8]}"
+
+        if self.profile is not None:
+            self.profile.dump_stats(os.path.join(PROFILING["DIR"], f"{profile_id}.prof"))
+        summary = {
+            "id": profile_id,
+            "method": self.request.method,
+            "path": self.request.get_full_path(),
+            "wallMs": round(self.duration * 1000, 3),
+            "dbMs": round(self.stats.db_time * 1000, 3),
+            "queries": self.stats.query_count,
+            "topSql": summarize_statements(self.stats.statements, PROFILING["TOP_N"]),
+            "topFunctions": (
+                summarize_profile(self.profile, PROFILING["TOP_N"])
+                if self.profile is not None
+                else None
+            ),
+        }
+        with open(os.path.join(PROFILING["DIR"], f"{profile_id}.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def finish(self, response):
+        """Save the profile and point the response at it.
+
+        With the summary output header, the response body is replaced by the
+        JSON summary.
+        """
+        summary = self.save()
+        if self.request.headers.get(PROFILING["OUTPUT_HEADER"]) == "summary":
+            response = HttpResponse(
+                json.dumps(summary, indent=2), content_type="application/json"
+            )
+        response[PROFILING["ID_HEADER"]] = summary["id"]
+        response["Cache-Control"] = "no-store"
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests that carry an authorized profiling header or query flag.
+
+    Runs cProfile around the view and captures its SQL statements, then saves
+    a pstats dump (open with `python -m pstats` or snakeviz) and a JSON summary
+    of the top statements and functions to PROFILING["DIR"]. The profile id is
+    returned in the X-Profile-Id header.
+
+    cProfile only sees the thread it's enabled on. For async views (/report,
+    async GraphQL) that is the event loop, so ORM calls run through
+    sync_to_async show up as waits, while their SQL is still captured. Other
+    requests served by the loop meanwhile are profiled too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        flag = get_profiling_flag(request)
+        if not flag or not is_profiling_authorized(request, flag):
+            return self.get_response(request)
+        with RequestProfile(request) as profile:
+            response = self.get_response(request)
+        return profile.finish(response)
+
+    async def __acall__(self, request):
+        flag = get_profiling_flag(request)
+        if not flag or not await sync_to_async(is_profiling_authorized)(request, flag):
+            return await self.get_response(request)
+        with RequestProfile(request) as profile:
+            response = await self.get_response(request)
+        return profile.finish(response)
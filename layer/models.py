@@ -1,4 +1,5 @@
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GistIndex
 from django.utils.text import slugify
 
 # from django.db import models
@@ -30,7 +31,8 @@ class Geography(models.Model):
     parentId = models.ForeignKey(
         "self", on_delete=models.CASCADE, null=True, default="", blank=True
     )
-    geom = models.MultiPolygonField(null=True, blank=True)
+    # Indexed by the GistIndex in Meta, for point lookups and tiles.
+    geom = models.MultiPolygonField(null=True, blank=True, spatial_index=False)
     slug = models.SlugField(max_length=200, null=True, blank=True)
 
     def save(self, *args, **kwargs):
@@ -38,6 +40,9 @@ class Geography(models.Model):
             self.slug = slugify(f"{self.name}")
         return super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [GistIndex(fields=["geom"], name="geography_geom_gist")]
+
 
 class Department(models.Model):
     name = models.CharField(max_length=20, null=False)
@@ -64,6 +69,12 @@ class Scheme(models.Model):
 
 
 class Indicators(models.Model):
+    class Aggregation(models.TextChoices):
+        SUM = "sum"
+        MEAN = "mean"
+        WEIGHTED_MEAN = "weighted-mean"
+        MAX = "max"
+
     name = models.CharField(max_length=100, null=False)
     long_description = models.CharField(null=True, max_length=500, blank=True)
     short_description = models.CharField(null=True, max_length=150, blank=True)
@@ -101,6 +112,13 @@ class Indicators(models.Model):
     )
     display_order = models.IntegerField(default=1)
     is_visible = models.BooleanField(null=False, blank=True, default=False)
+    aggregation = models.CharField(
+        max_length=15,
+        choices=Aggregation.choices,
+        null=True,
+        blank=True,
+        help_text="How the values of child geographies roll up to their parent (see layer/rollup.py)",
+    )
 
     def save(self, *args, **kwargs):
         indc_obj = Indicators.objects.last()
@@ -125,3 +143,74 @@ class Data(models.Model):
     scheme = models.ForeignKey(
         Scheme, on_delete=models.PROTECT, null=True, blank=True)
     data_period = models.CharField(max_length=100, null=True, blank=True)
+    is_rollup = models.BooleanField(
+        default=False, help_text="Aggregated from the child geographies' values"
+    )
+
+    class Meta:
+        constraints = [
+            # The key imports upsert on (see import_data.upsert_data).
+            models.UniqueConstraint(
+                fields=["indicator", "geography", "data_period"], name="unique_data_point"
+            )
+        ]
+
+
+class RegionData(models.Model):
+    """The visible indicator values of one geography for one data period.
+
+    A denormalized copy of `Data` kept up to date by the importer (see
+    layer/region_data.py), so resolvers read one row per region instead of
+    one per indicator.
+    """
+
+    geography = models.ForeignKey(
+        Geography, on_delete=models.CASCADE, null=False)
+    data_period = models.CharField(max_length=100, null=False)
+    values = models.JSONField(default=list)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["geography", "data_period"], name="unique_region_data_period"
+            )
+        ]
+
+
+class DataVersion(models.Model):
+    """Counter of changes to the served data and indicators.
+
+    Every import, management command and admin change that alters what the
+    API serves increments it (see layer.cache.bump_data_version), so the
+    response caches of all workers move to a new version.
+    """
+
+    number = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+
+class ImportRun(models.Model):
+    """One run of the import_data command."""
+
+    class Status(models.TextChoices):
+        RUNNING = "RUNNING"
+        SUCCEEDED = "SUCCEEDED"
+        FAILED = "FAILED"
+
+    started = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.RUNNING)
+    options = models.JSONField(default=dict, blank=True)
+    phases = models.JSONField(
+        default=dict, blank=True, help_text="Seconds spent in each phase of the import"
+    )
+    rows = models.JSONField(
+        default=dict, blank=True, help_text="Data rows inserted, updated and deleted per state"
+    )
+    errors = models.JSONField(
+        default=list, blank=True, help_text="Warnings and errors logged during the run"
+    )
+
+    class Meta:
+        ordering = ["-started"]
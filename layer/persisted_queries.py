@@ -0,0 +1,82 @@
+import hashlib
+
+from D4D_ContextLayer.settings import GRAPHQL_PERSISTED_QUERIES
+from layer.cache import get_cache
+
+PERSISTED_QUERY_KEY_PREFIX = "persisted-query"
+
+
+class PersistedQueryError(Exception):
+    """Raised when a persisted query request can't be resolved to a query."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+    def as_response_data(self):
+        return {
+            "errors": [{"message": self.message, "extensions": {"code": self.code}}]
+        }
+
+
+def get_query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def register_query(query: str) -> str:
+    """Store a query document under its sha256 hash and return the hash."""
+    query_hash = get_query_hash(query)
+    get_cache().set(
+        f"{PERSISTED_QUERY_KEY_PREFIX}:{query_hash}",
+        query,
+        GRAPHQL_PERSISTED_QUERIES["TIMEOUT"],
+    )
+    return query_hash
+
+
+def get_query(query_hash: str):
+    return get_cache().get(f"{PERSISTED_QUERY_KEY_PREFIX}:{query_hash}")
+
+
+def resolve_persisted_query(payload: dict) -> dict:
+    """Fill in the query of an automatic persisted query (APQ) request.
+
+    Follows the Apollo APQ protocol: a request carrying
+    `extensions.persistedQuery.sha256Hash` and a query registers the query,
+    while a request carrying only the hash executes the registered query.
+
+    Args:
+        payload (dict): The decoded GraphQL request (query, variables,
+        operationName, extensions).
+
+    Returns:
+        dict: The payload with `query` set.
+
+    Raises:
+        PersistedQueryError: If the hash is unknown or doesn't match the query.
+    """
+    extensions = payload.get("extensions")
+    persisted_query = (
+        extensions.get("persistedQuery") if isinstance(extensions, dict) else None
+    )
+    if not persisted_query:
+        return payload
+
+    if persisted_query.get("version") != 1:
+        raise PersistedQueryError(
+            "Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED"
+        )
+
+    query_hash = persisted_query.get("sha256Hash")
+    query = payload.get("query")
+    if query:
+        if get_query_hash(query) != query_hash:
+            raise PersistedQueryError("provided sha does not match query", "BAD_REQUEST")
+        register_query(query)
+        return payload
+
+    query = get_query(query_hash) if query_hash else None
+    if query is None:
+        raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+    return {**payload, "query": query}
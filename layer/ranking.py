@@ -0,0 +1,99 @@
+from django.db.models import F, Window
+from django.db.models.functions import PercentRank, Rank
+from graphql import GraphQLError
+
+from D4D_ContextLayer.settings import GRAPHQL_CACHE
+from . import types
+from layer.cache import get_cache, get_data_version
+from layer.models import Data
+
+"""
+
+Ranks and percentiles of regions by an indicator's value, for the
+`rankFilter` of districtViewData and revCircleViewData.
+
+A region is ranked among the regions of its level (geography type) in its
+state: rank 1 has the highest value, and the percentile is the share of
+those regions with a lower value (0 to 100). Both are computed by Postgres
+with window functions. Regions without a value (NULL or NaN) aren't ranked.
+Each ranking is cached per (indicator, period, level) under the data
+version, so any import invalidates it.
+
+"""
+
+RANKING_KEY_PREFIX = "ranking"
+
+
+def ranking_queryset(slug, data_period, level):
+    # Indicators belong to a state, so partitioning by indicator ranks each
+    # state's regions separately.
+    return (
+        Data.objects.filter(
+            indicator__slug=slug, data_period=data_period, geography__type=level, value__isnull=False
+        )
+        .exclude(value=float("nan"))
+        .annotate(
+            rank=Window(Rank(), partition_by=F("indicator_id"), order_by=F("value").desc()),
+            percentile=Window(PercentRank(), partition_by=F("indicator_id"), order_by=F("value").asc()),
+        )
+        .values_list("geography_id", "rank", "percentile")
+    )
+
+
+def get_ranking(slug, data_period, level) -> dict:
+    """Return the rank and percentile of each region of a level, by geography id."""
+    cache = get_cache()
+    key = ":".join(
+        [RANKING_KEY_PREFIX, get_data_version(), slug, data_period, level.replace(" ", "-")]
+    )
+    ranking = cache.get(key)
+    if ranking is None:
+        ranking = {
+            geography_id: (rank, round(percentile * 100, 2))
+            for geography_id, rank, percentile in ranking_queryset(slug, data_period, level)
+        }
+        cache.set(key, ranking, GRAPHQL_CACHE["RANKING_TTL"])
+    return ranking
+
+
+def rank_regions(
+        geo_queryset,
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        rank_filter: types.RankFilter,
+) -> dict:
+    """Rank the regions of a view and keep the top/bottom ones requested.
+
+    Args:
+        geo_queryset (QuerySet): The geographies the view shows.
+        indc_filter (types.IndicatorFilter): The indicator to rank by.
+        data_filter (types.DataFilter): The period to rank in.
+        rank_filter (types.RankFilter): How many of the highest and lowest
+        ranked regions of each level to keep. All regions are kept when
+        neither is set.
+
+    Returns:
+        dict: `(rank, percentile)` by geography id of the kept regions;
+        `(None, None)` for regions without a value.
+    """
+    for k in (rank_filter.top_k, rank_filter.bottom_k):
+        if k is not None and k < 1:
+            raise GraphQLError("topK and bottomK must be positive.")
+    levels = {}
+    for geography_id, level in geo_queryset.values_list("id", "type"):
+        levels.setdefault(level, []).append(geography_id)
+
+    ranks = {}
+    for level, geography_ids in levels.items():
+        ranking = get_ranking(indc_filter.slug, data_filter.data_period, level)
+        if rank_filter.top_k is None and rank_filter.bottom_k is None:
+            ranks.update({geography_id: ranking.get(geography_id, (None, None)) for geography_id in geography_ids})
+            continue
+        ranked = sorted(
+            (ranking[geography_id], geography_id) for geography_id in geography_ids if geography_id in ranking
+        )
+        kept = ranked[:rank_filter.top_k or 0]
+        if rank_filter.bottom_k:
+            kept += ranked[-rank_filter.bottom_k:]
+        ranks.update({geography_id: rank for rank, geography_id in kept})
+    return ranks
@@ -0,0 +1,234 @@
+import math
+from collections import defaultdict
+from typing import Optional
+
+from django.db.models import Q
+
+from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD
+from . import types
+from layer.models import Data, Indicators, RegionData
+
+"""
+
+Read model for the region tables: one `RegionData` row per geography and
+data period holding all its visible indicator values, in display order:
+
+    {"id": 3, "slug": "flood-hazard", "name": "Flood Hazard", "unit": "score",
+     "parent": "risk-score", "top": true, "value": 2.0}
+
+`parent` is the parent indicator's slug and `top` tells whether the
+indicator is in the top two levels of the tree. The importer refreshes the
+slices it writes with `refresh_region_data`. The querysets below select the
+region rows of the tableData, districtViewData and revCircleViewData
+resolvers, and `expand_region_rows` turns them back into rows that read like
+`Data` objects for the `build_*` functions in schema.py.
+
+"""
+
+
+class RegionIndicator:
+    __slots__ = ("id", "slug", "name", "unit")
+
+
+class RegionUnit:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class RegionValue:
+    """An indicator value of a region, read like a `Data` object."""
+
+    __slots__ = ("geography", "geography_id", "indicator", "value", "data_period")
+
+    def __init__(self, region, indicator, value):
+        self.geography = region.geography
+        self.geography_id = region.geography_id
+        self.indicator = indicator
+        self.value = value
+        self.data_period = region.data_period
+
+
+def region_entry(data) -> dict:
+    indicator = data.indicator
+    parent = indicator.parent
+    # Imports store NaN for empty cells, which jsonb can't hold.
+    value = None if data.value is None or math.isnan(data.value) else data.value
+    return {
+        "id": indicator.id,
+        "slug": indicator.slug,
+        "name": indicator.name,
+        "unit": indicator.unit.name if indicator.unit else None,
+        "parent": parent.slug if parent else None,
+        "top": parent is None or parent.parent_id is None,
+        "value": value,
+    }
+
+
+def refresh_region_data(geography_ids, data_periods) -> int:
+    """Rebuild the read model rows of the given geographies and periods.
+
+    Slices left without visible data are removed.
+
+    Args:
+        geography_ids (list): Ids of the geographies to refresh.
+        data_periods (list): Data periods to refresh.
+
+    Returns:
+        int: Number of rows written.
+    """
+    rows = (
+        Data.objects.filter(
+            geography_id__in=geography_ids,
+            data_period__in=data_periods,
+            indicator__is_visible=True,
+        )
+        .select_related("indicator", "indicator__unit", "indicator__parent")
+        .order_by("geography_id", "data_period", "indicator__display_order", "indicator_id")
+    )
+    slices = defaultdict(list)
+    for data in rows:
+        slices[(data.geography_id, data.data_period)].append(region_entry(data))
+
+    existing = RegionData.objects.filter(
+        geography_id__in=geography_ids, data_period__in=data_periods
+    ).values_list("id", "geography_id", "data_period")
+    stale = [region_id for region_id, geography_id, data_period in existing
+             if (geography_id, data_period) not in slices]
+    RegionData.objects.filter(id__in=stale).delete()
+    RegionData.objects.bulk_create(
+        [
+            RegionData(geography_id=geography_id, data_period=data_period, values=values)
+            for (geography_id, data_period), values in slices.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["geography", "data_period"],
+        update_fields=["values", "modified"],
+        batch_size=1000,
+    )
+    return len(slices)
+
+
+def rebuild_region_data(batch_size=200) -> int:
+    """Rebuild the whole read model, `batch_size` geographies at a time."""
+    geography_ids = list(
+        Data.objects.values_list("geography_id", flat=True).distinct().order_by("geography_id")
+    )
+    data_periods = list(
+        Data.objects.exclude(data_period=None)
+        .values_list("data_period", flat=True)
+        .distinct()
+        .order_by("data_period")
+    )
+    RegionData.objects.exclude(geography_id__in=geography_ids).delete()
+    written = 0
+    for i in range(0, len(geography_ids), batch_size):
+        written += refresh_region_data(geography_ids[i:i + batch_size], data_periods)
+    return written
+
+
+def indicator_layout(state) -> list:
+    """The indicator fields of a state that region rows copy, in display order.
+
+    When it changes (a rename, a new unit or parent, a visibility change or
+    a reordering), the state's region rows must be rebuilt.
+    """
+    return list(
+        Indicators.objects.filter(geography=state, is_visible=True)
+        .order_by("display_order", "id")
+        .values_list("id", "slug", "name", "unit__name", "parent__slug", "parent__parent_id")
+    )
+
+
+def rebuild_state_region_data(state, batch_size=200) -> int:
+    """Rebuild the read model rows of a state's data, `batch_size` geographies at a time."""
+    data = Data.objects.filter(indicator__geography=state)
+    geography_ids = list(
+        data.values_list("geography_id", flat=True).distinct().order_by("geography_id")
+    )
+    data_periods = list(
+        data.exclude(data_period=None)
+        .values_list("data_period", flat=True)
+        .distinct()
+        .order_by("data_period")
+    )
+    written = 0
+    for i in range(0, len(geography_ids), batch_size):
+        written += refresh_region_data(geography_ids[i:i + batch_size], data_periods)
+    return written
+
+
+def region_geo_filter(geo_filter: types.GeoFilter) -> Q:
+    """The geographies a GeoFilter selects in the region tables."""
+    if len(geo_filter.code) <= 1:
+        return (
+            Q(geography__parentId__code__in=geo_filter.code)
+            | Q(geography__code__in=geo_filter.code)
+        ) & ~Q(geography__type="STATE")
+    return Q(geography__code__in=geo_filter.code)
+
+
+def district_region_queryset(data_filter: types.DataFilter, geo_filter: types.GeoFilter):
+    return (
+        RegionData.objects.filter(region_geo_filter(geo_filter), data_period=data_filter.data_period)
+        .select_related("geography")
+        .order_by("geography_id")
+    )
+
+
+def table_region_queryset(
+        data_filter: Optional[types.DataFilter] = None,
+        geo_filter: Optional[types.GeoFilter] = None,
+):
+    period = data_filter.data_period if data_filter else DEFAULT_TIME_PERIOD
+    if geo_filter:
+        geo_q = region_geo_filter(geo_filter)
+    else:
+        geo_q = Q(geography__type="DISTRICT")
+    return (
+        RegionData.objects.filter(geo_q, data_period=period)
+        .select_related("geography")
+        .order_by("geography_id")
+    )
+
+
+def revenue_region_queryset(data_filter: types.DataFilter, geo_filter: types.GeoFilter):
+    return (
+        RegionData.objects.filter(
+            geography__code__in=geo_filter.code, data_period=data_filter.data_period
+        )
+        .select_related("geography", "geography__parentId")
+        .order_by("geography_id")
+    )
+
+
+def slug_or_child(slug):
+    """Match the indicator with `slug` and its direct children."""
+    return lambda entry: entry["slug"] == slug or entry["parent"] == slug
+
+
+def top_levels(entry) -> bool:
+    return entry["top"]
+
+
+def expand_region_rows(regions, include) -> list:
+    """Turn region rows into one value per indicator matched by `include`."""
+    indicators = {}
+    units = {}
+    rows = []
+    for region in regions:
+        for entry in region.values:
+            if not include(entry):
+                continue
+            indicator = indicators.get(entry["id"])
+            if indicator is None:
+                indicator = RegionIndicator()
+                indicator.id = entry["id"]
+                indicator.slug = entry["slug"]
+                indicator.name = entry["name"]
+                unit = entry["unit"]
+                indicator.unit = units.setdefault(unit, RegionUnit(unit)) if unit else None
+                indicators[entry["id"]] = indicator
+            rows.append(RegionValue(region, indicator, entry["value"]))
+    return rows
@@ -0,0 +1,126 @@
+from django.db import connection, transaction
+
+from layer.models import Data, Geography, Indicators
+from layer.region_data import refresh_region_data
+
+"""
+
+Hierarchical rollups: values of a parent geography aggregated from its
+children's values, e.g. a district's from its revenue circles or tehsils
+and the state's from its districts.
+
+Each indicator's `aggregation` (filled from the "District Level
+Aggregation" column of the indicator files) says how its values roll up:
+`sum`, `mean`, `max`, or `weighted-mean`, the mean weighted by the
+children's ROLLUP_WEIGHT values in the same period. Indicators without an
+aggregation aren't rolled up.
+
+Levels are rolled up bottom-up with one grouped INSERT ... SELECT each, so
+a state's values come from its districts' imported or rolled-up values.
+Rolled-up values are stored as `Data` rows flagged `is_rollup`. They never
+replace an imported value, only fill the slots that have none.
+
+"""
+
+ROLLUP_WEIGHT = "sum-population"
+
+# Stale rollups are removed first, so values whose children lost their data go away.
+DELETE_ROLLUPS_SQL = """
+DELETE FROM {data}
+WHERE is_rollup
+    AND geography_id = ANY(%(parents)s)
+    AND (%(periods)s::text[] IS NULL OR data_period = ANY(%(periods)s))
+""".format(data=Data._meta.db_table)
+
+# NaN values (stored by imports for empty cells) count as missing; Postgres
+# orders NaN above every number, so `value <> 'NaN'` also drops NULLs.
+ROLLUP_SQL = """
+WITH children AS (
+    SELECT g."parentId_id" AS parent_id, d.indicator_id, d.data_period, d.value, w.value AS weight
+    FROM {data} d
+    JOIN {geography} g ON g.id = d.geography_id
+    LEFT JOIN {data} w ON w.geography_id = d.geography_id
+        AND w.data_period = d.data_period
+        AND w.indicator_id = %(weight)s
+        AND w.value <> 'NaN'
+    WHERE g."parentId_id" = ANY(%(parents)s)
+        AND d.indicator_id = ANY(%(indicators)s)
+        AND d.value <> 'NaN'
+        AND (%(periods)s::text[] IS NULL OR d.data_period = ANY(%(periods)s))
+),
+rollup AS (
+    SELECT c.parent_id, c.indicator_id, c.data_period, CASE i.aggregation
+        WHEN 'sum' THEN sum(c.value)
+        WHEN 'mean' THEN avg(c.value)
+        WHEN 'max' THEN max(c.value)
+        WHEN 'weighted-mean' THEN COALESCE(sum(c.value * c.weight) / NULLIF(sum(c.weight), 0), avg(c.value))
+    END AS value
+    FROM children c
+    JOIN {indicators} i ON i.id = c.indicator_id
+    GROUP BY c.parent_id, c.indicator_id, i.aggregation, c.data_period
+)
+INSERT INTO {data} AS stored (value, added, modified, indicator_id, geography_id, data_period, is_rollup)
+SELECT value, now(), now(), indicator_id, parent_id, data_period, true
+FROM rollup
+ON CONFLICT (indicator_id, geography_id, data_period) DO UPDATE
+    SET value = EXCLUDED.value, modified = EXCLUDED.modified, is_rollup = true
+    WHERE stored.value IS NULL OR stored.value = 'NaN'
+""".format(
+    data=Data._meta.db_table,
+    geography=Geography._meta.db_table,
+    indicators=Indicators._meta.db_table,
+)
+
+
+def parent_levels(state: Geography) -> list:
+    """Ids of the state's geographies that have children, deepest level first."""
+    levels = []
+    level = [state.id]
+    while level:
+        levels.append(level)
+        level = list(
+            Geography.objects.filter(parentId__parentId__in=level)
+            .values_list("parentId_id", flat=True)
+            .distinct()
+        )
+    return levels[::-1]
+
+
+def rollup_state(state: Geography, data_periods=None) -> int:
+    """Recompute the rolled-up values of a state's geographies.
+
+    Args:
+        state (Geography): The state.
+        data_periods (list, optional): Only roll up these data periods.
+        Defaults to all.
+
+    Returns:
+        int: Number of values written.
+    """
+    indicator_ids = list(
+        Indicators.objects.filter(geography=state, aggregation__isnull=False).values_list("id", flat=True)
+    )
+    weight = (
+        Indicators.objects.filter(geography=state, slug=ROLLUP_WEIGHT).values_list("id", flat=True).first()
+    )
+    levels = parent_levels(state)
+    written = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for parents in levels:
+            params = {
+                "parents": parents,
+                "indicators": indicator_ids,
+                "weight": weight,
+                "periods": list(data_periods) if data_periods else None,
+            }
+            cursor.execute(DELETE_ROLLUPS_SQL, params)
+            cursor.execute(ROLLUP_SQL, params)
+            written += cursor.rowcount
+
+    parents = [geography_id for level in levels for geography_id in level]
+    if not data_periods:
+        data_periods = list(
+            Data.objects.filter(indicator__geography=state).values_list("data_period", flat=True).distinct()
+        )
+    refresh_region_data(parents, list(data_periods))
+    return written
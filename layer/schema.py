@@ -1,5 +1,4 @@
-import json
-import timeit
+import math
 import typing
 from datetime import datetime
 from typing import Optional
@@ -7,54 +6,159 @@ from typing import Optional
 import strawberry
 import strawberry_django
 from dateutil.relativedelta import relativedelta
-from django.contrib.gis.db.models.functions import Centroid, MakeValid
+from django.contrib.gis.db.models.functions import AsGeoJSON, Centroid, MakeValid
 from django.contrib.gis.db.models.aggregates import Union
-from django.core.serializers import serialize
-from django.db.models import F, Q
+from django.db.models import F, FloatField, Func, Q
+from strawberry.extensions import ParserCache, ValidationCache
 from strawberry.scalars import JSON
 from strawberry_django.optimizer import DjangoOptimizerExtension
-import geojson
 
-from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD
+from D4D_ContextLayer.settings import DATA_ENGINE, DEFAULT_TIME_PERIOD
 from . import types
+from layer.cache import cache_stats
+from layer import ranking, region_data, sql
+from layer.cube import get_cube
+from layer.geolookup import lookup_points
+from layer.encoders import geometry_fragment
+from layer.tracing import ResolverTracingExtension
 from layer.models import Data, Geography, Indicators
 from D4D_ContextLayer.settings import DATA_RESOURCE_MAP
 
 # from .mutation import Mutation
 
+"""
 
-def bounding_box(coord_list):
-    box = []
-    for i in (0, 1):
-        res = sorted(coord_list, key=lambda x: x[i])
-        box.append((res[0][i], res[-1][i]))
-    ret = [[box[1][0], box[0][0]], [box[1][1], box[0][1]]]
-    return ret
+Resolvers are split into functions that build the querysets they need and
+`build_*` functions that shape the fetched rows into the response. The sync
+resolvers below and the async ones in async_schema.py share both and only
+differ in how they fetch rows.
 
+"""
 
-def get_district_data(
-        indc_filter: types.IndicatorFilter,
-        data_filter: types.DataFilter,
-        geo_filter: types.GeoFilter,
-) -> list[dict]:
-    """Retrieve district-specific data based on specified filters.
+
+def group_by_geography(rows) -> list[list]:
+    """Group Data rows by geography, keeping the order rows arrive in."""
+    groups = {}
+    for obj in rows:
+        groups.setdefault(obj.geography_id, []).append(obj)
+    return list(groups.values())
+
+
+def format_indicator_value(obj) -> dict:
+    """Display value and title of a Data row, e.g. {"value": "3.0 Score", ...}.
+
+    A missing value reads "None" with every engine, whether it is stored as
+    NULL or as the NaN imports write for empty cells.
+    """
+    value = None if obj.value is None or math.isnan(obj.value) else obj.value
+    if obj.indicator.unit:
+        unit = obj.indicator.unit.name
+        return {
+            "value": str(value) + " " + unit,
+            "title": obj.indicator.name,
+        }
+    return {
+        "value": str(value),
+        "title": obj.indicator.name,
+    }
+
+
+def selected_value_key(value):
+    """Sort key putting the highest values first and regions without a value (None or NaN) last."""
+    missing = value is None or value != value
+    return (missing, 0 if missing else -value)
+
+
+def sort_by_selected_value(regions) -> list[dict]:
+    """Sort `(selected value, region dict)` pairs with `selected_value_key`, keeping ties in order."""
+    return [region for _, region in sorted(regions, key=lambda pair: selected_value_key(pair[0]))]
+
+
+def only_ranked(queryset, ranks: Optional[dict] = None):
+    """Limit rows to the regions kept by `ranking.rank_regions`, if ranking."""
+    if ranks is None:
+        return queryset
+    return queryset.filter(geography_id__in=list(ranks))
+
+
+def feature_collection_queryset(geo_queryset, with_bounds=False):
+    """Geography values with the geometry serialized to GeoJSON by PostGIS.
 
     Args:
-        indc_filter (types.IndicatorFilter): An IndicatorFilter object used
-        to filter data based on defined fields from types.py.
-        data_filter (types.DataFilter): An DataFilter object used
-        to filter data based on defined fields from types.py.
-        geo_filter (types.GeoFilter, optional): An GeoFilter object used
-        to filter data based on defined fields from types.py. Defaults to None.
+        geo_queryset (QuerySet): Geographies to include as features.
+        with_bounds (bool): Also select the bounding box. Defaults to False.
+    """
+    annotations = {"geometry": AsGeoJSON("geom")}
+    if with_bounds:
+        annotations.update(
+            {
+                bound: Func(F("geom"), function=f"ST_{bound}", output_field=FloatField())
+                for bound in ("XMin", "YMin", "XMax", "YMax")
+            }
+        )
+    return geo_queryset.annotate(**annotations).values(
+        "id", "name", "code", "type", "parentId", "slug", *annotations
+    )
+
+
+def build_feature_collection(geo_rows, with_bounds=False) -> dict:
+    """Build a GeoJSON FeatureCollection from `feature_collection_queryset` rows.
+
+    Geometries are passed on as pre-serialized fragments, so they are never
+    parsed in Python; the response encoder splices them into the output as-is.
+    Properties mirror Django's geojson serializer.
+
+    Args:
+        geo_rows (list[dict]): Rows of `feature_collection_queryset`.
+        with_bounds (bool): Add a `bounds` key ([[min lat, min lon],
+        [max lat, max lon]]) to each feature. Defaults to False.
 
     Returns:
-        list[dict]: A list containing dictionary of districts
-            mapping each to it's relevant data fields.
+        dict: A GeoJSON-like FeatureCollection.
     """
-    starttime = timeit.default_timer()
-    data_list = []
-    data_dict = {}
+    features = []
+    for geo in geo_rows:
+        feature = {
+            "type": "Feature",
+            "id": geo["id"],
+            "properties": {
+                "name": geo["name"],
+                "code": geo["code"],
+                "type": geo["type"],
+                "parentId": geo["parentId"],
+                "slug": geo["slug"],
+                "pk": str(geo["id"]),
+            },
+            "geometry": geometry_fragment(geo["geometry"]),
+        }
+        if with_bounds:
+            feature["bounds"] = [
+                [geo["YMin"], geo["XMin"]],
+                [geo["YMax"], geo["XMax"]],
+            ]
+        features.append(feature)
+
+    return {
+        "type": "FeatureCollection",
+        "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+        "features": features,
+    }
+
+
+def district_view_geographies(geo_filter: types.GeoFilter):
+    """The geographies `district_data_queryset` selects the data of."""
+    if len(geo_filter.code) <= 1:
+        return Geography.objects.filter(
+            Q(parentId__code__in=geo_filter.code) | Q(code__in=geo_filter.code)
+        ).exclude(type="STATE")
+    return Geography.objects.filter(code__in=geo_filter.code)
+
 
+def district_data_queryset(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: types.GeoFilter,
+):
     if indc_filter:
         dataset_obj = Data.objects.filter(
             Q(indicator__slug=indc_filter.slug)
@@ -64,70 +168,99 @@ def get_district_data(
         dataset_obj = dataset_obj.filter(data_period=data_filter.data_period)
 
     if len(geo_filter.code) <= 1:
+        # A state's own values are rolled up (see layer/rollup.py) and only
+        # shown in the report and time trends, not next to its districts.
         dataset_obj = dataset_obj.filter(
             Q(geography__parentId__code__in=geo_filter.code)
             | Q(geography__code__in=geo_filter.code)
-        )
-        geo_obj = Geography.objects.filter(
-            Q(code__in=geo_filter.code) | Q(parentId__code__in=geo_filter.code)
-        )
+        ).exclude(geography__type="STATE")
     else:
-        geo_obj = Geography.objects.filter(code__in=geo_filter.code)
+        dataset_obj = dataset_obj.filter(geography__code__in=geo_filter.code)
 
-    for geo in geo_obj:
-        for obj in dataset_obj.filter(geography=geo, indicator__is_visible=True):
+    return (
+        dataset_obj.filter(indicator__is_visible=True)
+        .select_related("geography", "indicator", "indicator__unit")
+        .order_by("geography_id", "indicator__display_order", "indicator_id")
+    )
+
+
+def build_district_data(
+        rows, indc_filter: types.IndicatorFilter, ranks: Optional[dict] = None
+) -> list[dict]:
+    data_list = []
+    for geo_rows in group_by_geography(rows):
+        geography_id = geo_rows[0].geography_id
+        if ranks is not None and geography_id not in ranks:
+            continue
+        data_dict = {}
+        selected = None
+        for obj in geo_rows:
             data_dict[obj.geography.type.lower()] = obj.geography.name
             data_dict[obj.geography.type.lower().replace(" ", "-") + "-code"] = (
                 obj.geography.code
             )
-            if obj.indicator.unit:
-                unit = obj.indicator.unit.name
-                data_dict[obj.indicator.slug] = {
-                    "value": str(obj.value) + " " + unit,
-                    "title": obj.indicator.name,
-                }
-            else:
-                data_dict[obj.indicator.slug] = {
-                    "value": str(obj.value),
-                    "title": obj.indicator.name,
-                }
-
-        if data_dict:
-            data_list.append(data_dict)
-            data_dict = {}
-
-    data_list = sorted(
-        data_list,
-        key=lambda d: float(d[indc_filter.slug]["value"].split()[0]),
-        reverse=True,
-    )
+            data_dict[obj.indicator.slug] = format_indicator_value(obj)
+            if obj.indicator.slug == indc_filter.slug:
+                selected = obj.value
+        if ranks is not None:
+            data_dict["rank"], data_dict["percentile"] = ranks[geography_id]
+        data_list.append((selected, data_dict))
 
-    print("The time difference is :", timeit.default_timer() - starttime)
-    return data_list
+    return sort_by_selected_value(data_list)
 
 
-def get_table_data(
-        indc_filter: Optional[types.IndicatorFilter] = None,
-        data_filter: Optional[types.DataFilter] = None,
-        geo_filter: Optional[types.GeoFilter] = None,
+def get_district_data(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: types.GeoFilter,
+        rank_filter: Optional[types.RankFilter] = None,
 ) -> list[dict]:
-    """Retrieve data to be displayed on table based on specified filters.
+    """Retrieve district-specific data based on specified filters.
 
     Args:
-        indc_filter (types.IndicatorFilter, Optional): An IndicatorFilter object used
+        indc_filter (types.IndicatorFilter): An IndicatorFilter object used
         to filter data based on defined fields from types.py.
-        data_filter (types.DataFilter, Optional): An DataFilter object used
+        data_filter (types.DataFilter): An DataFilter object used
         to filter data based on defined fields from types.py.
         geo_filter (types.GeoFilter, optional): An GeoFilter object used
         to filter data based on defined fields from types.py. Defaults to None.
+        rank_filter (types.RankFilter, optional): Add each region's rank and
+        percentile (see layer/ranking.py), keeping only the topK/bottomK
+        regions when set. Defaults to None.
 
     Returns:
         list[dict]: A list containing dictionary of districts
             mapping each to it's relevant data fields.
     """
-    starttime = timeit.default_timer()
-    data_list = []
-    data_dict = {}
+    ranks = None
+    if rank_filter:
+        ranks = ranking.rank_regions(
+            district_view_geographies(geo_filter), indc_filter, data_filter, rank_filter
+        )
+    # Ranked views are built in Python from the kept regions' rows.
+    elif DATA_ENGINE == "sql":
+        return sql.district_data_json(
+            district_data_queryset(indc_filter, data_filter, geo_filter), indc_filter
+        )
+    cube = get_cube()
+    if cube:
+        rows = cube.district_data_rows(indc_filter, data_filter, geo_filter)
+    elif DATA_ENGINE == "region":
+        rows = region_data.expand_region_rows(
+            only_ranked(region_data.district_region_queryset(data_filter, geo_filter), ranks),
+            region_data.slug_or_child(indc_filter.slug),
+        )
+    else:
+        rows = only_ranked(district_data_queryset(indc_filter, data_filter, geo_filter), ranks)
+    data_list = build_district_data(rows, indc_filter, ranks)
+    return data_list
+
+
+def table_data_queryset(
+        indc_filter: Optional[types.IndicatorFilter] = None,
+        data_filter: Optional[types.DataFilter] = None,
+        geo_filter: Optional[types.GeoFilter] = None,
+):
     data_obj = Data.objects.filter(indicator__is_visible=True)
 
     # Filter by time period
@@ -148,75 +281,102 @@ def get_table_data(
     # Filter by geography
     if geo_filter:
         if len(geo_filter.code) <= 1:
+            # As in district_data_queryset, without the state's rolled-up values.
             data_obj = data_obj.filter(
                 Q(geography__parentId__code__in=geo_filter.code)
                 | Q(geography__code__in=geo_filter.code)
-            )
-            geo_obj = Geography.objects.filter(
-                Q(code__in=geo_filter.code) | Q(
-                    parentId__code__in=geo_filter.code)
-            )
+            ).exclude(geography__type="STATE")
         else:
-            geo_obj = Geography.objects.filter(code__in=geo_filter.code)
+            data_obj = data_obj.filter(geography__code__in=geo_filter.code)
     else:
-        geo_obj = Geography.objects.filter(type="DISTRICT")
+        data_obj = data_obj.filter(geography__type="DISTRICT")
+
+    return data_obj.select_related(
+        "geography", "indicator", "indicator__unit"
+    ).order_by("geography_id", "indicator__display_order", "indicator_id")
+
+
+def table_region_filter(indc_filter: Optional[types.IndicatorFilter] = None):
+    """The indicators of the region rows that tableData shows."""
+    if indc_filter:
+        return region_data.slug_or_child(indc_filter.slug)
+    return region_data.top_levels
+
+
+def build_table_data(rows, indc_filter: Optional[types.IndicatorFilter] = None) -> list[dict]:
+    data_list = []
 
     # Process geography and data for each region
-    for geo in geo_obj:
-        for obj in data_obj.filter(geography=geo):
-            data_dict["type"] = geo.type
+    for geo_rows in group_by_geography(rows):
+        data_dict = {}
+        for obj in geo_rows:
+            data_dict["type"] = obj.geography.type
             data_dict["region-name"] = obj.geography.name
             data_dict[obj.geography.type.lower().replace(" ", "-") + "-code"] = (
                 obj.geography.code
             )
-            if obj.indicator.unit:
-                unit = obj.indicator.unit.name
-                data_dict[obj.indicator.slug] = {
-                    "value": str(obj.value) + " " + unit,
-                    "title": obj.indicator.name,
-                }
-            else:
-                data_dict[obj.indicator.slug] = {
-                    "value": str(obj.value),
-                    "title": obj.indicator.name,
-                }
-
-        if data_dict:
-            # Reorder data_dict so that the selected indicator is first
-            if indc_filter and indc_filter.slug in data_dict:
-                selected_indicator = {
-                    indc_filter.slug: data_dict.pop(indc_filter.slug)}
-                data_dict = {**selected_indicator, **data_dict}
-
-            data_list.append(data_dict)
-            data_dict = {}
+            data_dict[obj.indicator.slug] = format_indicator_value(obj)
 
-    # Prioritize district values at the top
-    data_list = sorted(data_list, key=lambda d: d.get("type") != "DISTRICT")
+        # Reorder data_dict so that the selected indicator is first
+        if indc_filter and indc_filter.slug in data_dict:
+            selected_indicator = {
+                indc_filter.slug: data_dict.pop(indc_filter.slug)}
+            data_dict = {**selected_indicator, **data_dict}
 
-    print("The time difference is :", timeit.default_timer() - starttime)
-    return data_list
+        data_list.append(data_dict)
 
+    # Prioritize district values at the top
+    return sorted(data_list, key=lambda d: d.get("type") != "DISTRICT")
 
-def get_time_trends(
-        indc_filter: types.IndicatorFilter,
-        data_filter: types.DataFilter,
-        geo_filter: types.GeoFilter,
-) -> dict:
-    starttime = timeit.default_timer()
-    """Retrieve time trends data based on specified filters.
+
+def get_table_data(
+        indc_filter: Optional[types.IndicatorFilter] = None,
+        data_filter: Optional[types.DataFilter] = None,
+        geo_filter: Optional[types.GeoFilter] = None,
+) -> list[dict]:
+    """Retrieve data to be displayed on table based on specified filters.
 
     Args:
-        indc_filter (types.IndicatorFilter): An IndicatorFilter object used
+        indc_filter (types.IndicatorFilter, Optional): An IndicatorFilter object used
         to filter data based on defined fields from types.py.
-        data_filter (types.DataFilter): An DataFilter object used
+        data_filter (types.DataFilter, Optional): An DataFilter object used
         to filter data based on defined fields from types.py.
         geo_filter (types.GeoFilter, optional): An GeoFilter object used
-        to filter data based on defined fields from types.py.
+        to filter data based on defined fields from types.py. Defaults to None.
 
     Returns:
-        dict: A dictionary containing time trends data aggregated for each
-        timestamp based on the specified filters.
+        list[dict]: A list containing dictionary of districts
+            mapping each to it's relevant data fields.
+    """
+    if DATA_ENGINE == "sql":
+        return sql.table_data_json(
+            table_data_queryset(indc_filter, data_filter, geo_filter), indc_filter
+        )
+    cube = get_cube()
+    if cube:
+        rows = cube.table_data_rows(indc_filter, data_filter, geo_filter)
+    elif DATA_ENGINE == "region":
+        rows = region_data.expand_region_rows(
+            region_data.table_region_queryset(data_filter, geo_filter),
+            table_region_filter(indc_filter),
+        )
+    else:
+        rows = table_data_queryset(indc_filter, data_filter, geo_filter)
+    data_list = build_table_data(rows, indc_filter)
+    return data_list
+
+
+def time_trends_periods(data_filter: types.DataFilter, all_periods: Optional[list] = None):
+    """Return the data periods covered by the requested range.
+
+    Args:
+        data_filter (types.DataFilter): The requested period and range.
+        all_periods (list, optional): Every period in the data, if already
+        known. Defaults to None.
+
+    Returns:
+        list | QuerySet: The periods for "3M"/"1Y" ranges, otherwise
+        `all_periods` or a queryset of every period in the data.
     """
     # Parse the string into a datetime object.
     date_format = "%Y_%m"
@@ -234,60 +394,57 @@ def get_time_trends(
             tme = datetime_object - relativedelta(months=i)
             time_list.append(tme.strftime("%Y_%m"))
         time_list.reverse()
+    elif all_periods is not None:
+        return all_periods
     else:
-        list_queryset = (
+        return (
             Data.objects.values_list("data_period", flat=True)
             .annotate(custom_ordering=F("data_period"))
             .distinct()
             .order_by("custom_ordering")
         )
-        time_list = [time for time in list_queryset]
+    return time_list
 
-    # Filter the data.
-    data_queryset = Data.objects.filter(
+
+def time_trends_queryset(
+        indc_filter: types.IndicatorFilter,
+        geo_filter: types.GeoFilter,
+        time_list: list,
+):
+    return Data.objects.filter(
         Q(geography__parentId__code__in=geo_filter.code)
         | Q(geography__parentId__parentId__code__in=geo_filter.code)
         | Q(geography__code__in=geo_filter.code),
         indicator__slug=indc_filter.slug,
         data_period__in=time_list,
-    )
+    ).select_related("geography").order_by("geography_id")
+
 
+def build_time_trends(rows, indc_filter: types.IndicatorFilter, time_list: list) -> dict:
     # Creating initial dict structure.
     data_dict = {}
-    data_dict[indc_filter.slug] = {}
-
-    # Iterating over each data period to create a list of dicts.
-    # Where each dict represents data for that district for that data period.
-    for time in time_list:
-        temp_dict = {}
-        data_list = []
-        filtered_queryset = data_queryset.filter(data_period=time)
-        for data in filtered_queryset:
-            temp_dict[data.geography.type.lower().replace(" ", "-")] = (
-                data.geography.name
-            )
-            temp_dict[data.geography.type.lower().replace(" ", "-") + "-code"] = (
-                data.geography.code
-            )
-            temp_dict[indc_filter.slug] = data.value
-            data_list.append(temp_dict)
-            temp_dict = {}
-
-        data_dict[indc_filter.slug][time] = data_list
+    data_dict[indc_filter.slug] = {time: [] for time in time_list}
+
+    # Each dict represents data for that district for that data period.
+    for data in rows:
+        geo_type = data.geography.type.lower().replace(" ", "-")
+        data_dict[indc_filter.slug][data.data_period].append(
+            {
+                geo_type: data.geography.name,
+                geo_type + "-code": data.geography.code,
+                indc_filter.slug: data.value,
+            }
+        )
 
-    print("The time difference is :", timeit.default_timer() - starttime)
     return data_dict
 
 
-def get_revenue_data(
+def get_time_trends(
         indc_filter: types.IndicatorFilter,
         data_filter: types.DataFilter,
-        geo_filter: Optional[types.GeoFilter] = None,
-) -> list[dict]:
-    starttime = timeit.default_timer()
-    data_list = []
-    data_dict = {}
-    """Retrieve revenue circle-specific data based on specified filters.
+        geo_filter: types.GeoFilter,
+) -> dict:
+    """Retrieve time trends data based on specified filters.
 
     Args:
         indc_filter (types.IndicatorFilter): An IndicatorFilter object used
@@ -295,13 +452,28 @@ def get_revenue_data(
         data_filter (types.DataFilter): An DataFilter object used
         to filter data based on defined fields from types.py.
         geo_filter (types.GeoFilter, optional): An GeoFilter object used
-        to filter data based on defined fields from types.py. Defaults to None.
+        to filter data based on defined fields from types.py.
 
     Returns:
-        list[dict]: A list containing dictionary of revenue circles
-            mapping each to it's relevant data fields.
+        dict: A dictionary containing time trends data aggregated for each
+        timestamp based on the specified filters.
     """
+    cube = get_cube()
+    if cube:
+        time_list = list(time_trends_periods(data_filter, cube.periods))
+        rows = cube.time_trends_rows(indc_filter, geo_filter, time_list)
+    else:
+        time_list = list(time_trends_periods(data_filter))
+        rows = time_trends_queryset(indc_filter, geo_filter, time_list)
+    data_dict = build_time_trends(rows, indc_filter, time_list)
+    return data_dict
+
 
+def revenue_data_queryset(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+):
     # try:
     #     # Set the type filter based on state.
     #     geo_obj = Geography.objects.get(code__in=geo_filter.state_code, type="STATE")
@@ -315,8 +487,6 @@ def get_revenue_data(
     # except Geography.DoesNotExist:
     #     raise GraphQLError("Invalid state code!!")
 
-    geo_queryset = Geography.objects.filter(code__in=geo_filter.code)
-
     rc_data_queryset = Data.objects.filter(
         Q(indicator__parent__slug=indc_filter.slug)
         | Q(indicator__slug=indc_filter.slug),
@@ -324,8 +494,33 @@ def get_revenue_data(
     rc_data_queryset = rc_data_queryset.filter(
         data_period=data_filter.data_period)
 
-    for geo in geo_queryset:
-        for obj in rc_data_queryset.filter(geography=geo, indicator__is_visible=True):
+    return (
+        rc_data_queryset.filter(
+            geography__code__in=geo_filter.code, indicator__is_visible=True
+        )
+        .select_related(
+            "geography", "geography__parentId", "indicator", "indicator__unit"
+        )
+        .order_by("geography_id", "indicator__display_order", "indicator_id")
+    )
+
+
+def revenue_view_geographies(geo_filter: types.GeoFilter):
+    """The geographies `revenue_data_queryset` selects the data of."""
+    return Geography.objects.filter(code__in=geo_filter.code)
+
+
+def build_revenue_data(
+        rows, indc_filter: types.IndicatorFilter, ranks: Optional[dict] = None
+) -> list[dict]:
+    data_list = []
+    for geo_rows in group_by_geography(rows):
+        geography_id = geo_rows[0].geography_id
+        if ranks is not None and geography_id not in ranks:
+            continue
+        data_dict = {}
+        selected = None
+        for obj in geo_rows:
             data_dict["type"] = obj.geography.type.lower()
             data_dict[obj.geography.type.lower().replace(" ", "-")
                       ] = obj.geography.name
@@ -339,37 +534,23 @@ def get_revenue_data(
                 data_dict[(parent.type.lower() + " code").lower().replace(" ", "-")] = (
                     parent.code
                 )
-            if obj.indicator.unit:
-                unit = obj.indicator.unit.name
-                data_dict[obj.indicator.slug] = {
-                    "value": str(obj.value) + " " + unit,
-                    "title": obj.indicator.name,
-                }
-            else:
-                data_dict[obj.indicator.slug] = {
-                    "value": str(obj.value),
-                    "title": obj.indicator.name,
-                }
-        if data_dict:
-            data_list.append(data_dict)
-            data_dict = {}
-
-    data_list = sorted(
-        data_list,
-        key=lambda d: float(d[indc_filter.slug]["value"].split()[0]),
-        reverse=True,
-    )
+            data_dict[obj.indicator.slug] = format_indicator_value(obj)
+            if obj.indicator.slug == indc_filter.slug:
+                selected = obj.value
+        if ranks is not None:
+            data_dict["rank"], data_dict["percentile"] = ranks[geography_id]
+        data_list.append((selected, data_dict))
 
-    print("The time difference is :", timeit.default_timer() - starttime)
-    return data_list
+    return sort_by_selected_value(data_list)
 
 
-def get_revenue_map_data(
+def get_revenue_data(
         indc_filter: types.IndicatorFilter,
         data_filter: types.DataFilter,
         geo_filter: Optional[types.GeoFilter] = None,
-) -> dict:
-    """Retrieve revenue-circle map data based on specified filters.
+        rank_filter: Optional[types.RankFilter] = None,
+) -> list[dict]:
+    """Retrieve revenue circle-specific data based on specified filters.
 
     Args:
         indc_filter (types.IndicatorFilter): An IndicatorFilter object used
@@ -377,15 +558,45 @@ def get_revenue_map_data(
         data_filter (types.DataFilter): An DataFilter object used
         to filter data based on defined fields from types.py.
         geo_filter (types.GeoFilter, optional): An GeoFilter object used
-        IMP: The code sent is statecode
         to filter data based on defined fields from types.py. Defaults to None.
+        rank_filter (types.RankFilter, optional): Add each region's rank and
+        percentile (see layer/ranking.py), keeping only the topK/bottomK
+        regions when set. Defaults to None.
 
     Returns:
-        dict: A GeoJSON-like dictionary representing revenue circle features with
-        associated indicator data.
+        list[dict]: A list containing dictionary of revenue circles
+            mapping each to it's relevant data fields.
     """
-    starttime = timeit.default_timer()
+    ranks = None
+    if rank_filter:
+        ranks = ranking.rank_regions(
+            revenue_view_geographies(geo_filter), indc_filter, data_filter, rank_filter
+        )
+    # Ranked views are built in Python from the kept regions' rows.
+    elif DATA_ENGINE == "sql":
+        return sql.revenue_data_json(
+            revenue_data_queryset(indc_filter, data_filter, geo_filter), indc_filter
+        )
+    cube = get_cube()
+    if cube:
+        rows = cube.revenue_data_rows(indc_filter, data_filter, geo_filter)
+    elif DATA_ENGINE == "region":
+        rows = region_data.expand_region_rows(
+            only_ranked(region_data.revenue_region_queryset(data_filter, geo_filter), ranks),
+            region_data.slug_or_child(indc_filter.slug),
+        )
+    else:
+        rows = only_ranked(revenue_data_queryset(indc_filter, data_filter, geo_filter), ranks)
+    data_list = build_revenue_data(rows, indc_filter, ranks)
+    return data_list
+
 
+def revenue_map_querysets(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+):
+    """Return the (geography features, indicator data) querysets of the map."""
     # Convert geography objects to a GeoJson format.
     # try:
     #     geo_object = Geography.objects.get(code__in=geo_filter.code, type="STATE")
@@ -395,21 +606,19 @@ def get_revenue_map_data(
     #         geo_type = "REVENUE CIRCLE"
     # except Geography.DoesNotExist:
     #     raise GraphQLError("Invalid state code!!")
-
-    geo_json = json.loads(
-        serialize(
-            "geojson",
-            Geography.objects.filter(
-                parentId__parentId__code__in=geo_filter.code
-            ),
-        )
+    geo_rows = feature_collection_queryset(
+        Geography.objects.filter(parentId__parentId__code__in=geo_filter.code)
     )
-
     rc_data = Data.objects.filter(
         indicator__slug=indc_filter.slug,
         data_period=data_filter.data_period,
         geography__parentId__parentId__code__in=geo_filter.code,
-    ).select_related("geography")
+    ).select_related("geography", "geography__parentId", "indicator")
+    return geo_rows, rc_data
+
+
+def build_revenue_map_data(geo_rows, rc_data) -> dict:
+    geo_json = build_feature_collection(geo_rows)
 
     # Create a dictionary to store indicator data by geography code
     rc_data_map = {data.geography.code: data for data in rc_data}
@@ -435,16 +644,15 @@ def get_revenue_map_data(
         rc["properties"].pop("pk", None)
         rc.pop("id", None)
 
-    print("The time difference is :", timeit.default_timer() - starttime)
     return geo_json
 
 
-def get_district_map_data(
+def get_revenue_map_data(
         indc_filter: types.IndicatorFilter,
         data_filter: types.DataFilter,
         geo_filter: Optional[types.GeoFilter] = None,
 ) -> dict:
-    """Retrieve district map data based on specified filters.
+    """Retrieve revenue-circle map data based on specified filters.
 
     Args:
         indc_filter (types.IndicatorFilter): An IndicatorFilter object used
@@ -452,45 +660,58 @@ def get_district_map_data(
         data_filter (types.DataFilter): An DataFilter object used
         to filter data based on defined fields from types.py.
         geo_filter (types.GeoFilter, optional): An GeoFilter object used
+        IMP: The code sent is statecode
         to filter data based on defined fields from types.py. Defaults to None.
 
     Returns:
-        dict: A GeoJSON-like dictionary representing district features with
+        dict: A GeoJSON-like dictionary representing revenue circle features with
         associated indicator data.
     """
-    starttime = timeit.default_timer()
+    geo_rows, rc_data = revenue_map_querysets(indc_filter, data_filter, geo_filter)
+    if DATA_ENGINE == "sql":
+        return sql.revenue_map_json(geo_rows, rc_data)
+    cube = get_cube()
+    if cube:
+        rc_data = cube.revenue_map_rows(indc_filter, data_filter, geo_filter)
+    geo_json = build_revenue_map_data(geo_rows, rc_data)
+    return geo_json
 
-    # Convert geography objects to a GeoJson format.
-    geo_json = json.loads(
-        serialize(
-            "geojson",
-            Geography.objects.filter(
-                type="DISTRICT", parentId__code__in=geo_filter.code
-            ),
-        )
-    )
 
+def district_map_querysets(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+):
+    """Return the (geography features, indicator data) querysets of the map."""
+    geo_rows = feature_collection_queryset(
+        Geography.objects.filter(type="DISTRICT", parentId__code__in=geo_filter.code),
+        with_bounds=True,
+    )
     # Get Indicator Data for each district.
     district_data = Data.objects.filter(
         indicator__slug=indc_filter.slug,
         data_period=data_filter.data_period,
         geography__type="DISTRICT",
         geography__parentId__code__in=geo_filter.code,
-    ).select_related("geography")
+    ).select_related("geography", "indicator")
+    return geo_rows, district_data
+
+
+def build_district_map_data(geo_rows, district_data) -> dict:
+    geo_json = build_feature_collection(geo_rows, with_bounds=True)
 
     # Create a dictionary to store indicator data by geography code
     district_data_map = {data.geography.code: data for data in district_data}
 
     # Iterate over GeoJSON features and populate with indicator data
     for district in geo_json["features"]:
+        bounds = district.pop("bounds")
         district_code = district["properties"]["code"]
         if district_code in district_data_map:
             data = district_data_map[district_code]
 
             # Add bounding box of district
-            poly = geojson.Polygon(district["geometry"]["coordinates"])
-            district["properties"]["bounds"] = bounding_box(
-                list(geojson.utils.coords(poly)))
+            district["properties"]["bounds"] = bounds
 
             # Add indicator slug and value to properties
             district["properties"][data.indicator.slug] = data.value
@@ -500,34 +721,41 @@ def get_district_map_data(
             district["properties"].pop("pk", None)
             district.pop("id", None)
 
-    print("The time difference is :", timeit.default_timer() - starttime)
     return geo_json
 
 
-def get_indicators(indc_filter: Optional[types.IndicatorFilter] = None, state_code: Optional[int] = None) -> list:
-    """
-    Retrieve a list of indicators and associated data from the 'indicator' table.
-
-    This function fetches indicators from the database, optionally filtered by the provided
-    IndicatorFilter. It returns a list of dictionaries containing details about each indicator.
+def get_district_map_data(
+        indc_filter: types.IndicatorFilter,
+        data_filter: types.DataFilter,
+        geo_filter: Optional[types.GeoFilter] = None,
+) -> dict:
+    """Retrieve district map data based on specified filters.
 
     Args:
-        indc_filter (Optional[types.IndicatorFilter]): An optional IndicatorFilter object used
-            to filter indicators based on defined fields from types.py. If provided, the function
-            will filter indicators by slug or parent slug. Defaults to None.
-        state_code (int): An integer representing the state code. Defaults to 18.
+        indc_filter (types.IndicatorFilter): An IndicatorFilter object used
+        to filter data based on defined fields from types.py.
+        data_filter (types.DataFilter): An DataFilter object used
+        to filter data based on defined fields from types.py.
+        geo_filter (types.GeoFilter, optional): An GeoFilter object used
+        to filter data based on defined fields from types.py. Defaults to None.
 
     Returns:
-        list: A list of dictionaries, where each dictionary represents an indicator and contains
-            the following keys: 'name', 'slug', 'long_description', 'short_description', 
-            'data_source', and 'unit__name'.
-
-    Note:
-        The function also prints the execution time, which might be useful for performance monitoring.
+        dict: A GeoJSON-like dictionary representing district features with
+        associated indicator data.
     """
-    start_time = timeit.default_timer()
-    data_list = []
+    geo_rows, district_data = district_map_querysets(
+        indc_filter, data_filter, geo_filter
+    )
+    if DATA_ENGINE == "sql":
+        return sql.district_map_json(geo_rows, district_data)
+    cube = get_cube()
+    if cube:
+        district_data = cube.district_map_rows(indc_filter, data_filter, geo_filter)
+    geo_json = build_district_map_data(geo_rows, district_data)
+    return geo_json
 
+
+def indicators_queryset(indc_filter: Optional[types.IndicatorFilter] = None, state_code: Optional[int] = None):
     indcators = Indicators.objects.filter(is_visible=True)
     if state_code:
         indcators = indcators.filter(geography__code=state_code)
@@ -536,13 +764,30 @@ def get_indicators(indc_filter: Optional[types.IndicatorFilter] = None, state_co
             Q(slug=indc_filter.slug) | Q(parent__slug=indc_filter.slug)
         )
 
-    data_queryset = indcators.values(
+    return indcators.values(
         "name", "slug", "long_description", "short_description", "data_source", "unit__name"
     )
-    for data in data_queryset:
-        data_list.append(data)
 
-    print("The time difference is :", timeit.default_timer() - start_time)
+
+def get_indicators(indc_filter: Optional[types.IndicatorFilter] = None, state_code: Optional[int] = None) -> list:
+    """
+    Retrieve a list of indicators and associated data from the 'indicator' table.
+
+    This function fetches indicators from the database, optionally filtered by the provided
+    IndicatorFilter. It returns a list of dictionaries containing details about each indicator.
+
+    Args:
+        indc_filter (Optional[types.IndicatorFilter]): An optional IndicatorFilter object used
+            to filter indicators based on defined fields from types.py. If provided, the function
+            will filter indicators by slug or parent slug. Defaults to None.
+        state_code (int): An integer representing the state code. Defaults to 18.
+
+    Returns:
+        list: A list of dictionaries, where each dictionary represents an indicator and contains
+            the following keys: 'name', 'slug', 'long_description', 'short_description',
+            'data_source', and 'unit__name'.
+    """
+    data_list = list(indicators_queryset(indc_filter, state_code))
     return data_list
 
 
@@ -558,98 +803,162 @@ def get_indicators(indc_filter: Optional[types.IndicatorFilter] = None, state_co
 #     return data_list
 
 
-def get_timeperiod():
+def timeperiod_queryset():
     # Use annotation to create a custom field for sorting
-    data = (
+    return (
         Data.objects.values_list("data_period", flat=True)
         .annotate(custom_ordering=F("data_period"))
         .distinct()
         .order_by("-custom_ordering")
     )
 
+
+def get_timeperiod():
     # Create CustomDataPeriodList objects directly in the query
-    time_list = [types.CustomDataPeriodList(value=time) for time in data]
+    time_list = [types.CustomDataPeriodList(value=time) for time in timeperiod_queryset()]
     # for time in data:
     #     time_list.append({"value":time})
 
     return time_list
 
 
-def get_district_rev_circle(geo_filter: types.GeoFilter):
-    starttime = timeit.default_timer()
-    data_dict = {}
-    data_list = []
-
+def district_rev_circle_queryset(geo_filter: types.GeoFilter):
+    geo_type = geo_filter.type.upper().strip().replace("-", " ")
     if geo_filter.type.upper() == "DISTRICT":
-        geo_object = Geography.objects.filter(
-            type=geo_filter.type.upper().strip().replace("-", " "),
+        return Geography.objects.filter(
+            type=geo_type,
             parentId__code__in=geo_filter.code,
+        ).order_by("id")
+    elif geo_type in ["REVENUE CIRCLE", "TEHSIL", "BLOCK"]:
+        return (
+            Geography.objects.filter(type=geo_type)
+            .select_related("parentId")
+            .order_by("id")
         )
-        for data in geo_object:
-            data_list.append(
-                {
-                    f"{data.type.lower().replace(' ', '-')}": data.name,
-                    "code": data.code,
-                }
-            )
-        data_dict = data_list
-    elif geo_filter.type.upper().strip().replace("-", " ") in [
-        "REVENUE CIRCLE",
-        "TEHSIL",
-        "BLOCK"
-    ]:
-        geo_object = Geography.objects.filter(
-            type=geo_filter.type.upper().strip().replace("-", " ")
-        )
-        for data in geo_object:
-            rc_obj = geo_object.filter(parentId=data.parentId)
-            if rc_obj.exists():
-                for rc_data in rc_obj:
-                    data_list.append(
-                        {
-                            f"{data.type}": rc_data.name,
-                            "code": rc_data.code,
-                            "district_code": data.parentId.code,
-                        }
-                    )
-                data_dict[f"{data.parentId.name}"] = data_list
-                data_list = []
-
-    print("The time difference is :", timeit.default_timer() - starttime)
+    return Geography.objects.none()
+
+
+def build_district_rev_circle(geo_rows, geo_filter: types.GeoFilter):
+    if geo_filter.type.upper() == "DISTRICT":
+        return [
+            {
+                f"{data.type.lower().replace(' ', '-')}": data.name,
+                "code": data.code,
+            }
+            for data in geo_rows
+        ]
+
+    # Sub-district geographies grouped under their district's name.
+    siblings = {}
+    for data in geo_rows:
+        siblings.setdefault(data.parentId_id, []).append(data)
+
+    data_dict = {}
+    for rc_obj in siblings.values():
+        parent = rc_obj[0].parentId
+        data_dict[f"{parent.name}"] = [
+            {
+                f"{rc_data.type}": rc_data.name,
+                "code": rc_data.code,
+                "district_code": parent.code,
+            }
+            for rc_data in rc_obj
+        ]
+    return data_dict
+
+
+def get_district_rev_circle(geo_filter: types.GeoFilter):
+    geo_rows = district_rev_circle_queryset(geo_filter)
+    data_dict = build_district_rev_circle(geo_rows, geo_filter)
     return data_dict
 
 
+def child_indicators_queryset():
+    return Indicators.objects.filter(is_visible=True).values(
+        "id", "slug", "name", "long_description", "parent_id", "geography__code"
+    )
+
+
+def build_child_indicators(indicator_rows, parent_id: Optional[int] = None, state_code: Optional[str] = None) -> typing.List:
+    """Nest visible indicators under their parents, starting at `parent_id`.
+
+    As before, the state filter only applies to the first level; children
+    belong to their parent's state anyway.
+    """
+    children = {}
+    for indicator in indicator_rows:
+        children.setdefault(indicator["parent_id"], []).append(indicator)
+
+    def nest(indicator_id, state=None):
+        return [
+            {"slug": indicator["slug"], "name": indicator["name"], "description": indicator["long_description"],
+             "children": nest(indicator["id"])}
+            for indicator in children.get(indicator_id, [])
+            if not state or indicator["geography__code"] == str(state)
+        ]
+
+    return nest(parent_id, state_code)
+
+
 def get_child_indicators(parent_id: Optional[int] = None, state_code: Optional[str] = None) -> typing.List:
-    indicator_list = []
-    indicators = Indicators.objects.filter(
-        parent__id=parent_id, is_visible=True)
-    if state_code:
-        indicators = indicators.filter(geography__code=state_code)
-    for indicator in indicators:
-        indicator_list.append(
-            {"slug": indicator.slug, "name": indicator.name, "description": indicator.long_description,
-             "children": get_child_indicators(indicator.id)})
-    return indicator_list
+    return build_child_indicators(child_indicators_queryset(), parent_id, state_code)
 
 
-def get_states():
+def states_queryset():
     # TODO: Remove this temporary restriction and move this to env flag
-    all_states = Geography.objects.filter(type="STATE", code='18')
+    return Geography.objects.filter(type="STATE", code='18')
+
+
+def state_child_type_queryset(state):
+    return Geography.objects.filter(parentId__parentId__code=state.code)
+
+
+def state_geometry_queryset(state):
+    return Geography.objects.filter(
+        parentId=state).annotate(valid_geom=MakeValid("geom"))
+
+
+def build_state_details(state, child_type, state_geometry) -> dict:
+    state_details = {"name": state.name, "slug": state.slug, "code": state.code,
+                     "child_type": child_type}
+    state_centroid = state_geometry.centroid if state_geometry else None
+    state_details["center"] = (state_centroid.y, state_centroid.x)
+    state_details["resource_id"] = DATA_RESOURCE_MAP[state.code]
+    return state_details
+
+
+def get_states():
     states = []
-    for state in all_states:
-        state_details = {"name": state.name, "slug": state.slug, "code": state.code,
-                         "child_type": Geography.objects.filter(parentId__parentId__code=state.code).first().type}
-        valid_geometries = Geography.objects.filter(
-            parentId=state).annotate(valid_geom=MakeValid("geom"))
-        state_geometry = valid_geometries.aggregate(
+    for state in states_queryset():
+        child_type = state_child_type_queryset(state).first().type
+        state_geometry = state_geometry_queryset(state).aggregate(
             union_geometry=Union("valid_geom"))["union_geometry"]
-        state_centroid = state_geometry.centroid if state_geometry else None
-        state_details["center"] = (state_centroid.y, state_centroid.x)
-        state_details["resource_id"] = DATA_RESOURCE_MAP[state.code]
-        states.append(state_details)
+        states.append(build_state_details(state, child_type, state_geometry))
     return states
 
 
+def get_geographies_at(
+        points: list[types.PointInput],
+        data_filter: Optional[types.DataFilter] = None,
+        indc_filter: Optional[types.IndicatorFilter] = None,
+) -> dict:
+    """Resolve coordinates to the geographies containing them.
+
+    Args:
+        points (list[types.PointInput]): Coordinates to look up, one or
+        thousands at once.
+        data_filter (types.DataFilter, optional): Period of the indicator
+        values. Defaults to None.
+        indc_filter (types.IndicatorFilter, optional): Indicator whose
+        values (with its children's) are returned. Defaults to None.
+
+    Returns:
+        dict: For each point the chain of geography ids containing it, and
+        the details and indicator values of those geographies.
+    """
+    return lookup_points(points, data_filter, indc_filter)
+
+
 @strawberry.type
 class Query:  # camelCase
     indicators: JSON = strawberry_django.field(resolver=get_indicators)
@@ -672,12 +981,20 @@ class Query:  # camelCase
         resolver=get_district_rev_circle
     )
     getStates: JSON = strawberry_django.field(resolver=get_states)
+    cacheStats: JSON = strawberry_django.field(resolver=cache_stats)
+    geographiesAt: JSON = strawberry_django.field(resolver=get_geographies_at)
+
 
+schema_extensions = [
+    DjangoOptimizerExtension,
+    ResolverTracingExtension,
+    # Persisted queries repeat the same documents, skip re-parsing them.
+    ParserCache(maxsize=256),
+    ValidationCache(maxsize=256),
+]
 
 schema = strawberry.Schema(
     query=Query,
     # mutation=Mutation,
-    extensions=[
-        DjangoOptimizerExtension,
-    ],
+    extensions=schema_extensions,
 )
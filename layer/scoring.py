@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+"""
+
+Risk scores computed from the raw indicators with TOPSIS (Technique for
+Order of Preference by Similarity to Ideal Solution).
+
+For each factor in RISK_FACTORS, the closeness of every (geography, period)
+to the riskiest combination of the factor's inputs is computed, and the
+closeness values are binned by quantile into scores from 1 to 5. The
+`topsis-score` is the TOPSIS closeness over the four factor closeness
+values, and `risk-score` is its quantile bin.
+
+Geographies of different types (districts, revenue circles, ...) are scored
+separately, each across all their periods. An input's direction is 1 when
+a higher value means more risk and -1 when it means less. Inputs a state
+has no data for are left out.
+
+"""
+
+SCORE_BINS = 5
+
+RISK_FACTORS = {
+    "flood-hazard": {
+        "max-rain": 1,
+        "mean-rain": 1,
+        "inundation-intensity-mean-nonzero": 1,
+        "inundation-intensity-sum": 1,
+        "drainage-density": 1,
+    },
+    "exposure": {
+        "total-hhd": 1,
+        "sum-population": 1,
+        "health-centres-count": 1,
+        "schools-count": 1,
+        "rail-length": 1,
+        "road-length": 1,
+        "net-sown-area-in-hac": 1,
+        "mean-sex-ratio": 1,
+    },
+    "vulnerability": {
+        "avg-electricity": -1,
+        "rc-piped-hhds-pct": -1,
+        "tehsil-piped-hhds-pct": -1,
+        "rc-nosanitation-hhds-pct": 1,
+        "tehsil-nosanitation-hhds-pct": 1,
+        "sum-aged-population": 1,
+    },
+    # Less money spent on flood management means more risk.
+    "government-response": {
+        "total-tender-awarded-value": -1,
+        "sdrf-tenders-awarded-value": -1,
+        "relief-and-mitigation-sanction-value": -1,
+    },
+}
+
+TOPSIS_SCORE = "topsis-score"
+RISK_SCORE = "risk-score"
+
+
+def topsis(matrix: np.ndarray, directions: np.ndarray, weights=None) -> np.ndarray:
+    """Closeness of each row of a decision matrix to the ideal (riskiest) row.
+
+    Missing values are replaced by their column's mean; rows without any
+    value get NaN.
+
+    Args:
+        matrix (np.ndarray): One row per alternative, one column per criterion.
+        directions (np.ndarray): 1 for criteria where higher is riskier, -1
+        for the others.
+        weights (np.ndarray, optional): Weight of each criterion. Defaults to
+        equal weights.
+
+    Returns:
+        np.ndarray: Closeness between 0 and 1 per row.
+    """
+    n_rows, n_columns = matrix.shape
+    weights = np.full(n_columns, 1 / n_columns) if weights is None else np.asarray(weights)
+    missing = np.isnan(matrix)
+    empty = missing.all(axis=1)
+    counts = (~missing).sum(axis=0)
+    column_means = np.divide(
+        np.where(missing, 0, matrix).sum(axis=0), counts, out=np.zeros(n_columns), where=counts > 0
+    )
+    filled = np.where(missing, column_means, matrix)
+
+    norms = np.sqrt((filled ** 2).sum(axis=0))
+    norms[norms == 0] = 1
+    weighted = filled / norms * weights
+    ideal = np.where(directions > 0, weighted.max(axis=0), weighted.min(axis=0))
+    anti_ideal = np.where(directions > 0, weighted.min(axis=0), weighted.max(axis=0))
+    to_ideal = np.sqrt(((weighted - ideal) ** 2).sum(axis=1))
+    to_anti_ideal = np.sqrt(((weighted - anti_ideal) ** 2).sum(axis=1))
+    total = to_ideal + to_anti_ideal
+    closeness = np.divide(to_anti_ideal, total, out=np.full(n_rows, 0.5), where=total > 0)
+    closeness[empty] = np.nan
+    return closeness
+
+
+def quantile_bins(values: pd.Series, bins=SCORE_BINS) -> pd.Series:
+    """Bin values by quantile into scores from 1 to `bins`; ties get the same score."""
+    percentile = values.rank(method="max", pct=True)
+    return np.ceil(percentile * bins).clip(1, bins)
+
+
+def score_group(values: pd.DataFrame) -> pd.DataFrame:
+    """Compute the factor, topsis and risk scores of one geography type.
+
+    Args:
+        values (pd.DataFrame): Raw indicator values, one column per slug.
+
+    Returns:
+        pd.DataFrame: One column per score, with the index of `values`.
+    """
+    scores = pd.DataFrame(index=values.index)
+    closeness = {}
+    for factor, inputs in RISK_FACTORS.items():
+        columns = [slug for slug in inputs if slug in values.columns]
+        if not columns:
+            continue
+        directions = np.array([inputs[slug] for slug in columns])
+        closeness[factor] = pd.Series(
+            topsis(values[columns].to_numpy(dtype=float), directions), index=values.index
+        )
+        scores[factor] = quantile_bins(closeness[factor])
+    if closeness:
+        factors = pd.DataFrame(closeness)
+        scores[TOPSIS_SCORE] = topsis(
+            factors.to_numpy(), np.ones(len(factors.columns))
+        )
+        scores[RISK_SCORE] = quantile_bins(scores[TOPSIS_SCORE])
+    return scores
+
+
+def compute_scores(values: pd.DataFrame, geography_types: pd.Series) -> pd.DataFrame:
+    """Compute the risk scores of all geographies and periods.
+
+    Args:
+        values (pd.DataFrame): Raw indicator values indexed by
+        (geography_id, data_period), one column per slug.
+        geography_types (pd.Series): Type of each geography id.
+
+    Returns:
+        pd.DataFrame: One column per score, with the index of `values`.
+    """
+    group_types = geography_types.reindex(values.index.get_level_values("geography_id")).to_numpy()
+    return pd.concat(
+        [score_group(group) for _, group in values.groupby(group_types, sort=False)]
+    ).reindex(values.index)
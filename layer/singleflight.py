@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one execution per key at a time within a process.
+
+    Callers arriving while an execution for the same key is in flight wait for
+    it and receive its result instead of running the work again. Threads
+    (WSGI workers, Django's sync view executor) use `do`; coroutines running on
+    an event loop (ASGI) use `ado`.
+
+    If the leading call fails, or doesn't finish within `timeout` seconds,
+    waiting callers fall back to running the work themselves.
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+
+    def do(self, key, fn):
+        """Call `fn()` once for all concurrent callers with the same key.
+
+        Returns:
+            tuple: `(result, shared)` where `shared` is True for callers that
+            received the result of another caller's execution.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.timeout) and call.error is None:
+                return call.result, True
+            return fn(), False
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key, fn):
+        """Await `fn()` once for all concurrent coroutines with the same key.
+
+        Futures belong to an event loop, so in-flight calls are tracked per
+        running loop.
+
+        Returns:
+            tuple: `(result, shared)`, as for `do`.
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        future = self._futures.get(loop_key)
+
+        if future is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                return await fn(), False
+            except Exception:
+                return await fn(), False
+            return result, True
+
+        future = self._futures[loop_key] = loop.create_future()
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; mark the exception as retrieved.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._futures.pop(loop_key, None)
+        return result, False
@@ -0,0 +1,282 @@
+from typing import Optional
+
+from django.db import connection
+from django.db.models import F
+
+from . import types
+from layer.encoders import Fragment
+
+"""
+
+Database-side JSON assembly for the map and region table resolvers, used
+with DATA_ENGINE=sql. Each response is built by Postgres in one statement
+with json_build_object/json_agg/json_object_agg. The text is handed back
+as a `Fragment` that the response encoder copies into the output without
+ever parsing it in Python.
+
+The statements wrap the same querysets the Python resolvers in schema.py
+use, so both select the same rows, and they reproduce the `build_*`
+functions' output key for key. Features and regions come out ordered by
+geography id.
+
+"""
+
+# str() of a float as Python writes it: Postgres drops the ".0" of whole numbers.
+# Missing values (NULL or NaN) read "None", as in format_indicator_value.
+VALUE_TEXT = """(
+    CASE WHEN r.value IS NULL OR r.value = 'NaN' THEN 'None'
+         WHEN r.value::text ~ '^-?[0-9]+$' THEN r.value::text || '.0'
+         ELSE r.value::text END
+    || COALESCE(' ' || r.unit, '')
+)"""
+
+FEATURE_COLLECTION_SQL = """
+WITH geo AS ({geo_sql}),
+data AS (
+    SELECT DISTINCT ON (data_code) *
+    FROM ({data_sql}) d
+    ORDER BY data_code, data_id DESC
+)
+SELECT json_build_object(
+    'type', 'FeatureCollection',
+    'crs', json_build_object('type', 'name', 'properties', json_build_object('name', 'EPSG:4326')),
+    'features', COALESCE(json_agg({feature} ORDER BY geo.geo_id), '[]'::json)
+)::text
+FROM geo LEFT JOIN data ON data.data_code = geo.geo_code
+"""
+
+# Feature of a district without data, as build_feature_collection makes it.
+PLAIN_FEATURE = """json_build_object(
+    'type', 'Feature',
+    'id', geo.geo_id,
+    'properties', json_build_object(
+        'name', geo.geo_name, 'code', geo.geo_code, 'type', geo.geo_type,
+        'parentId', geo.geo_parent, 'slug', geo.geo_slug, 'pk', geo.geo_id::text
+    ),
+    'geometry', geo.geometry::json
+)"""
+
+# Imports store NaN for empty cells; json_build_object would write it as the
+# string "NaN", the other engines write null.
+DISTRICT_FEATURE = """CASE WHEN data.data_code IS NULL THEN {plain} ELSE json_build_object(
+    'type', 'Feature',
+    'properties', json_build_object(
+        'name', geo.geo_name, 'code', geo.geo_code, 'type', geo.geo_type, 'slug', geo.geo_slug,
+        'bounds', json_build_array(
+            json_build_array(geo."YMin", geo."XMin"), json_build_array(geo."YMax", geo."XMax")
+        ),
+        data.data_slug, NULLIF(data.data_value, 'NaN')
+    ),
+    'geometry', geo.geometry::json
+) END""".format(plain=PLAIN_FEATURE)
+
+REVENUE_FEATURE = """json_build_object(
+    'type', 'Feature',
+    'properties', CASE WHEN data.data_code IS NULL THEN json_build_object(
+        'name', geo.geo_name, 'code', geo.geo_code, 'type', geo.geo_type, 'slug', geo.geo_slug
+    ) ELSE json_build_object(
+        'name', geo.geo_name, 'code', geo.geo_code, 'type', geo.geo_type, 'slug', geo.geo_slug,
+        replace(lower(data.parent_type), ' ', '-') || '-code', data.parent_code,
+        data.data_slug, NULLIF(data.data_value, 'NaN')
+    ) END,
+    'geometry', geo.geometry::json
+)"""
+
+# Regions as lists of dicts: the header keys (`ord` 1 to n) come first and
+# then the indicator values in display order (`ord` 10), except that the
+# `selected` indicator gets `ord` 0 when it should lead.
+REGION_TABLE_SQL = """
+WITH r AS ({rows_sql}),
+header AS (
+    SELECT r.geography_id, h.ord, h.key, h.value
+    FROM (SELECT DISTINCT ON (geography_id) * FROM r ORDER BY geography_id) r
+    CROSS JOIN LATERAL (VALUES {header}) AS h(ord, key, value)
+    WHERE h.key IS NOT NULL
+),
+entries AS (
+    SELECT geography_id, ord, 0 AS display_order, 0 AS indicator_id, key, value
+    FROM header
+    UNION ALL
+    SELECT
+        r.geography_id,
+        CASE WHEN r.slug = %s THEN 0 ELSE 10 END,
+        r.display_order,
+        r.indicator_id,
+        r.slug,
+        json_build_object('value', {value_text}, 'title', r.title)
+    FROM r
+),
+regions AS (
+    SELECT geography_id, json_object_agg(key, value ORDER BY ord, display_order, indicator_id) AS region
+    FROM entries
+    GROUP BY geography_id
+),
+sort AS (
+    SELECT
+        geography_id,
+        bool_and(geo_type <> 'DISTRICT') AS not_district,
+        max(value) FILTER (WHERE slug = %s AND value <> 'NaN') AS selected_value
+    FROM r
+    GROUP BY geography_id
+)
+SELECT COALESCE(json_agg(regions.region ORDER BY {order}), '[]'::json)::text
+FROM regions JOIN sort USING (geography_id)
+"""
+
+TYPE_KEY = "replace(lower(r.geo_type), ' ', '-')"
+PARENT_TYPE_KEY = "replace(lower(r.parent_type), ' ', '-')"
+
+TABLE_HEADER = [
+    ("'type'", "r.geo_type"),
+    ("'region-name'", "r.geo_name"),
+    (f"{TYPE_KEY} || '-code'", "r.geo_code"),
+]
+
+DISTRICT_HEADER = [
+    ("lower(r.geo_type)", "r.geo_name"),
+    (f"{TYPE_KEY} || '-code'", "r.geo_code"),
+]
+
+REVENUE_HEADER = [
+    ("'type'", "lower(r.geo_type)"),
+    (TYPE_KEY, "r.geo_name"),
+    (f"{TYPE_KEY} || '-code'", "r.geo_code"),
+    ("CASE WHEN r.parent_type IS NOT NULL THEN 'parent_type' END", "lower(r.parent_type)"),
+    (PARENT_TYPE_KEY, "r.parent_name"),
+    (f"{PARENT_TYPE_KEY} || '-code'", "r.parent_code"),
+]
+
+BY_DISTRICT_FIRST = "sort.not_district, regions.geography_id"
+BY_SELECTED_VALUE = "sort.selected_value DESC NULLS LAST, regions.geography_id"
+
+
+def fetch_json(sql, params) -> Fragment:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return Fragment(cursor.fetchone()[0])
+
+
+def feature_collection_json(geo_rows, data_rows, feature, with_bounds=False) -> Fragment:
+    """Join `feature_collection_queryset` rows with one data row per code.
+
+    Args:
+        geo_rows (QuerySet): Rows of `feature_collection_queryset`.
+        data_rows (QuerySet): `Data` rows of the features, with
+        `data_code`, `data_slug` and `data_value` (and `parent_type` and
+        `parent_code` for revenue circles) selected.
+        feature (str): SQL expression building one feature.
+        with_bounds (bool): Whether `geo_rows` selects the bounding box.
+    """
+    geo_sql, geo_params = geo_rows.values(
+        "geometry",
+        *(["XMin", "YMin", "XMax", "YMax"] if with_bounds else []),
+        geo_id=F("id"),
+        geo_name=F("name"),
+        geo_code=F("code"),
+        geo_type=F("type"),
+        geo_parent=F("parentId"),
+        geo_slug=F("slug"),
+    ).query.sql_with_params()
+    data_sql, data_params = data_rows.query.sql_with_params()
+    sql = FEATURE_COLLECTION_SQL.format(geo_sql=geo_sql, data_sql=data_sql, feature=feature)
+    return fetch_json(sql, (*geo_params, *data_params))
+
+
+def district_map_json(geo_rows, district_data) -> Fragment:
+    """`build_district_map_data` in SQL, for the querysets of `district_map_querysets`."""
+    data_rows = district_data.values(
+        data_id=F("id"),
+        data_code=F("geography__code"),
+        data_slug=F("indicator__slug"),
+        data_value=F("value"),
+    )
+    return feature_collection_json(geo_rows, data_rows, DISTRICT_FEATURE, with_bounds=True)
+
+
+def revenue_map_json(geo_rows, rc_data) -> Fragment:
+    """`build_revenue_map_data` in SQL, for the querysets of `revenue_map_querysets`."""
+    data_rows = rc_data.values(
+        data_id=F("id"),
+        data_code=F("geography__code"),
+        data_slug=F("indicator__slug"),
+        data_value=F("value"),
+        parent_type=F("geography__parentId__type"),
+        parent_code=F("geography__parentId__code"),
+    )
+    return feature_collection_json(geo_rows, data_rows, REVENUE_FEATURE)
+
+
+def region_table_json(
+        data_queryset,
+        header,
+        order,
+        selected: Optional[str] = None,
+        lead_with_selected: bool = False,
+        with_parent: bool = False,
+) -> Fragment:
+    """Build a list of one dict per region from `Data` rows.
+
+    Args:
+        data_queryset (QuerySet): The `Data` rows to include.
+        header (list[tuple]): `(key, value)` SQL expressions of the keys
+        written before the indicator values.
+        order (str): SQL ORDER BY of the regions.
+        selected (str, optional): Slug of the requested indicator.
+        lead_with_selected (bool): Put the selected indicator first.
+        with_parent (bool): Select the parent geography for the header.
+    """
+    parent_columns = {
+        "parent_type": F("geography__parentId__type"),
+        "parent_name": F("geography__parentId__name"),
+        "parent_code": F("geography__parentId__code"),
+    } if with_parent else {}
+    rows_sql, rows_params = data_queryset.values(
+        "geography_id",
+        "indicator_id",
+        "value",
+        geo_type=F("geography__type"),
+        geo_name=F("geography__name"),
+        geo_code=F("geography__code"),
+        slug=F("indicator__slug"),
+        title=F("indicator__name"),
+        unit=F("indicator__unit__name"),
+        display_order=F("indicator__display_order"),
+        **parent_columns,
+    ).query.sql_with_params()
+    header_sql = ", ".join(
+        f"({i}, {key}, to_json({value}))" for i, (key, value) in enumerate(header, 1)
+    )
+    sql = REGION_TABLE_SQL.format(
+        rows_sql=rows_sql, header=header_sql, value_text=VALUE_TEXT, order=order
+    )
+    params = (*rows_params, selected if lead_with_selected else None, selected)
+    return fetch_json(sql, params)
+
+
+def table_data_json(data_queryset, indc_filter: Optional[types.IndicatorFilter] = None) -> Fragment:
+    """`build_table_data` in SQL, for the rows of `table_data_queryset`."""
+    return region_table_json(
+        data_queryset,
+        TABLE_HEADER,
+        BY_DISTRICT_FIRST,
+        selected=indc_filter.slug if indc_filter else None,
+        lead_with_selected=True,
+    )
+
+
+def district_data_json(data_queryset, indc_filter: types.IndicatorFilter) -> Fragment:
+    """`build_district_data` in SQL, for the rows of `district_data_queryset`."""
+    return region_table_json(
+        data_queryset, DISTRICT_HEADER, BY_SELECTED_VALUE, selected=indc_filter.slug
+    )
+
+
+def revenue_data_json(data_queryset, indc_filter: types.IndicatorFilter) -> Fragment:
+    """`build_revenue_data` in SQL, for the rows of `revenue_data_queryset`."""
+    return region_table_json(
+        data_queryset,
+        REVENUE_HEADER,
+        BY_SELECTED_VALUE,
+        selected=indc_filter.slug,
+        with_parent=True,
+    )
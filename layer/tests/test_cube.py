@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from layer.cube import Cube
+from layer.models import Data, Geography, Indicators
+from layer.schema import build_district_data, format_indicator_value
+
+"""
+
+The cube must read like the ORM, whatever DATA_ENGINE is set to.
+
+"""
+
+PERIOD = "2024_08"
+
+
+class MissingValueTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        np.save(os.path.join(self.dir, "values.npy"), np.full((1, 1, 1), np.nan))
+        np.save(os.path.join(self.dir, "present.npy"), np.ones((1, 1, 1), dtype=bool))
+        meta = {
+            "geographies": [
+                {"id": 1, "name": "Kamrup", "code": "301", "type": "DISTRICT",
+                 "slug": "kamrup", "parentId_id": None},
+            ],
+            "indicators": [
+                {"id": 1, "name": "Risk Score", "slug": "risk-score", "unit__name": None,
+                 "parent_id": None, "is_visible": True, "display_order": 1},
+            ],
+            "periods": [PERIOD],
+        }
+        with open(os.path.join(self.dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def orm_rows(self):
+        geography = Geography(id=1, name="Kamrup", code="301", type="DISTRICT")
+        indicator = Indicators(id=1, name="Risk Score", slug="risk-score")
+        # Imports store NaN for empty cells.
+        return [Data(value=float("nan"), geography=geography, indicator=indicator,
+                     data_period=PERIOD)]
+
+    def cube_rows(self):
+        cube = Cube(self.dir)
+        selection = np.ones(1, dtype=bool)
+        return cube.rows(selection, selection, selection)
+
+    def test_nan_value_formats_like_the_orm(self):
+        orm_value = format_indicator_value(self.orm_rows()[0])
+        cube_value = format_indicator_value(self.cube_rows()[0])
+        self.assertEqual(orm_value, cube_value)
+        self.assertEqual(cube_value["value"], "None")
+
+    def test_nan_value_district_data_matches_the_orm(self):
+        indc_filter = SimpleNamespace(slug="risk-score")
+        self.assertEqual(
+            build_district_data(self.orm_rows(), indc_filter),
+            build_district_data(self.cube_rows(), indc_filter),
+        )
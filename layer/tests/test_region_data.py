@@ -0,0 +1,34 @@
+import json
+
+from django.test import SimpleTestCase
+
+from layer.models import Data, Geography, Indicators, Unit
+from layer.region_data import region_entry
+
+"""
+
+Region rows are stored as jsonb, which has no NaN.
+
+"""
+
+
+class RegionEntryTest(SimpleTestCase):
+    def entry(self, value):
+        parent = Indicators(id=1, name="Risk Score", slug="risk-score")
+        indicator = Indicators(
+            id=2, name="Flood Hazard", slug="flood-hazard", parent=parent, unit=Unit(name="score")
+        )
+        geography = Geography(id=1, name="Kamrup", code="301", type="DISTRICT")
+        return region_entry(Data(value=value, geography=geography, indicator=indicator))
+
+    def test_nan_value_is_stored_as_null(self):
+        entry = self.entry(float("nan"))
+        self.assertIsNone(entry["value"])
+        json.dumps(entry, allow_nan=False)
+
+    def test_value_is_kept(self):
+        entry = self.entry(2.0)
+        self.assertEqual(entry["value"], 2.0)
+        self.assertEqual(entry["unit"], "score")
+        self.assertEqual(entry["parent"], "risk-score")
+        self.assertTrue(entry["top"])
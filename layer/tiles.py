@@ -0,0 +1,186 @@
+import math
+import os
+import re
+import shutil
+import uuid
+from typing import Optional
+
+from django.contrib.gis.db.models import Extent
+from django.db import connection
+
+from D4D_ContextLayer.settings import TILES
+from layer.models import Data, Geography, Indicators
+
+"""
+
+Mapbox Vector Tiles of the geographies, rendered by PostGIS (ST_AsMVT) and
+kept in a disk cache under TILES["DIR"]:
+
+    <layer>/<indicator or "-">/<period>/<z>/<x>/<y>.mvt
+
+Each feature carries the geography's id, name, code, type and parent code,
+plus the `value` of the requested indicator for the period when one is
+given. import_data clears the cache, and seed_tiles fills it ahead of
+time.
+
+"""
+
+# Tile layers and the geography types they contain.
+TILE_LAYERS = {
+    "state": ["STATE", "UT"],
+    "district": ["DISTRICT"],
+    "subdistrict": ["REVENUE CIRCLE", "TEHSIL", "BLOCK", "SUB DISTRICT"],
+    "village": ["VILLAGE"],
+}
+
+SLUG_RE = re.compile(r"^[-\w]+$")
+PERIOD_RE = re.compile(r"^\d{4}_\d{2}$")
+
+TILE_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+),
+features AS (
+    SELECT
+        ST_AsMVTGeom(ST_Transform(g.geom, 3857), bounds.geom, %(extent)s, %(buffer)s) AS geom,
+        g.id,
+        g.name,
+        g.code,
+        g.type,
+        parent.code AS parent_code,
+        overlay.value
+    FROM {geography} g
+    CROSS JOIN bounds
+    LEFT JOIN {geography} parent ON parent.id = g."parentId_id"
+    LEFT JOIN LATERAL (
+        SELECT d.value
+        FROM {data} d
+        JOIN {indicators} i ON i.id = d.indicator_id
+        WHERE d.geography_id = g.id AND i.slug = %(indicator)s AND d.data_period = %(period)s
+        ORDER BY d.id DESC
+        LIMIT 1
+    ) overlay ON %(indicator)s IS NOT NULL
+    WHERE g.type = ANY(%(types)s)
+      AND g.geom && ST_Transform(bounds.geom, 4326)
+)
+SELECT ST_AsMVT(features.*, %(layer)s, %(extent)s, 'geom')
+FROM features
+WHERE features.geom IS NOT NULL
+""".format(
+    geography=Geography._meta.db_table,
+    data=Data._meta.db_table,
+    indicators=Indicators._meta.db_table,
+)
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= TILES["MAX_ZOOM"] and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_path(layer, z, x, y, indicator, period) -> str:
+    return os.path.join(
+        TILES["DIR"], layer, indicator or "-", period or "-", str(z), str(x), f"{y}.mvt"
+    )
+
+
+def render_tile(layer, z, x, y, indicator=None, period=None) -> bytes:
+    """Render one tile of a layer with PostGIS.
+
+    Args:
+        layer (str): A key of TILE_LAYERS.
+        z (int), x (int), y (int): Tile coordinates (XYZ scheme).
+        indicator (str, optional): Slug of the indicator whose value is added
+        to the features. Defaults to None.
+        period (str, optional): Data period of the indicator values.
+
+    Returns:
+        bytes: The tile, empty if no geography intersects it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            TILE_SQL,
+            {
+                "z": z,
+                "x": x,
+                "y": y,
+                "extent": TILES["EXTENT"],
+                "buffer": TILES["BUFFER"],
+                "types": TILE_LAYERS[layer],
+                "indicator": indicator,
+                "period": period,
+                "layer": layer,
+            },
+        )
+        return bytes(cursor.fetchone()[0] or b"")
+
+
+def has_overlay_data(indicator, period) -> bool:
+    """Whether the indicator has values for the period."""
+    return Data.objects.filter(indicator__slug=indicator, data_period=period).exists()
+
+
+def get_tile(layer, z, x, y, indicator=None, period=None) -> tuple[bytes, bool]:
+    """Return a tile from the disk cache, rendering and storing it if missing.
+
+    Overlays of indicators or periods without data are rendered but not
+    stored, so requests for made-up slugs and periods can't fill the disk.
+
+    Returns:
+        tuple: The tile and whether it came from the cache.
+    """
+    path = tile_path(layer, z, x, y, indicator, period)
+    try:
+        with open(path, "rb") as f:
+            return f.read(), True
+    except FileNotFoundError:
+        pass
+
+    tile = render_tile(layer, z, x, y, indicator, period)
+    if indicator and not has_overlay_data(indicator, period):
+        return tile, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a partial tile.
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tile)
+    os.replace(tmp_path, path)
+    return tile, False
+
+
+def clear_tile_cache():
+    """Remove all cached tiles, e.g. after the data changed."""
+    if not os.path.isdir(TILES["DIR"]):
+        return
+    # Move the cache out of the way first so requests start a fresh one.
+    old_dir = f"{TILES['DIR'].rstrip(os.sep)}.old-{uuid.uuid4().hex}"
+    os.rename(TILES["DIR"], old_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def tile_range(bbox, z: int):
+    """Tile x and y ranges covering a (xmin, ymin, xmax, ymax) lon/lat box."""
+
+    def tile_xy(lon, lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        n = 2 ** z
+        x = int((lon + 180) / 360 * n)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    xmin, ymin, xmax, ymax = bbox
+    x0, y0 = tile_xy(xmin, ymax)
+    x1, y1 = tile_xy(xmax, ymin)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def layer_extent(layer, state_code: Optional[str] = None):
+    """Lon/lat bounding box of a layer's geographies, or of a state's districts.
+
+    Returns:
+        tuple | None: (xmin, ymin, xmax, ymax), None if there are no geometries.
+    """
+    if state_code:
+        geographies = Geography.objects.filter(type="DISTRICT", parentId__code=state_code)
+    else:
+        geographies = Geography.objects.filter(type__in=TILE_LAYERS[layer])
+    return geographies.aggregate(extent=Extent("geom"))["extent"]
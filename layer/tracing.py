@@ -0,0 +1,168 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from inspect import isawaitable
+
+from strawberry.extensions import SchemaExtension
+
+from D4D_ContextLayer.settings import GRAPHQL_TRACING
+from layer.metrics import (
+    GRAPHQL_FIELD_DB_SECONDS,
+    GRAPHQL_FIELD_QUERIES,
+    GRAPHQL_FIELD_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Stats of the resolver currently running in this context, if it is traced.
+current_stats = ContextVar("current_stats", default=None)
+
+
+class ResolverStats:
+    """Query stats of a resolver or request.
+
+    Stats nest: queries are also added to the `parent` stats, e.g. the
+    request being profiled around a traced resolver. With
+    `capture_statements` the statements themselves are kept as well.
+    """
+
+    def __init__(self, field_name, parent=None, capture_statements=False):
+        self.field_name = field_name
+        self.parent = parent
+        self.wall_time = 0.0
+        self.db_time = 0.0
+        self.query_count = 0
+        self.statements = [] if capture_statements else None
+
+    def as_dict(self):
+        return {
+            "field": self.field_name,
+            "wallMs": round(self.wall_time * 1000, 3),
+            "dbMs": round(self.db_time * 1000, 3),
+            "queries": self.query_count,
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding the query to the running resolver's stats."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        while stats is not None:
+            stats.db_time += duration
+            stats.query_count += 1
+            if stats.statements is not None:
+                stats.statements.append((sql, params, duration))
+            stats = stats.parent
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """`connection_created` receiver adding `record_query` to new connections."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def track_queries(name, capture_statements=False):
+    """Collect the time and count of the queries run inside the `with` block.
+
+    Also works around async code, e.g. a whole /report request.
+    """
+    stats = ResolverStats(name, current_stats.get(), capture_statements)
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+def is_requested(request) -> bool:
+    """Whether the client asked for tracing data in the response."""
+    return bool(request.headers.get(GRAPHQL_TRACING["HEADER"]))
+
+
+class ResolverTracingExtension(SchemaExtension):
+    """
+    Record wall time, database time and query count of each top level field.
+
+    The numbers are added to the response under `extensions.tracing` when the
+    tracing header is sent, and logged otherwise. They are also recorded in
+    the /metrics histograms. Queries are attributed to
+    the field whose resolver issued them, including queries run by async
+    resolvers on sync_to_async threads, since the stats live in a context
+    variable.
+    """
+
+    def on_operation(self):
+        self.resolvers = []
+        self.start = time.perf_counter()
+        self.end = None
+        yield
+        self.end = time.perf_counter()
+        for stats in self.resolvers:
+            GRAPHQL_FIELD_SECONDS.observe(stats.wall_time, field=stats.field_name)
+            GRAPHQL_FIELD_DB_SECONDS.observe(stats.db_time, field=stats.field_name)
+            GRAPHQL_FIELD_QUERIES.inc(stats.query_count, field=stats.field_name)
+        if not self.include_in_response():
+            self.log()
+
+    def include_in_response(self) -> bool:
+        request = getattr(self.execution_context.context, "request", None)
+        return request is not None and is_requested(request)
+
+    def log(self):
+        for stats in self.resolvers:
+            logger.info(
+                "graphql.resolver field=%s wall_ms=%.3f db_ms=%.3f queries=%d",
+                stats.field_name,
+                stats.wall_time * 1000,
+                stats.db_time * 1000,
+                stats.query_count,
+                extra={"tracing": stats.as_dict()},
+            )
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        # Nested fields only read attributes of the root field's result.
+        if info.path.prev is not None:
+            return _next(root, info, *args, **kwargs)
+
+        stats = ResolverStats(info.field_name, current_stats.get())
+        self.resolvers.append(stats)
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            result = _next(root, info, *args, **kwargs)
+        finally:
+            stats.wall_time = time.perf_counter() - start
+            current_stats.reset(token)
+
+        if isawaitable(result):
+            return self.await_resolver(result, stats)
+        return result
+
+    async def await_resolver(self, result, stats):
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            return await result
+        finally:
+            stats.wall_time += time.perf_counter() - start
+            current_stats.reset(token)
+
+    def get_results(self):
+        if not self.include_in_response():
+            return {}
+        # Requests failing to parse or validate get their results early.
+        duration = (self.end or time.perf_counter()) - self.start
+        return {
+            "tracing": {
+                "durationMs": round(duration * 1000, 3),
+                "resolvers": [stats.as_dict() for stats in self.resolvers],
+            }
+        }
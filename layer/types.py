@@ -118,3 +118,16 @@ class Data:
 @strawberry.type
 class CustomDataPeriodList:
     value: str
+
+
+@strawberry.input
+class RankFilter:
+    # Keep only the topK highest and/or bottomK lowest ranked regions.
+    top_k: Optional[int] = None
+    bottom_k: Optional[int] = None
+
+
+@strawberry.input
+class PointInput:
+    lat: float
+    lon: float
@@ -8,7 +8,7 @@ from unicodedata import category
 from django.http.response import async_to_sync
 import httpx
 from asgiref.sync import sync_to_async
-from django.db.models import Q, F, Sum
+from django.db.models import Q, F
 from django.http import HttpResponse
 from reportlab.lib import colors
 from reportlab.lib.colors import HexColor, Color
@@ -21,14 +21,24 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak, ListFlowable, ListItem
 
-from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD, CHART_API_BASE_URL, DATA_RESOURCE_MAP
+from D4D_ContextLayer.settings import DEFAULT_TIME_PERIOD, CHART_API_BASE_URL, DATA_RESOURCE_MAP, METRICS, TILES
+from layer.metrics import (
+    REPORT_CHARTS_FETCHED,
+    REPORT_SECONDS,
+    REPORT_SECTION_SECONDS,
+    render as render_metrics,
+)
 from layer.models import Data, Geography, Indicators
+from layer.tiles import PERIOD_RE, SLUG_RE, TILE_LAYERS, get_tile, is_valid_tile
+from layer.tracing import track_queries
 
 from collections import defaultdict
 
-# roads, bridge, embankments-affected
+# infrastructure-damaged and total-tender-awarded-value-fy-total are derived
+# at import time (see layer.derived).
 month_highlight_table_indicators = ["inundation-pct", "sum-population", "human-live-lost",
-                                    "population-affected-total", "crop-area", "total-animal-affected", "roads", "bridge", "embankments-affected"]
+                                    "population-affected-total", "crop-area", "total-animal-affected",
+                                    "infrastructure-damaged", "total-tender-awarded-value-fy-total"]
 chart_colors = ['#89672A', '#3B8F44', '#C41C8D', '#FB4E93', '#7B4DD9']
 
 
@@ -156,17 +166,21 @@ async def fetch_chart(client, chart_payload, resource_id):
     output_path = f"layer/assets/charts/{Faker().file_name(extension='png')}"
     try:
         timeout = httpx.Timeout(10.0, read=None)
-        response = await client.post(f"{CHART_API_BASE_URL}{resource_id}/?response_type=file", json=chart_payload, timeout=timeout)
+        with REPORT_SECTION_SECONDS.time(section="chart_fetch"):
+            response = await client.post(f"{CHART_API_BASE_URL}{resource_id}/?response_type=file", json=chart_payload, timeout=timeout)
         if response.status_code == 200:
             with open(output_path, "wb") as f:
                 f.write(response.content)
+            REPORT_CHARTS_FETCHED.inc(status="ok")
             return output_path
         else:
             print(
                 f"Failed to fetch chart:::::::::::::::: {response.status_code}, {response.text}")
+            REPORT_CHARTS_FETCHED.inc(status="failed")
             return None
     except Exception as e:
         print(f"Error fetching chart: {e}")
+        REPORT_CHARTS_FETCHED.inc(status="error")
         return None
 
 
@@ -265,38 +279,6 @@ async def get_major_indicators_data(time_period, geo_filter):
     return sorted_result
 
 
-def generate_financial_year_months(time_period):
-    # Parse the input time_period
-    year, month = map(int, time_period.split('_'))
-
-    # Determine the financial year start and end
-    if month <= 3:  # Financial year starts in April
-        start_year = year - 1
-        end_year = year
-    else:
-        start_year = year
-        end_year = year + 1
-
-    # Generate months for the financial year
-    financial_year_months = []
-    for m in range(4, 13):  # From April (4) to December (12)
-        financial_year_months.append(f"{start_year}_{m:02d}")
-    for m in range(1, 4):  # From January (1) to March (3) of the next year
-        financial_year_months.append(f"{end_year}_{m:02d}")
-
-    return financial_year_months
-
-
-async def get_cumulative_value_for_financial_year(time_period, indicator, district):
-    # generate current financial year months given time_period in yyyy_mm
-    time_period_months = await sync_to_async(
-        generate_financial_year_months)(time_period)
-
-    data_value = await sync_to_async(Data.objects.filter)(geography=district, indicator__slug=indicator, data_period__in=time_period_months)
-    data_value = await sync_to_async(data_value.aggregate)(Sum('value'))
-    return data_value['value__sum']
-
-
 async def get_district_highlights(time_period, geo_filter):
 
     districts = await get_top_vulnerable_districts(time_period, geo_filter)
@@ -314,19 +296,6 @@ async def get_district_highlights(time_period, geo_filter):
 
     data = await group_by_geography(data, month_highlight_table_indicators)
 
-    # add roads, bridge and embankments affected to create a new property infrastructure damaged
-    for district in data:
-        district['indicators']['infrastructure-damaged'] = district['indicators']['roads'] + \
-            district['indicators']['bridge'] + \
-            district['indicators']['embankments-affected']
-
-        district["indicators"].pop('roads')
-        district["indicators"].pop('bridge')
-        district["indicators"].pop('embankments-affected')
-
-        # fetch the total-tender-awarded-value for the current financial year
-        district['indicators']['total-tender-awarded-value'] = await get_cumulative_value_for_financial_year(time_period, 'total-tender-awarded-value', district['geography'])
-
     sorted_result = []
     for dist in districts:
         for item in data:
@@ -336,6 +305,17 @@ async def get_district_highlights(time_period, geo_filter):
     return sorted_result
 
 
+async def get_state_highlights(time_period, state):
+    """The state's values of the month highlight indicators, rolled up from its districts (see layer.rollup)."""
+    data = await sync_to_async(list)(
+        Data.objects.filter(
+            geography=state, indicator__slug__in=month_highlight_table_indicators, data_period=time_period
+        ).select_related("geography", "indicator")
+    )
+    data = await group_by_geography(data, month_highlight_table_indicators)
+    return data[0] if data else None
+
+
 async def generate_pdf(doc, elements):
     """
     Generate the PDF in a thread-safe way using sync_to_async.
@@ -584,6 +564,16 @@ async def cleanup_temp_files():
 
 
 async def generate_report(request):
+    if request.method != "GET":
+        return await build_report(request)
+
+    with REPORT_SECONDS.time(), track_queries("report") as query_stats:
+        response = await build_report(request)
+    REPORT_SECTION_SECONDS.observe(query_stats.db_time, section="db")
+    return response
+
+
+async def build_report(request):
     if request.method == "GET":
         # Prepare PDF buffer and styles
         pdf_buffer = BytesIO()
@@ -708,10 +698,13 @@ async def generate_report(request):
             b.append(Paragraph(header_value, table_header_style))
         district_table_data = [b]
         # district_table_data = [a]
+        state_highlights = await get_state_highlights(time_period, state)
+        if state_highlights:
+            data_obj = data_obj + [state_highlights]
         for data in data_obj:
             values = [Paragraph(str(int(data['indicators'][indicator]) if data['indicators'][indicator] != 'NA' else 'NA'), table_body_style)
                       for indicator in ["inundation-pct", "sum-population", "human-live-lost",
-                                        "population-affected-total", "crop-area", "infrastructure-damaged", "total-animal-affected",  "total-tender-awarded-value"]]
+                                        "population-affected-total", "crop-area", "infrastructure-damaged", "total-animal-affected",  "total-tender-awarded-value-fy-total"]]
             row = [Paragraph(data['geography'].name,
                              table_body_style)] + values
             district_table_data.append(row)
@@ -776,7 +769,8 @@ async def generate_report(request):
         # Sections done until here
 
         # Generate PDF
-        doc.build(elements)
+        with REPORT_SECTION_SECONDS.time(section="pdf_build"):
+            doc.build(elements)
         pdf_buffer.seek(0)
 
         # Generate PDF to test while development
@@ -1101,3 +1095,32 @@ def append_data_sources_section(elements):
         )
     )
     return elements
+
+
+def metrics(request):
+    """Serve the metrics of this process in the Prometheus text format."""
+    if not METRICS["ENABLED"]:
+        return HttpResponse(status=404)
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def tile(request, layer, z, x, y):
+    """Serve a Mapbox Vector Tile of a geography layer.
+
+    Query params `indicator` (slug) and `period` add the indicator's value
+    for the period (default: DEFAULT_TIME_PERIOD) to the features.
+    """
+    indicator = request.GET.get("indicator") or None
+    period = request.GET.get("period") or DEFAULT_TIME_PERIOD
+    if layer not in TILE_LAYERS or not is_valid_tile(z, x, y):
+        return HttpResponse(status=404)
+    if (indicator and not SLUG_RE.match(indicator)) or not PERIOD_RE.match(period):
+        return HttpResponse("Invalid indicator or period", status=400)
+
+    content, cached = get_tile(layer, z, x, y, indicator, period if indicator else None)
+    response = HttpResponse(content, content_type="application/vnd.mapbox-vector-tile")
+    response["Cache-Control"] = f"public, max-age={TILES['MAX_AGE']}"
+    response["X-Tile-Cache"] = "HIT" if cached else "MISS"
+    return response